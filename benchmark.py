@@ -0,0 +1,432 @@
+import argparse
+import contextlib
+import io
+import json
+import math as m
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+from PIL import Image
+
+import label_tool
+import list_view
+import shape
+
+# label file name used for the synthetic labels of image i
+IMAGE_NAME = 'img_{0:05d}'
+
+
+# writes n_images noise images and label files with n_shapes shapes of n_vertices vertices each.
+# the same seed always gives the same dataset
+def make_dataset(root, n_images=200, size=(1280, 960), n_shapes=50, n_vertices=12, seed=0):
+    rng = np.random.RandomState(seed)
+    image_dir = os.path.join(root, 'images')
+    label_dir = os.path.join(root, 'labels')
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(label_dir, exist_ok=True)
+    width, height = size
+    # label coordinates are image pixels times LABEL_SCALE
+    lw, lh = width * shape.LABEL_SCALE, height * shape.LABEL_SCALE
+    for i in range(n_images):
+        name = IMAGE_NAME.format(i)
+        pixels = rng.randint(0, 256, (height // 8, width // 8, 3)).astype(np.uint8)
+        Image.fromarray(pixels).resize(size, Image.BILINEAR).save(os.path.join(image_dir, name + '.jpg'), quality=90)
+        lines = ['%d' % n_shapes]
+        for k in range(n_shapes):
+            xc, yc = rng.uniform(0.1, 0.9) * lw, rng.uniform(0.1, 0.9) * lh
+            r = rng.uniform(0.01, 0.05) * min(lw, lh)
+            if k % 5 == 3:
+                lines.append('CIRC %d %d %d' % (xc, yc, r))
+            elif k % 5 == 4:
+                lines.append('RECT %d %d %d %d %.2f' % (xc, yc, 2 * r, r, rng.uniform(0, 180)))
+            else:
+                t = np.sort(rng.uniform(0, 2 * m.pi, n_vertices))
+                radius = r * rng.uniform(0.6, 1.0, n_vertices)
+                pts = np.stack([xc + radius * np.cos(t), yc + radius * np.sin(t)], axis=1).astype(int)
+                lines.append('POLY ' + ' '.join(str(c) for c in pts.ravel()))
+        with open(os.path.join(label_dir, name + '.txt'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    return image_dir, label_dir
+
+
+# ------------------------- a display free stand-in for tkinter -------------------------
+
+class FakeLoop(object):
+
+    # collects after() callbacks so the benchmark decides when they run
+    def __init__(self):
+        self.callbacks = {}
+        self.next_id = 0
+
+    def after(self, ms, func=None, *args):
+        self.next_id += 1
+        self.callbacks[self.next_id] = (func, args)
+        return self.next_id
+
+    def after_cancel(self, after_id):
+        self.callbacks.pop(after_id, None)
+
+    def run_pending(self):
+        callbacks = list(self.callbacks.values())
+        self.callbacks.clear()
+        for func, args in callbacks:
+            func(*args)
+        return len(callbacks)
+
+
+class FakeWidget(object):
+
+    # accepts every widget call; methods the tool only uses for layout or looks do nothing
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+    def after(self, ms, func=None, *args):
+        return LOOP.after(ms, func, *args)
+
+    def after_cancel(self, after_id):
+        LOOP.after_cancel(after_id)
+
+
+class FakeEntry(FakeWidget):
+
+    def __init__(self, *args, **kwargs):
+        self.text = ''
+
+    def insert(self, index, value):
+        self.text = self.text[:index] + value + self.text[index:]
+
+    def get(self):
+        return self.text
+
+
+class FakeListbox(FakeWidget):
+
+    def __init__(self, *args, **kwargs):
+        self.items = []
+        self.selection = set()
+
+    def insert(self, index, value):
+        self.items.insert(len(self.items) if index == 'end' else index, value)
+
+    def delete(self, first, last=None):
+        if last is None:
+            del self.items[first]
+        else:
+            del self.items[first:None if last == 'end' else last + 1]
+
+    def selection_set(self, index):
+        self.selection.add(index)
+
+    def selection_clear(self, first, last=None):
+        self.selection.clear()
+
+    def curselection(self):
+        return tuple(sorted(self.selection))
+
+
+class FakeCanvas(FakeWidget):
+
+    # keeps the items with their coordinates and options like a canvas would
+    def __init__(self, *args, **kwargs):
+        self.canvas_items = {}
+        self.next_id = 0
+        self.calls = 0
+
+    def create(self, kind, coords, options):
+        self.calls += 1
+        self.next_id += 1
+        self.canvas_items[self.next_id] = [kind, list(coords), dict(options)]
+        return self.next_id
+
+    def __getattr__(self, name):
+        if name.startswith('create_'):
+            return lambda *coords, **options: self.create(name[len('create_'):], coords, options)
+        return FakeWidget.__getattr__(self, name)
+
+    def coords(self, item, *coords):
+        self.calls += 1
+        self.canvas_items[item][1] = list(coords)
+
+    def itemconfig(self, item, **options):
+        self.calls += 1
+        self.canvas_items[item][2].update(options)
+
+    def delete(self, item):
+        self.calls += 1
+        self.canvas_items.pop(item, None)
+
+    def find_all(self):
+        return tuple(self.canvas_items)
+
+
+class FakeStringVar(object):
+
+    def __init__(self, *args, **kwargs):
+        self.value = ''
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class FakePhotoImage(object):
+
+    # keeps the pixels alive like Tk does, without converting them
+    def __init__(self, img):
+        img.load()
+        self.img = img
+
+    def width(self):
+        return self.img.size[0]
+
+    def height(self):
+        return self.img.size[1]
+
+
+LOOP = FakeLoop()
+FAKE_TK = types.SimpleNamespace(
+    Tk=FakeWidget, Frame=FakeWidget, Label=FakeWidget, Button=FakeWidget, OptionMenu=FakeWidget, Scrollbar=FakeWidget,
+    Entry=FakeEntry, Listbox=FakeListbox, Canvas=FakeCanvas, StringVar=FakeStringVar,
+    END='end', N='n', S='s', E='e', W='w', NW='nw', BOTH='both', LEFT='left', RIGHT='right', FALSE=False,
+    VERTICAL='vertical', Y='y')
+FAKE_IMAGETK = types.SimpleNamespace(PhotoImage=FakePhotoImage)
+
+
+# ------------------------------------- benchmarks -------------------------------------
+
+def summarize(times):
+    times = sorted(times)
+    n = len(times)
+    if not n:
+        return {'count': 0}
+    return {'count': n,
+            'mean_ms': 1000 * sum(times) / n,
+            'p50_ms': 1000 * times[int(0.50 * (n - 1))],
+            'p95_ms': 1000 * times[int(0.95 * (n - 1))],
+            'p99_ms': 1000 * times[int(0.99 * (n - 1))],
+            'max_ms': 1000 * times[-1]}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+class Bench(object):
+
+    # drives a LabelTool through its real code paths. with use_tk a real Tk is used (e.g. under
+    # xvfb-run), otherwise the canvas and widgets are replaced by the fakes above
+    def __init__(self, image_dir, label_dir, use_tk=False, seed=0, lazy_load=False):
+        self.image_dir = image_dir
+        self.label_dir = label_dir
+        self.rng = random.Random(seed)
+        self.use_tk = use_tk
+        # load_dirs asks for the label directory first, so the first image is loaded with its labels
+        dirs = iter([label_dir, image_dir])
+        label_tool.askdirectory = lambda: next(dirs)
+        if use_tk:
+            import tkinter
+            self.root = tkinter.Tk()
+        else:
+            label_tool.tk = FAKE_TK
+            list_view.tk = FAKE_TK
+            label_tool.ImageTk = FAKE_IMAGETK
+            self.root = FakeWidget()
+        self.tool = label_tool.LabelTool(self.root, lazy_load=lazy_load)
+        self.results = {}
+
+    def pump(self):
+        if self.use_tk:
+            self.root.update()
+        else:
+            LOOP.run_pending()
+
+    def event(self, x, y):
+        return types.SimpleNamespace(x=x, y=y, num=0, delta=0)
+
+    # canvas position of shape idx
+    def shape_pos(self, idx):
+        shp = self.tool.shapeList[idx]
+        x, y = self.tool.viewport.to_canvas(shp.location[0], shp.location[1])
+        return int(round(x)), int(round(y))
+
+    def load_dirs(self):
+        start = time.perf_counter()
+        self.tool.load_out_dir()
+        self.tool.load_img_dir()
+        while self.tool.index_queue is not None:
+            if not self.pump():
+                time.sleep(0.001)
+        self.results['load_img_dir'] = summarize([time.perf_counter() - start])
+
+    def switch_images(self, n):
+        times = []
+        complete = []
+        for _ in range(n):
+            if self.tool.cur >= self.tool.total:
+                self.tool.cur = 0
+            start = time.perf_counter()
+            times.append(timed(self.tool.next_image))
+            self.pump()
+            # a lazily loaded image keeps drawing its shapes from the event loop
+            while self.tool.loading:
+                self.pump()
+            complete.append(time.perf_counter() - start)
+        self.results['load_image'] = summarize(times)
+        self.results['load_complete'] = summarize(complete)
+
+    def parse_labels(self, n):
+        names = sorted(name for name in os.listdir(self.label_dir) if name.endswith('.txt'))[:n]
+        texts = []
+        for name in names:
+            with open(os.path.join(self.label_dir, name)) as f:
+                texts.append(f.read())
+        self.results['parse_shape'] = summarize(
+            [timed(lambda t: [shape.parse_shape(line) for line in t.splitlines()[1:]], text) for text in texts])
+        self.results['collection_from_lines'] = summarize(
+            [timed(lambda t: shape.ShapeCollection.from_lines(t.splitlines()[1:]), text) for text in texts])
+
+    def hover(self, n):
+        vp = self.tool.viewport
+        times = []
+        for _ in range(n):
+            event = self.event(self.rng.randrange(vp.width), self.rng.randrange(vp.height))
+            times.append(timed(self.tool.mouse_move, event))
+        self.results['mouse_move_hover'] = summarize(times)
+
+    def drag(self, n_drags, steps):
+        click = []
+        move = []
+        release = []
+        for _ in range(n_drags):
+            idx = self.rng.randrange(len(self.tool.shapeList))
+            x, y = self.shape_pos(idx)
+            self.tool.selected_shape_idx = -1
+            click.append(timed(self.tool.mouse_click, self.event(x, y)))
+            for step in range(steps):
+                x += self.rng.choice((-2, -1, 1, 2))
+                y += self.rng.choice((-2, -1, 1, 2))
+                move.append(timed(self.tool.mouse_move, self.event(x, y)))
+            release.append(timed(self.tool.mouse_release, self.event(x, y)))
+            # deselect again so the next drag starts from the same state
+            self.tool.mouse_click(self.event(x, y))
+        self.results['mouse_click'] = summarize(click)
+        self.results['mouse_move_drag'] = summarize(move)
+        self.results['mouse_release'] = summarize(release)
+
+    def save(self, n):
+        submit = [timed(self.tool.save_image) for _ in range(n)]
+        self.results['save_image'] = summarize(submit)
+        self.results['writer_flush'] = summarize([timed(self.tool.writer.flush, True)])
+
+    def close(self):
+        self.tool.writer.close()
+        self.tool.prefetcher.shutdown()
+        self.tool.tile_pool.shutdown(wait=False)
+        if self.use_tk:
+            self.root.destroy()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='labeltool_bench_')
+    image_dir = os.path.join(data_dir, 'images')
+    label_dir = os.path.join(data_dir, 'labels')
+    params = {'images': args.images, 'size': args.size, 'shapes': args.shapes, 'vertices': args.vertices,
+              'seed': args.seed, 'tk': args.tk, 'lazy': args.lazy}
+    dataset = {key: params[key] for key in ('images', 'size', 'shapes', 'vertices', 'seed')}
+    dataset_file = os.path.join(data_dir, 'dataset.json')
+    if not os.path.isdir(image_dir):
+        print('writing synthetic dataset to ' + data_dir)
+        make_dataset(data_dir, args.images, tuple(args.size), args.shapes, args.vertices, args.seed)
+        with open(dataset_file, 'w') as f:
+            json.dump(dataset, f)
+    with open(dataset_file) as f:
+        if json.load(f) != dataset:
+            raise SystemExit('the dataset in %s was made with other parameters' % data_dir)
+    # the dataset is edited by the benchmark, labels are restored from a pristine copy each run
+    pristine = os.path.join(data_dir, 'labels.orig')
+    if not os.path.isdir(pristine):
+        os.rename(label_dir, pristine)
+    os.makedirs(label_dir, exist_ok=True)
+    for name in os.listdir(pristine):
+        with open(os.path.join(pristine, name)) as src, open(os.path.join(label_dir, name), 'w') as dst:
+            dst.write(src.read())
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        bench = Bench(image_dir, label_dir, use_tk=args.tk, seed=args.seed, lazy_load=args.lazy)
+        bench.load_dirs()
+        bench.switch_images(args.switches)
+        bench.parse_labels(args.switches)
+        bench.hover(args.moves)
+        bench.drag(args.drags, args.moves // max(args.drags, 1))
+        bench.save(args.saves)
+        bench.close()
+    return {'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'params': params,
+            'results': bench.results}
+
+
+def print_results(report, baseline=None):
+    print('commit %s' % report['commit'])
+    base = baseline['results'] if baseline else {}
+    for name, r in sorted(report['results'].items()):
+        line = '%-22s n=%-6d mean %9.3fms  p50 %9.3fms  p95 %9.3fms  p99 %9.3fms' % (
+            name, r['count'], r['mean_ms'], r['p50_ms'], r['p95_ms'], r['p99_ms'])
+        if name in base and base[name].get('p50_ms'):
+            line += '  p50 x%.2f vs %s' % (r['p50_ms'] / base[name]['p50_ms'], (baseline['commit'] or '?')[:8])
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='headless benchmark of the label tool interaction paths')
+    parser.add_argument('--data-dir', default=None, help='synthetic dataset location, reused if it exists')
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--size', type=int, nargs=2, default=[1280, 960], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--shapes', type=int, default=50, help='shapes per label file')
+    parser.add_argument('--vertices', type=int, default=12, help='vertices per polygon')
+    parser.add_argument('--switches', type=int, default=50, help='image switches timed')
+    parser.add_argument('--moves', type=int, default=2000, help='mouse moves timed for hovering and for dragging')
+    parser.add_argument('--drags', type=int, default=20)
+    parser.add_argument('--saves', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tk', action='store_true', help='use a real Tk display, e.g. under xvfb-run')
+    parser.add_argument('--lazy', action='store_true', help='load the shapes of every image lazily')
+    parser.add_argument('--output', default=None, help='write the results as json to this file')
+    parser.add_argument('--compare', default=None, help='json results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import math as m
+import os
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+from PIL import Image
+
+import shape
+from image_index import ImageIndex, label_key, legacy_label_key
+
+# output formats: 'rbox' is the xc yc w h theta format of the README, 'labels' rewrites normalized label files
+FORMATS = ('rbox', 'dota', 'yolo-obb', 'coco', 'labels')
+# category written for every shape, the label files carry no classes
+CATEGORY = 'object'
+# number of vertices used when a circle has to be written as a polygon
+CIRCLE_VERTICES = 16
+
+
+# parses one label file, returns the shapes that are valid and a list of problems found
+def read_label_file(path):
+    shapes = []
+    errors = []
+    with open(path) as f:
+        lines = f.read().splitlines()
+    if not lines:
+        return shapes, ['empty file']
+    for n, line in enumerate(lines[1:], 2):
+        split = line.split()
+        if not split:
+            continue
+        try:
+            if split[0] == 'POLY' and (len(split) % 2 == 0 or len(split) < 7):
+                raise ValueError('polygon needs at least 3 x y pairs')
+            if split[0] == 'CIRC' and (len(split) != 4 or int(split[3]) <= 0):
+                raise ValueError('circle needs x y and a positive radius')
+            if split[0] == 'RECT' and (len(split) != 6 or float(split[3]) <= 0 or float(split[4]) <= 0):
+                raise ValueError('rectangle needs x y, a positive width and height and an angle')
+            shapes.append(shape.parse_shape(' '.join(split)))
+        except (ValueError, RuntimeError) as e:
+            errors.append('line {0}: {1}'.format(n, e))
+    try:
+        if int(lines[0]) != len(shapes) + len(errors):
+            errors.append('header says {0} shapes, found {1}'.format(lines[0].strip(), len(shapes) + len(errors)))
+    except ValueError:
+        errors.append('bad header: ' + lines[0])
+    return shapes, errors
+
+
+# returns the outline of a shape as an (n, 2) float array
+def outline(shp):
+    if isinstance(shp, shape.Circle):
+        t = np.linspace(0, 2 * m.pi, CIRCLE_VERTICES, endpoint=False)
+        return np.stack([shp.location[0] + shp.radius * np.cos(t), shp.location[1] + shp.radius * np.sin(t)], axis=1)
+    if isinstance(shp, shape.RotatedRect):
+        return shp.get_corners()
+    return shp.points.astype(np.float64)
+
+
+# returns the rotated rectangles (xc, yc, w, h, theta) of shapes as a (n, 5) array.
+# the polygons of a file are fitted together in one vectorized batch
+def rotated_rects(shapes):
+    rects = np.zeros((len(shapes), 5))
+    polygons = []
+    for i, shp in enumerate(shapes):
+        if isinstance(shp, shape.Circle):
+            rects[i] = shp.location[0], shp.location[1], 2.0 * shp.radius, 2.0 * shp.radius, 0.0
+        elif isinstance(shp, shape.RotatedRect):
+            rects[i] = shp.location[0], shp.location[1], shp.width, shp.height, shp.theta
+        else:
+            polygons.append(i)
+    if polygons:
+        rects[polygons] = shape.fit_min_area_rects([shapes[i].points for i in polygons])
+    return rects
+
+
+def fmt(values):
+    return ' '.join('%.2f' % v for v in values)
+
+
+# converts one label file, run in the worker processes
+def convert_file(task):
+    label_path, image_path, out_format, scale = task
+    name = os.path.splitext(os.path.basename(label_path))[0]
+    result = {'name': name, 'image': image_path, 'errors': [], 'text': None, 'annotations': [], 'size': None}
+    try:
+        shapes, result['errors'] = read_label_file(label_path)
+    except (OSError, UnicodeDecodeError) as e:
+        result['errors'] = [str(e)]
+        return result
+    # normalized label files stay in label coordinates
+    if scale != 1 and out_format != 'labels':
+        shapes = [shp.scaled(scale) for shp in shapes]
+    if image_path:
+        try:
+            with Image.open(image_path) as img:
+                result['size'] = img.size
+        except OSError as e:
+            result['errors'].append(str(e))
+            if out_format == 'yolo-obb':
+                return result
+    elif out_format == 'yolo-obb':
+        result['errors'].append('no image found, cannot normalize coordinates')
+        return result
+
+    if out_format == 'labels':
+        result['text'] = '\n'.join(['%d' % len(shapes)] + [shp.to_parsable() for shp in shapes]) + '\n'
+    elif out_format == 'rbox':
+        result['text'] = '\n'.join(['%d' % len(shapes)] + [fmt(rect) for rect in rotated_rects(shapes)]) + '\n'
+    elif out_format == 'dota':
+        lines = [fmt(shape.rect_corners(*rect).ravel()) + ' ' + CATEGORY + ' 0' for rect in rotated_rects(shapes)]
+        result['text'] = ''.join(line + '\n' for line in lines)
+    elif out_format == 'yolo-obb':
+        width, height = result['size']
+        lines = []
+        for rect in rotated_rects(shapes):
+            corners = shape.rect_corners(*rect) / np.array([width, height])
+            lines.append('0 ' + ' '.join('%.6f' % v for v in np.clip(corners, 0, 1).ravel()))
+        result['text'] = ''.join(line + '\n' for line in lines)
+    elif out_format == 'coco':
+        for shp in shapes:
+            pts = outline(shp)
+            x0, y0 = pts.min(axis=0)
+            x1, y1 = pts.max(axis=0)
+            area = 0.5 * abs(np.dot(pts[:, 0], np.roll(pts[:, 1], 1)) - np.dot(pts[:, 1], np.roll(pts[:, 0], 1)))
+            result['annotations'].append({'segmentation': [np.round(pts.ravel(), 2).tolist()],
+                                          'bbox': [float(x0), float(y0), float(x1 - x0), float(y1 - y0)],
+                                          'area': float(area),
+                                          'category_id': 1,
+                                          'iscrowd': 0})
+    return result
+
+
+# maps label names (see image_index.label_key) to the paths of their images. label files saved
+# under the old names (see image_index.legacy_label_key) are matched too, unless a new name is the same
+def find_images(image_dir):
+    paths = ImageIndex(image_dir).scan()
+    images = {label_key(image_dir, path): path for path in paths}
+    for path in paths:
+        images.setdefault(legacy_label_key(path), path)
+    return images
+
+
+# converts every label file of out_dir on a process pool, writing results as they arrive.
+# returns the number of files with problems
+def convert(out_dir, output, out_format, image_dir=None, scale=1 / shape.LABEL_SCALE, jobs=None, validate_only=False):
+    images = find_images(image_dir) if image_dir else {}
+    if out_format in ('yolo-obb', 'coco') and not images and not validate_only:
+        raise SystemExit('--image-dir is required for ' + out_format)
+    with os.scandir(out_dir) as it:
+        labels = sorted(e.path for e in it if e.name.endswith('.txt') and e.is_file())
+    tasks = [(path, images.get(os.path.splitext(os.path.basename(path))[0]), out_format, scale) for path in labels]
+
+    coco = None
+    if not validate_only:
+        if out_format == 'coco':
+            coco = open(output, 'w')
+            coco.write('{"annotations": [\n')
+        else:
+            os.makedirs(output, exist_ok=True)
+    coco_images = []
+    ann_id = 0
+    bad = 0
+    with Pool(jobs or cpu_count()) as pool:
+        for i, result in enumerate(pool.imap(convert_file, tasks, chunksize=64)):
+            if result['errors']:
+                bad += 1
+                for error in result['errors']:
+                    print('{0}: {1}'.format(result['name'], error))
+            if validate_only:
+                continue
+            if coco:
+                width, height = result['size'] or (0, 0)
+                coco_images.append({'id': i + 1, 'file_name': os.path.basename(result['image'] or result['name']),
+                                    'width': width, 'height': height})
+                for ann in result['annotations']:
+                    ann_id += 1
+                    ann['id'] = ann_id
+                    ann['image_id'] = i + 1
+                    coco.write((',\n' if ann_id > 1 else '') + json.dumps(ann))
+            elif result['text'] is not None:
+                with open(os.path.join(output, result['name'] + '.txt'), 'w') as f:
+                    f.write(result['text'])
+    if coco:
+        coco.write('\n], "images": ' + json.dumps(coco_images) +
+                   ', "categories": [{"id": 1, "name": "' + CATEGORY + '"}]}\n')
+        coco.close()
+    print('%d label files processed, %d with problems' % (len(tasks), bad))
+    return bad
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='validate and convert label files without starting the GUI')
+    parser.add_argument('out_dir', help='directory of BBox_num + POLY/CIRC/RECT label files')
+    parser.add_argument('--format', choices=FORMATS, default='rbox')
+    parser.add_argument('--output', help='output directory, or output file for coco')
+    parser.add_argument('--image-dir', default=None, help='images of the labels, needed for yolo-obb and coco')
+    parser.add_argument('--scale', type=float, default=1 / shape.LABEL_SCALE,
+                        help='factor from label coordinates to output coordinates, defaults to original image pixels')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, defaults to all cores')
+    parser.add_argument('--validate-only', action='store_true', help='only report problems, write nothing')
+    args = parser.parse_args(argv)
+    if not args.validate_only and not args.output:
+        parser.error('--output is required unless --validate-only is given')
+    bad = convert(args.out_dir, args.output, args.format, args.image_dir, args.scale, args.jobs, args.validate_only)
+    raise SystemExit(1 if bad else 0)
+
+
+if __name__ == '__main__':
+    main()
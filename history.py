@@ -0,0 +1,183 @@
+import hashlib
+import os
+import threading
+
+import shape
+
+# number of edits that can be undone per image
+HISTORY_LIMIT = 1000
+# directory inside the label directory holding the edit journals
+JOURNAL_DIR_NAME = '.journal'
+
+# an edit is a small tuple describing a delta of the shape list:
+#   ('add', idx, shp)          shp inserted at idx
+#   ('delete', idx, shp)       the shape at idx, shp, removed
+#   ('move', idx, dx, dy)      the shape at idx moved by dx, dy
+#   ('clear', shapes)          all shapes removed
+#   ('restore', shapes)        shapes put back into an empty list
+
+
+# returns the edit undoing op
+def inverse(op):
+    kind = op[0]
+    if kind == 'add':
+        return ('delete', op[1], op[2])
+    if kind == 'delete':
+        return ('add', op[1], op[2])
+    if kind == 'move':
+        return ('move', op[1], -op[2], -op[3])
+    if kind == 'clear':
+        return ('restore', op[1])
+    return ('clear', op[1])
+
+
+def shape_text(shp, scale):
+    return (shp.scaled(scale) if scale != 1 else shp).to_parsable()
+
+
+# formats op as one journal line, coordinates multiplied by scale
+def format_op(op, scale=1):
+    kind = op[0]
+    if kind == 'add':
+        return 'add %d %s' % (op[1], shape_text(op[2], scale))
+    if kind == 'delete':
+        return 'delete %d' % op[1]
+    if kind == 'move':
+        return 'move %d %g %g' % (op[1], op[2] * scale, op[3] * scale)
+    if kind == 'clear':
+        return 'clear'
+    return 'restore ' + '|'.join(shape_text(shp, scale) for shp in op[1])
+
+
+# parses a journal line back into an edit, coordinates multiplied by scale.
+# deletions and clears do not carry their shapes, they are only replayed forwards
+def parse_op(line, scale=1):
+    kind, _, rest = line.partition(' ')
+    if kind == 'add':
+        idx, _, text = rest.partition(' ')
+        shp = shape.parse_shape(text)
+        return ('add', int(idx), shp.scaled(scale) if scale != 1 else shp)
+    if kind == 'delete':
+        return ('delete', int(rest), None)
+    if kind == 'move':
+        idx, dx, dy = rest.split()
+        return ('move', int(idx), int(round(float(dx) * scale)), int(round(float(dy) * scale)))
+    if kind == 'clear':
+        return ('clear', [])
+    if kind == 'restore':
+        shapes = [shape.parse_shape(text) for text in rest.split('|') if text]
+        return ('restore', [shp.scaled(scale) if scale != 1 else shp for shp in shapes])
+    raise RuntimeError('unknown edit: ' + kind)
+
+
+class History(object):
+
+    # undo and redo stacks of the edits of one image. each step moves one delta between the stacks
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.limit = limit
+        self.done = []
+        self.undone = []
+
+    def record(self, op):
+        self.done.append(op)
+        if len(self.done) > self.limit:
+            del self.done[0]
+        self.undone = []
+
+    # returns the edit that undoes the last one, or None
+    def undo(self):
+        if not self.done:
+            return None
+        op = self.done.pop()
+        self.undone.append(op)
+        return inverse(op)
+
+    # returns the edit to apply again, or None
+    def redo(self):
+        if not self.undone:
+            return None
+        op = self.undone.pop()
+        self.done.append(op)
+        return op
+
+    def clear(self):
+        self.done = []
+        self.undone = []
+
+
+def digest(text):
+    return hashlib.sha1((text or '').encode('utf-8')).hexdigest()[:16]
+
+
+class Journal(object):
+
+    # append-only log of the edits of every image whose latest labels are not on disk yet.
+    # a log starts with the digest of the labels it applies to and every edit carries the digest
+    # of the labels after it, so after a crash exactly the edits missing from the saved labels are
+    # replayed. a log is removed as soon as the labels of its last edit have been written
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.last = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, label_filename):
+        return os.path.join(self.directory, os.path.basename(label_filename) + '.log')
+
+    # appends an edit given as line; base_text are the labels before it and text the labels after it
+    def append(self, label_filename, line, base_text, text):
+        with self.lock:
+            path = self.path(label_filename)
+            with open(path, 'a') as f:
+                if label_filename not in self.last and f.tell() == 0:
+                    f.write('base\t%s\n' % digest(base_text))
+                f.write('%s\t%s\n' % (digest(text), line))
+            self.last[label_filename] = digest(text)
+
+    # drops the log of label_filename if text, just written, contains its last edit
+    def checkpoint(self, label_filename, text):
+        with self.lock:
+            if label_filename in self.last and self.last[label_filename] == digest(text):
+                del self.last[label_filename]
+                try:
+                    os.remove(self.path(label_filename))
+                except OSError:
+                    pass
+
+    def discard(self, label_filename):
+        with self.lock:
+            self.last.pop(label_filename, None)
+            try:
+                os.remove(self.path(label_filename))
+            except OSError:
+                pass
+
+    # returns the logged edit lines missing from text, the saved labels of label_filename
+    def recover(self, label_filename, text):
+        try:
+            with open(self.path(label_filename), 'rb+') as f:
+                data = f.read()
+                # an edit the tool stopped in the middle of writing is dropped, also from the file so
+                # that later edits are appended after the last complete one
+                end = data.rfind(b'\n') + 1
+                if end < len(data):
+                    f.truncate(end)
+        except OSError:
+            return []
+        lines = data[:end].decode('utf-8', 'replace').splitlines()
+        entries = [line.split('\t', 1) for line in lines if '\t' in line]
+        hashes = [entry[0] if i else entry[1] for i, entry in enumerate(entries)]
+        saved = digest(text)
+        if saved not in hashes:
+            print('discarding journal of {0}, the labels changed since'.format(label_filename))
+            self.discard(label_filename)
+            return []
+        start = len(hashes) - 1 - hashes[::-1].index(saved)
+        return [entry[1] for entry in entries[start + 1:]]
+
+    # returns a write function for LabelWriter that checkpoints after every successful write
+    def wrap(self, write):
+        def write_and_checkpoint(filename, text):
+            write(filename, text)
+            self.checkpoint(filename, text)
+        return write_and_checkpoint
@@ -0,0 +1,170 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# number of images decoded ahead of (and behind) the current one
+PREFETCH_AHEAD = 3
+# memory budget for decoded images kept in the cache, in bytes
+CACHE_BYTES = 512 * 1024 * 1024
+# number of background decoding threads
+PREFETCH_WORKERS = 2
+# images with more pixels are never decoded in the GUI process, see thumb_cache.load_overview
+LARGE_IMAGE_PIXELS = 1 << 25
+
+
+# decodes an image from disk straight to the display size given by scale.
+# JPEGs are decoded with DCT scaling (draft mode) so only a fraction of the pixels
+# is ever decompressed, other formats are box-reduced by an integer factor before the final resize
+def decode_image(path, scale=0.5):
+    img = Image.open(path)
+    width, height = img.size
+    size = (max(int(width * scale), 1), max(int(height * scale), 1))
+    if img.format == 'JPEG':
+        img.draft('RGB', size)
+    elif scale < 1 and hasattr(img, 'reduce') and img.mode in ('L', 'LA', 'RGB', 'RGBA', 'I', 'F'):
+        factor = int(1 / scale)
+        if factor > 1:
+            img = img.reduce(factor)
+    if img.size != size:
+        img = img.resize(size, Image.LANCZOS)
+    img.load()
+    return img
+
+
+# returns the approximate number of bytes held by a decoded image
+def image_bytes(img):
+    width, height = img.size
+    return width * height * len(img.getbands())
+
+
+class ImageCache(object):
+
+    # least recently used cache of decoded images, bounded by a byte budget
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.images = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            img = self.images.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.images.move_to_end(key)
+            return img
+
+    def put(self, key, img):
+        nbytes = image_bytes(img)
+        with self.lock:
+            if key in self.images:
+                self.size -= image_bytes(self.images.pop(key))
+            # never keep a single image larger than the whole budget
+            if nbytes > self.max_bytes:
+                return
+            self.images[key] = img
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, old = self.images.popitem(last=False)
+                self.size -= image_bytes(old)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.images
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.size = 0
+
+
+# returns whether an image is too large to decode in the GUI process: more than LARGE_IMAGE_PIXELS,
+# or more than PIL's limit, which only the worker processes raise
+def is_large_image(path):
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+    except Image.DecompressionBombError:
+        return True
+    return width * height > LARGE_IMAGE_PIXELS
+
+
+class ImagePrefetcher(object):
+
+    # decodes images on a thread pool ahead of navigation and keeps them in an ImageCache.
+    # only the PIL images are produced here, ImageTk objects must still be created on the Tk thread.
+    # prefetchable(path), if given, leaves out the images it returns False for
+    def __init__(self, loader=decode_image, ahead=PREFETCH_AHEAD, max_bytes=CACHE_BYTES, workers=PREFETCH_WORKERS,
+                 prefetchable=None):
+        self.loader = loader
+        self.prefetchable = prefetchable
+        self.ahead = ahead
+        self.cache = ImageCache(max_bytes)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    # returns the decoded image, waiting for an in-flight prefetch or decoding it synchronously
+    def get(self, path):
+        img = self.cache.get(path)
+        if img is not None:
+            return img
+        with self.lock:
+            future = self.pending.get(path)
+        if future is not None and not future.cancelled():
+            try:
+                return future.result()
+            except Exception:
+                pass
+        img = self.loader(path)
+        self.cache.put(path, img)
+        return img
+
+    # schedules decoding of the neighbours of position cur (0 based) in image_list
+    def prefetch_around(self, image_list, cur):
+        paths = []
+        for offset in range(1, self.ahead + 1):
+            for i in (cur + offset, cur - offset):
+                if 0 <= i < len(image_list):
+                    paths.append(image_list[i])
+        self.prefetch(paths)
+
+    # schedules decoding of the given paths, dropping queued work that is no longer wanted
+    def prefetch(self, paths):
+        wanted = set(paths)
+        with self.lock:
+            for path, future in list(self.pending.items()):
+                if path not in wanted and future.cancel():
+                    del self.pending[path]
+            for path in paths:
+                if path in self.pending or path in self.cache:
+                    continue
+                if self.prefetchable is not None and not self.prefetchable(path):
+                    continue
+                self.pending[path] = self.pool.submit(self._load, path)
+
+    def _load(self, path):
+        try:
+            img = self.loader(path)
+            self.cache.put(path, img)
+            return img
+        finally:
+            with self.lock:
+                self.pending.pop(path, None)
+
+    def clear(self):
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+        self.cache.clear()
+
+    def shutdown(self):
+        self.clear()
+        self.pool.shutdown(wait=False)
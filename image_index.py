@@ -0,0 +1,241 @@
+import bisect
+import json
+import os
+import re
+
+# image extensions picked up when indexing a directory
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+# file name of the persisted directory manifest
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+DIGITS = re.compile(r'(\d+)')
+
+
+# splits text into strings and integers so that 'img10' sorts after 'img9'
+def natural_key(text):
+    return [int(c) if c.isdigit() else c for c in DIGITS.split(text)]
+
+
+# returns the name the labels of the image at path are stored under: its path relative to root
+# without the extension, with '%' and the directory separators escaped so that images of the same
+# name in different sub directories get different label files. images directly in root keep their name
+def label_key(root, path):
+    rel = os.path.splitext(os.path.relpath(path, root))[0].replace(os.sep, '/')
+    return rel.replace('%', '%25').replace('/', '%2F')
+
+
+# returns the name labels were stored under before label_key: the file name up to its first '.',
+# whatever its directory. label directories written then are still read through it
+def legacy_label_key(path):
+    return os.path.basename(path).split('.')[0]
+
+
+# lists one directory, returns its image file names and sub directory names.
+# hidden entries are skipped, which also keeps the tool's own cache directory out of the index
+def scan_dir(path, extensions=IMAGE_EXTENSIONS):
+    files = []
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                subdirs.append(entry.name)
+            elif entry.name.lower().endswith(extensions) and entry.is_file():
+                files.append(entry.name)
+    files.sort(key=natural_key)
+    subdirs.sort(key=natural_key)
+    return files, subdirs
+
+
+class ImageIndex(object):
+
+    # indexes the images below root, reusing the listing of every directory whose mtime
+    # did not change since the manifest was written
+    def __init__(self, root, recursive=True, extensions=IMAGE_EXTENSIONS, manifest_path=None):
+        self.root = root
+        self.recursive = recursive
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.manifest_path = manifest_path
+        self.dirs = {}
+        self.paths = []
+        self.sort_keys = {}
+        self.load_manifest()
+
+    def load_manifest(self):
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get('version') != MANIFEST_VERSION or \
+                manifest.get('recursive') != self.recursive or \
+                tuple(manifest.get('extensions', ())) != self.extensions:
+            return
+        self.dirs = manifest.get('dirs', {})
+
+    def save_manifest(self):
+        if not self.manifest_path:
+            return
+        manifest = {'version': MANIFEST_VERSION,
+                    'recursive': self.recursive,
+                    'extensions': list(self.extensions),
+                    'dirs': self.dirs}
+        tmp = self.manifest_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp, self.manifest_path)
+        except OSError as e:
+            print('could not write image manifest: {0}'.format(e))
+
+    def sort_key(self, path):
+        key = self.sort_keys.get(path)
+        if key is None:
+            key = self.sort_keys[path] = natural_key(os.path.relpath(path, self.root))
+        return key
+
+    # walks the directory tree and yields the image paths of every directory as soon as it is listed.
+    # once the walk is complete self.paths holds all images in natural order
+    def iter_batches(self):
+        seen = {}
+        paths = []
+        stack = ['']
+        while stack:
+            rel = stack.pop()
+            path = os.path.join(self.root, rel)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            cached = self.dirs.get(rel)
+            if cached and cached['mtime'] == mtime:
+                files, subdirs = cached['files'], cached['subdirs']
+            else:
+                try:
+                    files, subdirs = scan_dir(path, self.extensions)
+                except OSError:
+                    continue
+            seen[rel] = {'mtime': mtime, 'files': files, 'subdirs': subdirs}
+            batch = [os.path.join(path, name) for name in files]
+            paths.extend(batch)
+            if batch:
+                yield batch
+            if self.recursive:
+                stack.extend(os.path.join(rel, d) for d in reversed(subdirs))
+        changed = seen != self.dirs
+        self.dirs = seen
+        paths.sort(key=self.sort_key)
+        self.paths = paths
+        if changed:
+            self.save_manifest()
+
+    # runs the walk and pushes every batch into queue, followed by None once the index is complete
+    def scan_into(self, queue):
+        try:
+            for batch in self.iter_batches():
+                queue.put(batch)
+        finally:
+            queue.put(None)
+
+    def scan(self):
+        for _ in self.iter_batches():
+            pass
+        return self.paths
+
+
+class FilenameIndex(object):
+
+    # answers go-to queries on the file names of paths without scanning the whole list.
+    # exact names and stems are looked up in dicts, prefixes by bisecting the sorted names
+    # and substrings through a trigram index that is built on first use. with root, queries
+    # containing a '/' are matched against the paths relative to root, indexed on first use.
+    # key returns the name a path is matched by
+    def __init__(self, paths, root=None, key=os.path.basename):
+        self.size = len(paths)
+        self.names = [key(p) for p in paths]
+        self.by_name = {}
+        self.by_stem = {}
+        for i, name in enumerate(self.names):
+            self.by_name.setdefault(name, i)
+            self.by_stem.setdefault(os.path.splitext(name)[0], i)
+        order = sorted(range(self.size), key=self.names.__getitem__)
+        self.sorted_names = [self.names[i] for i in order]
+        self.sorted_indices = order
+        self.trigrams = None
+        self.root = root
+        self.paths = paths if root is not None else None
+        self.relative = None
+
+    def build_trigrams(self):
+        self.trigrams = {}
+        for i, name in enumerate(self.names):
+            for j in range(len(name) - 2):
+                postings = self.trigrams.setdefault(name[j:j + 3], [])
+                if not postings or postings[-1] != i:
+                    postings.append(i)
+
+    # returns the lowest index whose name starts with prefix, or -1. the names starting with
+    # prefix are one range of the sorted names
+    def find_prefix(self, prefix):
+        lo = bisect.bisect_left(self.sorted_names, prefix)
+        hi = bisect.bisect_left(self.sorted_names, prefix + chr(0x10ffff), lo)
+        if lo == hi:
+            return -1
+        return min(self.sorted_indices[lo:hi])
+
+    def relative_index(self):
+        if self.relative is None:
+            root = self.root
+            self.relative = FilenameIndex(self.paths, key=lambda p: os.path.relpath(p, root).replace(os.sep, '/'))
+        return self.relative
+
+    # returns the lowest index whose name contains text, or -1
+    def find_substring(self, text):
+        if len(text) < 3:
+            for i, name in enumerate(self.names):
+                if text in name:
+                    return i
+            return -1
+        if self.trigrams is None:
+            self.build_trigrams()
+        postings = []
+        for j in range(len(text) - 2):
+            p = self.trigrams.get(text[j:j + 3])
+            if p is None:
+                return -1
+            postings.append(p)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            candidates.intersection_update(p)
+            if not candidates:
+                return -1
+        for i in sorted(candidates):
+            if text in self.names[i]:
+                return i
+        return -1
+
+    # resolves a go-to query to a 0 based index, or -1 if nothing matches.
+    # '#n' jumps to the n-th image (1 based), a query with a directory is matched against the
+    # relative paths if root is given, anything else against the file names
+    def lookup(self, query):
+        if not query:
+            return -1
+        if query.startswith('#') and query[1:].isdigit():
+            i = int(query[1:]) - 1
+            return i if 0 <= i < self.size else -1
+        query = query.replace(os.sep, '/')
+        if self.root is not None and '/' in query:
+            return self.relative_index().lookup(query)
+        for table in (self.by_name, self.by_stem):
+            if query in table:
+                return table[query]
+        i = self.find_prefix(query)
+        if i != -1:
+            return i
+        return self.find_substring(query)
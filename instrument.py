@@ -0,0 +1,138 @@
+import cProfile
+import csv
+import functools
+import json
+import time
+
+# upper bounds of the latency histogram buckets in milliseconds, doubling from 10 microseconds to ~80 seconds
+BUCKETS_MS = [0.01 * 2 ** i for i in range(24)]
+# the interaction paths of the label tool that are timed
+HOT_PATHS = ('load_image', 'save_image', 'draw_shape', 'mouse_move', 'mouse_click')
+# milliseconds between two updates of the status bar readout
+STATUS_INTERVAL = 1000
+
+
+class Histogram(object):
+
+    # latency histogram over fixed log2 buckets, so memory stays constant however long the session runs.
+    # percentiles are reported as the upper bound of the bucket they fall into
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS_MS[i], self.max_ms) if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def summary(self):
+        return {'count': self.count,
+                'mean_ms': self.total_ms / self.count if self.count else 0.0,
+                'p50_ms': self.percentile(0.50),
+                'p95_ms': self.percentile(0.95),
+                'p99_ms': self.percentile(0.99),
+                'max_ms': self.max_ms}
+
+
+# returns hits / (hits + misses) of an ImageCache, or None before the first lookup
+def hit_rate(cache):
+    lookups = cache.hits + cache.misses
+    return cache.hits / lookups if lookups else None
+
+
+class Instrumentation(object):
+
+    # opt-in timing of an object's methods plus named gauges sampled on demand. the numbers are
+    # dumped to path (.json or .csv) by close, and the whole session is profiled with cProfile
+    # into profile_path if one is given
+    def __init__(self, path=None, profile_path=None):
+        self.path = path
+        self.profile_path = profile_path
+        self.histograms = {}
+        self.gauges = {}
+        self.profiler = None
+        if profile_path:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    # replaces the given methods of obj by timed wrappers, must run before the methods are bound to events
+    def wrap(self, obj, names=HOT_PATHS):
+        for name in names:
+            setattr(obj, name, self.timed(name, getattr(obj, name)))
+
+    def timed(self, name, func):
+        histogram = self.histograms.setdefault(name, Histogram())
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.add(1000 * (time.perf_counter() - start))
+        return wrapper
+
+    # registers a callable returning a number (or None) to be sampled with every snapshot
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    def snapshot(self):
+        return {'latency': {name: h.summary() for name, h in sorted(self.histograms.items())},
+                'gauges': {name: func() for name, func in sorted(self.gauges.items())}}
+
+    # returns a one line readout for the status bar
+    def status_text(self):
+        parts = []
+        for name in ('mouse_move', 'draw_shape', 'load_image'):
+            h = self.histograms.get(name)
+            if h and h.count:
+                parts.append('%s p95 %.1fms' % (name, h.percentile(0.95)))
+        for name, func in sorted(self.gauges.items()):
+            value = func()
+            if value is None:
+                continue
+            parts.append(('%s %.0f%%' % (name, 100 * value)) if name.endswith('hit_rate') else '%s %s' % (name, value))
+        return ' | '.join(parts)
+
+    # writes the snapshot as json, or as one csv row per timed path and gauge
+    def dump(self, path):
+        snapshot = self.snapshot()
+        if path.endswith('.csv'):
+            columns = ['count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['name'] + columns + ['value'])
+                for name, summary in snapshot['latency'].items():
+                    writer.writerow([name] + ['%.4f' % summary[c] if c != 'count' else summary[c] for c in columns] + [''])
+                for name, value in snapshot['gauges'].items():
+                    writer.writerow([name] + [''] * len(columns) + ['' if value is None else value])
+        else:
+            with open(path, 'w') as f:
+                json.dump(snapshot, f, indent=2, sort_keys=True)
+
+    def close(self):
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+            print('profile written to ' + self.profile_path)
+            self.profiler = None
+        if self.path:
+            self.dump(self.path)
+            print('interaction stats written to ' + self.path)
@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import threading
+from multiprocessing import cpu_count, get_context
+
+from label_store import LabelStore, STORE_NAME
+
+# file name of the persisted index inside a label directory
+INDEX_NAME = '.label_index.json'
+INDEX_VERSION = 1
+# shape tags counted per image, in the order they are reported
+SHAPE_TAGS = ('RECT', 'POLY', 'CIRC')
+# changed label files below this number are parsed in process, more are spread over a pool
+PARALLEL_MIN = 256
+
+
+# returns the image name a label file or label store entry belongs to
+def entry_name(label_filename):
+    name = os.path.basename(label_filename)
+    return name[:-len('.txt')] if name.endswith('.txt') else name
+
+
+# counts the shapes of a label text by tag, without parsing their coordinates
+def count_shapes(text):
+    counts = {}
+    for line in text.splitlines()[1:]:
+        tag = line.split(None, 1)[0] if line.strip() else None
+        if tag:
+            counts[tag] = counts.get(tag, 0) + 1
+    return counts
+
+
+# returns (name, mtime, counts) of one label file, or (name, None, None) if it cannot be read
+def summarize_file(task):
+    name, path, mtime = task
+    try:
+        with open(path) as f:
+            return name, mtime, count_shapes(f.read())
+    except (OSError, UnicodeDecodeError):
+        return name, None, None
+
+
+# returns whether a label file mtime is newer than the one of an index entry. an entry without
+# mtime was recorded by the tool for a write still under way, which no earlier read can be newer than
+def newer(mtime, entry_mtime):
+    return entry_mtime is not None and mtime > entry_mtime
+
+
+class LabelIndex(object):
+
+    # per-image shape counts and label file mtimes of a label directory, persisted next to the labels.
+    # an image is labeled once it has a label file. reopening a directory re-reads only the label
+    # files whose mtime changed, and every write of the tool updates its image in place
+    def __init__(self, out_dir, path=None):
+        self.out_dir = out_dir
+        self.path = path or os.path.join(out_dir, INDEX_NAME)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get('version') == INDEX_VERSION:
+            self.entries = index.get('entries', {})
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            index = {'version': INDEX_VERSION, 'entries': dict(self.entries)}
+            self.dirty = False
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print('could not write label index: {0}'.format(e))
+
+    # brings the index up to date with the label files of the directory, re-reading only the changed
+    # ones, in a process pool if there are many. returns the number of files read. the tool calls it
+    # on a background thread, so the pool's workers are spawned rather than forked from a process
+    # whose other threads may hold locks
+    def refresh(self, jobs=None):
+        files = {}
+        with os.scandir(self.out_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.txt') and entry.is_file():
+                    files[entry.name[:-len('.txt')]] = (entry.path, entry.stat().st_mtime_ns)
+        with self.lock:
+            # the entries as they were when the directory was read, an update while the files are
+            # parsed replaces them and is kept unless the file read here is newer
+            seen = dict(self.entries)
+        tasks = [(name, path, mtime) for name, (path, mtime) in files.items()
+                 if name not in seen or seen[name]['mtime'] != mtime]
+        removed = [name for name in seen if name not in files]
+        if jobs == 1 or len(tasks) < PARALLEL_MIN:
+            results = [summarize_file(task) for task in tasks]
+        else:
+            with get_context('spawn').Pool(jobs or cpu_count()) as pool:
+                results = pool.map(summarize_file, tasks, chunksize=64)
+        with self.lock:
+            for name in removed:
+                if self.entries.get(name) is seen[name]:
+                    del self.entries[name]
+            for name, mtime, counts in results:
+                current = self.entries.get(name)
+                if counts is not None and (current is seen.get(name) or newer(mtime, current['mtime'])):
+                    self.entries[name] = {'mtime': mtime, 'shapes': counts}
+            self.dirty = self.dirty or bool(tasks or removed)
+        self.save()
+        return len(tasks)
+
+    # rebuilds the index from a label store, which keeps no per-image mtimes
+    def refresh_store(self, store):
+        entries = {name: {'mtime': None, 'shapes': counts} for name, counts in store.shape_counts().items()}
+        with self.lock:
+            self.dirty = self.dirty or entries != self.entries
+            self.entries = entries
+        self.save()
+        return len(entries)
+
+    # records the labels text of an image, with the mtime of its label file once it is written
+    def update(self, name, text, mtime=None):
+        with self.lock:
+            self.entries[name] = {'mtime': mtime, 'shapes': count_shapes(text)}
+            self.dirty = True
+
+    def is_labeled(self, name):
+        return name in self.entries
+
+    # returns the number of labeled images and the total shape count per tag
+    def summary(self):
+        totals = dict.fromkeys(SHAPE_TAGS, 0)
+        with self.lock:
+            for entry in self.entries.values():
+                for tag, n in entry['shapes'].items():
+                    totals[tag] = totals.get(tag, 0) + n
+            return len(self.entries), totals
+
+    # returns the text of the dataset summary panel for a dataset of total images
+    def summary_text(self, total):
+        labeled, totals = self.summary()
+        lines = ['labeled: %d/%d' % (labeled, total), 'shapes: %d' % sum(totals.values())]
+        lines.extend('  %s: %d' % (tag, n) for tag, n in totals.items() if n)
+        return '\n'.join(lines)
+
+    # returns a write function for LabelWriter that updates the index after every successful write
+    def wrap(self, write):
+        def write_and_index(filename, text):
+            write(filename, text)
+            try:
+                mtime = os.stat(filename).st_mtime_ns
+            except OSError:
+                mtime = None
+            self.update(entry_name(filename), text, mtime)
+        return write_and_index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='index the labels of a directory and print a summary')
+    parser.add_argument('out_dir', help='directory of BBox_num + POLY/CIRC/RECT label files')
+    parser.add_argument('--rebuild', action='store_true', help='discard the index and read every label file')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, defaults to all cores')
+    args = parser.parse_args(argv)
+    index = LabelIndex(args.out_dir)
+    if args.rebuild:
+        index.entries = {}
+        index.dirty = True
+    store_path = os.path.join(args.out_dir, STORE_NAME)
+    if os.path.exists(store_path):
+        store = LabelStore(store_path)
+        print('%d images read from %s' % (index.refresh_store(store), store_path))
+        store.close()
+    else:
+        print('%d label files read' % index.refresh(args.jobs))
+    labeled, totals = index.summary()
+    print('%d images labeled' % labeled)
+    for tag, n in totals.items():
+        print('%s\t%d' % (tag, n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import time
+from collections import namedtuple
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from label_store import LabelStore, STORE_NAME, SHAPE_CODES, parse_records
+
+# directory inside the label directory holding the reader index
+READER_DIR_NAME = '.label_reader'
+READER_VERSION = 2
+# the arrays of an index, each stored as <name>.npy
+ARRAYS = ('image_offsets', 'kinds', 'point_offsets', 'points', 'params')
+KIND_POLY = SHAPE_CODES['POLY']
+KIND_CIRC = SHAPE_CODES['CIRC']
+KIND_RECT = SHAPE_CODES['RECT']
+
+# the labels of one image. kinds (n,) uint8 with the SHAPE_CODES of label_store, offsets (n + 1,)
+# into points (m, 2) float32 and params (n, 3) float32. polygons are their vertices, circles and
+# rectangles their center with params holding the radius, or width, height and theta in degrees.
+# the arrays are views into the memory-mapped index, copy them to keep them past the reader
+ImageLabels = namedtuple('ImageLabels', ['name', 'kinds', 'offsets', 'points', 'params'])
+
+
+# converts (kind, coords) records of label_store into kinds, vertex counts, points and params arrays
+def records_to_arrays(records):
+    kinds = np.array([kind for kind, _ in records], dtype=np.uint8)
+    counts = np.ones(len(records), dtype=np.int64)
+    params = np.zeros((len(records), 3), dtype=np.float32)
+    parts = []
+    for i, (kind, coords) in enumerate(records):
+        if kind == KIND_POLY:
+            parts.append(np.asarray(coords))
+            counts[i] = len(coords) // 2
+        else:
+            parts.append(np.asarray(coords[:2], dtype=np.float64))
+            params[i, :len(coords) - 2] = coords[2:5]
+    points = np.concatenate([p.astype(np.float32) for p in parts]) if parts else np.empty(0, dtype=np.float32)
+    return kinds, counts, points.reshape(-1, 2), params
+
+
+# reads one label file for build_index, returns (image name, arrays) or (image name, None) if it is damaged
+def index_file(path):
+    name = os.path.basename(path)[:-len('.txt')]
+    try:
+        with open(path) as f:
+            return name, records_to_arrays(parse_records(f.read()))
+    except (OSError, ValueError, RuntimeError) as e:
+        print('skipping {0}: {1}'.format(path, e))
+        return name, None
+
+
+def save_array(index_dir, name, array):
+    tmp = os.path.join(index_dir, name + '.tmp.npy')
+    np.save(tmp, array)
+    os.replace(tmp, os.path.join(index_dir, name + '.npy'))
+
+
+# returns the label files of out_dir, or its label store and write-ahead log if it has one
+def label_paths(out_dir):
+    store_path = os.path.join(out_dir, STORE_NAME)
+    if os.path.exists(store_path):
+        return [path for path in (store_path, store_path + '-wal') if os.path.exists(path)]
+    with os.scandir(out_dir) as it:
+        return sorted(entry.path for entry in it if entry.name.endswith('.txt') and entry.is_file())
+
+
+# returns the number, total size and summed mtimes of the label files of out_dir. any label written,
+# added or removed since an index was built changes it
+def label_signature(out_dir):
+    stats = [os.stat(path) for path in label_paths(out_dir)]
+    return [len(stats), sum(st.st_size for st in stats), sum(st.st_mtime_ns for st in stats)]
+
+
+# parses every label of out_dir once, from its label store if it has one, and writes them into
+# index_dir as flat arrays with offset tables. label files are parsed by a process pool.
+# returns the number of images indexed
+def build_index(out_dir, index_dir=None, jobs=None):
+    index_dir = index_dir or os.path.join(out_dir, READER_DIR_NAME)
+    os.makedirs(index_dir, exist_ok=True)
+    signature = label_signature(out_dir)
+    store_path = os.path.join(out_dir, STORE_NAME)
+    if os.path.exists(store_path):
+        store = LabelStore(store_path)
+        results = [(name, records_to_arrays(store.get_records(name))) for name in store.names()]
+        store.close()
+    else:
+        paths = label_paths(out_dir)
+        with Pool(jobs or cpu_count()) as pool:
+            results = pool.map(index_file, paths, chunksize=64)
+    results = [(name, arrays) for name, arrays in results if arrays is not None]
+    names = [name for name, _ in results]
+    shape_counts = np.array([len(arrays[0]) for _, arrays in results], dtype=np.int64)
+    kinds = np.concatenate([arrays[0] for _, arrays in results] or [np.empty(0, dtype=np.uint8)])
+    counts = np.concatenate([arrays[1] for _, arrays in results] or [np.empty(0, dtype=np.int64)])
+    arrays = {
+        'image_offsets': np.concatenate([[0], np.cumsum(shape_counts)]).astype(np.int64),
+        'kinds': kinds,
+        'point_offsets': np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        'points': np.concatenate([arrays[2] for _, arrays in results] or [np.empty((0, 2), dtype=np.float32)]),
+        'params': np.concatenate([arrays[3] for _, arrays in results] or [np.empty((0, 3), dtype=np.float32)]),
+    }
+    for name in ARRAYS:
+        save_array(index_dir, name, arrays[name])
+    manifest = {'version': READER_VERSION, 'names': names, 'built': time.time(), 'signature': signature,
+                'shapes': int(len(kinds)), 'points': int(len(arrays['points']))}
+    tmp = os.path.join(index_dir, 'manifest.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(index_dir, 'manifest.json'))
+    return len(names)
+
+
+class LabelReader(object):
+
+    # random access to the labels of a directory indexed by build_index, without Tk or any text
+    # parsing. the arrays are memory-mapped, so opening is cheap, worker processes share the pages
+    # and an image costs a few slices of the offset tables
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != READER_VERSION:
+            raise ValueError('{0} was built by another version, rebuild it'.format(index_dir))
+        self.index_dir = index_dir
+        self.names = manifest['names']
+        self.built = manifest['built']
+        self.signature = manifest['signature']
+        self.positions = None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r'))
+
+    # opens the index of a label directory, building it first if there is none or the labels
+    # changed since it was built
+    @staticmethod
+    def open(out_dir, jobs=None):
+        index_dir = os.path.join(out_dir, READER_DIR_NAME)
+        try:
+            with open(os.path.join(index_dir, 'manifest.json')) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        if manifest.get('version') != READER_VERSION or manifest.get('signature') != label_signature(out_dir):
+            build_index(out_dir, index_dir, jobs)
+        return LabelReader(index_dir)
+
+    def __len__(self):
+        return len(self.names)
+
+    # returns the ImageLabels of the i-th image, images being sorted by name
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.names)
+        first, last = self.image_offsets[i:i + 2].tolist()
+        offsets = self.point_offsets[first:last + 1]
+        p0, p1 = int(offsets[0]), int(offsets[-1])
+        return ImageLabels(self.names[i], self.kinds[first:last], offsets - p0,
+                           self.points[p0:p1], self.params[first:last])
+
+    # returns the ImageLabels of an image by name, or None if it has no labels
+    def get(self, name):
+        if self.positions is None:
+            self.positions = {n: i for i, n in enumerate(self.names)}
+        i = self.positions.get(name)
+        return None if i is None else self[i]
+
+    def __iter__(self):
+        for i in range(len(self.names)):
+            yield self[i]
+
+    # returns the range of images of worker number worker out of workers, contiguous so every
+    # worker reads one region of the index
+    def shard_range(self, worker, workers):
+        n = len(self.names)
+        return range(n * worker // workers, n * (worker + 1) // workers)
+
+    # iterates the ImageLabels of one shard, see shard_range
+    def shard(self, worker, workers):
+        for i in self.shard_range(worker, workers):
+            yield self[i]
+
+
+# returns the vertices of every shape of labels as a list of (k, 2) views, circles and rectangles as their center
+def split_shapes(labels):
+    return np.split(labels.points, labels.offsets[1:-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='index a label directory for memory-mapped reading by data loaders')
+    parser.add_argument('out_dir', help='directory of BBox_num + POLY/CIRC/RECT label files or a label store')
+    parser.add_argument('--index-dir', default=None, help='defaults to <out_dir>/' + READER_DIR_NAME)
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, defaults to all cores')
+    args = parser.parse_args(argv)
+    count = build_index(args.out_dir, args.index_dir, args.jobs)
+    reader = LabelReader(args.index_dir or os.path.join(args.out_dir, READER_DIR_NAME))
+    print('%d images with %d shapes and %d points indexed into %s' % (
+        count, len(reader.kinds), len(reader.points), reader.index_dir))
+
+
+if __name__ == '__main__':
+    main()
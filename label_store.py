@@ -0,0 +1,174 @@
+import argparse
+import array
+import os
+import sqlite3
+import threading
+
+# file name of the store inside a label directory. if it exists the tool reads and writes it
+# instead of one text file per image
+STORE_NAME = 'labels.db'
+# shape tags of the text format and their codes in the store
+SHAPE_CODES = {'POLY': 0, 'CIRC': 1, 'RECT': 2}
+SHAPE_TAGS = {code: tag for tag, code in SHAPE_CODES.items()}
+# array typecode of the coordinates of each shape code. rotated rectangles carry a fractional angle
+TYPECODES = {0: 'i', 1: 'i', 2: 'd'}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shapes (
+    image_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    kind INTEGER NOT NULL,
+    coords BLOB NOT NULL,
+    PRIMARY KEY (image_id, idx)
+) WITHOUT ROWID;
+'''
+
+
+# returns the label file of image_name inside out_dir
+def label_file(out_dir, image_name):
+    return os.path.join(out_dir, image_name + '.txt')
+
+
+# splits the text of a label file into (kind, coords) records, coords being an int32 array
+# (float64 for rotated rectangles)
+def parse_records(text):
+    records = []
+    for i, line in enumerate(text.splitlines()):
+        if i == 0 or not line.strip():
+            continue
+        split = line.split()
+        if split[0] not in SHAPE_CODES:
+            raise RuntimeError("unknown shape: " + split[0])
+        kind = SHAPE_CODES[split[0]]
+        records.append((kind, array.array(TYPECODES[kind], map(int if TYPECODES[kind] == 'i' else float, split[1:]))))
+    return records
+
+
+# formats a coordinate without losing precision, whole numbers without a fraction
+def format_number(c):
+    return '%d' % c if float(c).is_integer() else repr(float(c))
+
+
+# formats records back into the BBox_num + POLY/CIRC/RECT text format
+def format_records(records):
+    lines = ['%d' % len(records)]
+    for kind, coords in records:
+        if TYPECODES[kind] == 'i':
+            values = ['%d' % c for c in coords]
+        else:
+            values = [format_number(c) for c in coords]
+        lines.append(' '.join([SHAPE_TAGS[kind]] + values))
+    return '\n'.join(lines) + '\n'
+
+
+class LabelStore(object):
+
+    # all labels of a dataset in a single SQLite file, indexed by image name.
+    # coordinates are stored as native int32 blobs (float64 for rotated rectangles), so loaders can read them with array.frombytes
+    # or numpy.frombuffer without parsing text
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def names(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT name FROM images ORDER BY name')]
+
+    def __contains__(self, image_name):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM images WHERE name = ?', (image_name,)).fetchone() is not None
+
+    # returns {image name: {shape tag: count}} of all images, without reading any coordinates
+    def shape_counts(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT name, kind, COUNT(kind) FROM images LEFT JOIN shapes '
+                                     'ON shapes.image_id = images.id GROUP BY name, kind').fetchall()
+        counts = {}
+        for name, kind, n in rows:
+            image = counts.setdefault(name, {})
+            if kind is not None:
+                image[SHAPE_TAGS[kind]] = n
+        return counts
+
+    # returns the (kind, coords) records of an image, or None if the image has no labels in the store
+    def get_records(self, image_name):
+        with self.lock:
+            row = self.conn.execute('SELECT id FROM images WHERE name = ?', (image_name,)).fetchone()
+            if row is None:
+                return None
+            rows = self.conn.execute('SELECT kind, coords FROM shapes WHERE image_id = ? ORDER BY idx', row).fetchall()
+        records = []
+        for kind, blob in rows:
+            coords = array.array(TYPECODES[kind])
+            coords.frombytes(blob)
+            records.append((kind, coords))
+        return records
+
+    def put_records(self, image_name, records):
+        with self.lock, self.conn:
+            self.put_locked(image_name, records)
+
+    def put_locked(self, image_name, records):
+        self.conn.execute('INSERT OR IGNORE INTO images (name) VALUES (?)', (image_name,))
+        image_id = self.conn.execute('SELECT id FROM images WHERE name = ?', (image_name,)).fetchone()[0]
+        self.conn.execute('DELETE FROM shapes WHERE image_id = ?', (image_id,))
+        self.conn.executemany('INSERT INTO shapes (image_id, idx, kind, coords) VALUES (?, ?, ?, ?)',
+                              [(image_id, i, kind, coords.tobytes()) for i, (kind, coords) in enumerate(records)])
+
+    # returns the labels of an image in the text format, or None if it has none in the store
+    def get_text(self, image_name):
+        records = self.get_records(image_name)
+        return None if records is None else format_records(records)
+
+    def put_text(self, image_name, text):
+        self.put_records(image_name, parse_records(text))
+
+    # imports every label file of out_dir in one transaction, returns the number of images
+    def import_dir(self, out_dir):
+        count = 0
+        with self.lock, self.conn:
+            with os.scandir(out_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith('.txt') or not entry.is_file():
+                        continue
+                    with open(entry.path) as f:
+                        self.put_locked(entry.name[:-len('.txt')], parse_records(f.read()))
+                    count += 1
+        return count
+
+    # writes one label file per image of the store into out_dir, returns the number of images
+    def export_dir(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        names = self.names()
+        for name in names:
+            with open(label_file(out_dir, name), 'w') as f:
+                f.write(self.get_text(name))
+        return len(names)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='convert between label directories and a single label store')
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('out_dir', help='directory of BBox_num + POLY/CIRC/RECT label files')
+    parser.add_argument('--store', default=None, help='store file, defaults to <out_dir>/' + STORE_NAME)
+    args = parser.parse_args(argv)
+    store = LabelStore(args.store or os.path.join(args.out_dir, STORE_NAME))
+    if args.command == 'import':
+        print('%d label files imported into %s' % (store.import_dir(args.out_dir), store.path))
+    else:
+        print('%d label files exported to %s' % (store.export_dir(args.out_dir), args.out_dir))
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,26 +3,62 @@ from tkinter.filedialog import askdirectory
 
 from PIL import Image, ImageTk
 import shape
+from image_cache import ImageCache, ImagePrefetcher, is_large_image
+import thumb_cache
+from image_index import ImageIndex, FilenameIndex, MANIFEST_NAME, label_key, legacy_label_key
+from spatial_index import SpatialGrid
+from render import ShapeRenderer, ShapeView
+from list_view import VirtualListbox
+from scheduler import MotionScheduler, MAX_FPS
+from label_writer import LabelWriter, write_atomic
+from label_store import LabelStore, STORE_NAME
+from viewport import Viewport, TiledImage, VIEW_SIZE, ZOOM_STEP, TILE_CACHE_BYTES
+from history import History, Journal, JOURNAL_DIR_NAME, format_op, parse_op
+from label_index import LabelIndex, entry_name
+from prelabel import Prelabeler, PROPOSALS_DIR_NAME, LOOKAHEAD
+from leases import LeaseManager, LabelMerger, LEASE_DIR_NAME, LEASE_TTL, default_owner
+from instrument import HOT_PATHS, STATUS_INTERVAL, hit_rate
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import os
 import glob
+import queue
+import threading
 import math as m
 import cmath as cm
 import numpy as np
 import re
 
 # shape options for annotations
-SHAPE_TYPES = ['Polygon', 'Circle']
+SHAPE_TYPES = ['Polygon', 'Circle', 'RotatedRect']
 # image sizes for the examples
 SIZE = 480, 640
 # radius for selecting shapes
 SELECT_RADIUS = 12
+# factor by which images are downscaled for display
+DISPLAY_SCALE = 0.5
+# shapes indexed and drawn per event loop turn while an image loads lazily
+LOAD_CHUNK = 200
 
 
 class LabelTool:
-    def __init__(self, master):
+    # stats is an optional instrument.Instrumentation that times the interaction hot paths.
+    # with an annotator name several instances can share one label directory, each image being
+    # leased to one of them at a time. prelabel is a model given as module:function that proposes
+    # the labels of upcoming images, see prelabel.load_model. polygons are saved simplified to
+    # within simplify label file units if it is given. with lazy_load the shapes of an image are
+    # materialized, indexed and drawn in chunks after it is shown
+    def __init__(self, master, display_scale=DISPLAY_SCALE, max_fps=MAX_FPS, stats=None, annotator=None,
+                 prelabel=None, simplify=0, lazy_load=False):
+        # the timed wrappers have to be in place before any method is bound to an event
+        self.stats = stats
+        if stats:
+            stats.wrap(self, HOT_PATHS)
+
         # set up the main frame
         self.parent = master
         self.parent.title("LabelTool")
+        self.parent.protocol("WM_DELETE_WINDOW", self.close)
         self.frame = tk.Frame(self.parent)
         self.frame.pack(fill=tk.BOTH, expand=1)
         self.parent.resizable(width=tk.FALSE, height=tk.FALSE)
@@ -39,14 +75,62 @@ class LabelTool:
         self.image_name = ''
         self.label_filename = ''
         self.tkimg = None
+        self.imageId = None
+        self.display_scale = display_scale
+        # converts label file coordinates to canvas coordinates
+        self.label_to_display = display_scale / shape.LABEL_SCALE
+        self.cache_dir = ''
+        self.image_index = None
+        self.index_queue = None
+        self.filename_index = None
+        self.prefetcher = ImagePrefetcher(loader=self.decode_image, prefetchable=self.prefetchable)
+        # zoom/pan state, the image shown and the pyramid tiles read for it
+        self.viewport = Viewport()
+        self.tiled = None
+        self.tile_cache = ImageCache(TILE_CACHE_BYTES)
+        # pyramids, and the overviews of large images, are made in a worker process that raises PIL's
+        # pixel limit, so the GUI never holds a full resolution image
+        self.tile_pool = ProcessPoolExecutor(max_workers=1)
+        self.pan_start = None
+        self.writer = LabelWriter()
+        self.label_store = None
+        # edits of the current image for undo/redo, and their journal for crash recovery
+        self.history = History()
+        self.journal = None
+        self.saved_text = None
+        self.owner = default_owner(annotator) if annotator else None
+        self.leases = None
+        self.merger = None
+        # per-image shape counts of the label directory, usable once its refresh is done
+        self.label_index = None
+        self.label_index_ready = False
+        self.prelabel = prelabel
+        self.prelabeler = None
+        self.simplify = simplify
+        self.lazy_load = lazy_load
+        # shape indices still to be indexed and drawn by load_chunk, in order, and the pending job
+        self.loading = None
+        self.load_job = None
+        # the label file lines of the shapes, as read and patched by every edit. shapes that were
+        # not edited are saved exactly as read, never rounded through display coordinates, and a
+        # lazily loaded image saves without materializing its shapes
+        self.saved_lines = []
 
         # initialize mouse state
         self.shapeIdList = []
         self.shapeList = []
+        self.shapeGrid = SpatialGrid()
+        # indices of the shapes that currently have canvas items, the others are outside the view
+        self.shown_shapes = set()
+        self.hover_shape_idx = -1
+        self.mouse_loc = None
         self.shapeId = None
         self.shape = None
         self.selected_shape_idx = -1
         self.dragging = False
+        self.drag_origin = None
+        # from the mouse to the center of the dragged shape, which may have been grabbed anywhere inside
+        self.drag_offset = (0, 0)
 
         # ----------------- GUI stuff ---------------------
         # dir entry & load
@@ -70,23 +154,40 @@ class LabelTool:
         self.mainPanel.bind("z", lambda event: self.mainPanel.focus_set())
         self.mainPanel.bind("<Button-1>", self.mouse_click)
         self.mainPanel.bind("<ButtonRelease-1>", self.mouse_release)
-        self.mainPanel.bind("<Motion>", self.mouse_move)
+        # motion events are coalesced and handled at most max_fps times a second
+        self.motion = MotionScheduler(self.mainPanel, self.mouse_move, max_fps=max_fps)
+        self.mainPanel.bind("<Motion>", self.motion.push)
+        # wheel zooms at the cursor, dragging with the middle or right button pans
+        self.mainPanel.bind("<MouseWheel>", self.mouse_wheel)
+        self.mainPanel.bind("<Button-4>", self.mouse_wheel)
+        self.mainPanel.bind("<Button-5>", self.mouse_wheel)
+        self.pan_motion = MotionScheduler(self.mainPanel, self.pan_move, max_fps=max_fps)
+        for button in (2, 3):
+            self.mainPanel.bind("<Button-%d>" % button, self.pan_begin)
+            self.mainPanel.bind("<B%d-Motion>" % button, self.pan_motion.push)
         self.parent.bind_all("<Escape>", self.cancel_shape)  # press <Espace> to cancel current bbox
         self.parent.bind("<Delete>", self.del_shape)  # press <Delete> to cancel the selection
         self.parent.bind("a", self.prev_image)  # press <up> to go backforward
         self.parent.bind("d", self.next_image)  # press <down> to go forward
+        self.parent.bind("<Control-z>", self.undo)  # press <Ctrl-z> to undo the last edit
+        self.parent.bind("<Control-y>", self.redo)  # press <Ctrl-y> or <Ctrl-Shift-z> to redo it
+        self.parent.bind("<Control-Z>", self.redo)
+
+        self.renderer = ShapeRenderer(self.mainPanel, select_radius=SELECT_RADIUS, viewport=self.viewport)
 
         # self.parent.bind("<Home>",self.loadDir)        # press <Enter> to load dir
+        self.parent.bind("<Home>", self.fit_view)  # press <Home> to show the whole image
         self.mainPanel.grid(row=2, column=1, rowspan=4, sticky=tk.W + tk.N)
 
         # showing shape info & delete bbox
         self.lb1 = tk.Label(self.frame, text='Bounding Shapes:')
         self.lb1.grid(row=2, column=2, sticky=tk.W + tk.N)
-        self.listbox = tk.Listbox(self.frame, width=38, height=12)
+        # only the rows scrolled into view exist as listbox entries
+        self.listbox = VirtualListbox(self.frame, self.shape_row, lambda: len(self.shapeList), width=38)
         self.listbox.grid(row=3, column=2, sticky=tk.N)
         self.btnDel = tk.Button(self.frame, text='Delete', command=self.del_shape)
         self.btnDel.grid(row=4, column=2, sticky=tk.W + tk.E + tk.N)
-        self.btnClear = tk.Button(self.frame, text='ClearAll', command=self.clear_shape)
+        self.btnClear = tk.Button(self.frame, text='ClearAll', command=self.clear_all)
         self.btnClear.grid(row=5, column=2, sticky=tk.W + tk.E + tk.N)
 
         # toggling between shape types
@@ -97,6 +198,10 @@ class LabelTool:
         self.shape_type_menu = tk.OptionMenu(self.frame, self.shape_type, *SHAPE_TYPES)
         self.shape_type_menu.grid(row=4, column=0, sticky=tk.W + tk.N)
 
+        # dataset summary from the label index
+        self.summaryLabel = tk.Label(self.frame, text='', justify=tk.LEFT, anchor=tk.NW)
+        self.summaryLabel.grid(row=5, column=0, sticky=tk.W + tk.N)
+
         # control panel for image navigation
         self.ctrPanel = tk.Frame(self.frame)
         self.ctrPanel.grid(row=6, column=1, columnspan=2, sticky=tk.W + tk.E)
@@ -106,18 +211,34 @@ class LabelTool:
         self.nextBtn.pack(side=tk.LEFT, padx=5, pady=3)
         self.progLabel = tk.Label(self.ctrPanel, text="Progress:     /    ")
         self.progLabel.pack(side=tk.LEFT, padx=5)
-        self.tmpLabel = tk.Label(self.ctrPanel, text="Go to Image filename")
+        self.unlabeledBtn = tk.Button(self.ctrPanel, text='Next Unlabeled', command=self.next_unlabeled_image)
+        self.unlabeledBtn.pack(side=tk.LEFT, padx=5, pady=3)
+        self.tmpLabel = tk.Label(self.ctrPanel, text="Go to Image filename or #index")
         self.tmpLabel.pack(side=tk.LEFT, padx=5)
         self.idxEntry = tk.Entry(self.ctrPanel, width=5)
         self.idxEntry.pack(side=tk.LEFT)
         self.idxEntry.bind('<FocusOut>', lambda e: self.idxEntry.select_clear())
         self.goBtn = tk.Button(self.ctrPanel, text='Go', command=self.goto_image)
         self.goBtn.pack(side=tk.LEFT)
+        # images that cannot be opened or zoomed into
+        self.messageLabel = tk.Label(self.ctrPanel, text='', fg='red')
+        self.messageLabel.pack(side=tk.LEFT, padx=5)
 
         # display mouse position
         self.disp = tk.Label(self.ctrPanel, text='')
         self.disp.pack(side=tk.RIGHT)
 
+        # latency, canvas and cache readout while instrumented
+        if stats:
+            stats.gauge('canvas_items', lambda: len(self.mainPanel.find_all()))
+            stats.gauge('shapes', lambda: len(self.shapeList))
+            stats.gauge('image_cache_hit_rate', lambda: hit_rate(self.prefetcher.cache))
+            stats.gauge('tile_cache_hit_rate', lambda: hit_rate(self.tile_cache))
+            stats.gauge('motion_coalesced', lambda: self.motion.stats()['coalesced'])
+            self.statusLabel = tk.Label(self.frame, text='', anchor=tk.W)
+            self.statusLabel.grid(row=7, column=0, columnspan=3, sticky=tk.W + tk.E)
+            self.update_status()
+
         self.frame.columnconfigure(1, weight=1)
         self.frame.rowconfigure(4, weight=1)
 
@@ -138,23 +259,57 @@ class LabelTool:
 
         # get image list
         self.imageDir = s
+        self.imageList = []
+        self.filename_index = None
+        self.cur = 0
+        self.total = 0
+        self.cache_dir = thumb_cache.default_cache_dir(self.imageDir)
+        self.prefetcher.clear()
 
-        def atoi(text):
-            return int(text) if text.isdigit() else text
-
-        def natural_keys(text):
-            return [atoi(c) for c in re.split('(\d+)', text)]
+        # index the directory in the background, images become available as soon as they are listed
+        self.image_index = ImageIndex(self.imageDir, manifest_path=os.path.join(self.cache_dir, MANIFEST_NAME))
+        self.index_queue = queue.Queue()
+        threading.Thread(target=self.image_index.scan_into, args=(self.index_queue,), daemon=True).start()
+        self.poll_index(self.index_queue)
 
-        self.imageList = glob.glob(os.path.join(self.imageDir, '*.png'))
-        self.imageList.extend(glob.glob(os.path.join(self.imageDir, '*.jpg')))
-        self.imageList.sort(key=natural_keys)
-        if len(self.imageList) == 0:
-            print('No .png images found in the specified dir!')
+    # moves freshly indexed images into imageList, replacing it with the sorted list once indexing is done
+    def poll_index(self, index_queue):
+        if index_queue is not self.index_queue:
             return
-        # default to the 1st image in the collection
-        self.cur = 1
+        done = False
+        while True:
+            try:
+                batch = index_queue.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                done = True
+                break
+            self.imageList.extend(batch)
+        first = self.total == 0 and len(self.imageList) > 0
         self.total = len(self.imageList)
-        print('%d images loaded from %s' % (self.total, s))
+        self.update_summary()
+        if done:
+            self.index_queue = None
+            if self.cur > 0:
+                current = self.imageList[self.cur - 1]
+                self.imageList = self.image_index.paths
+                self.cur = self.imageList.index(current) + 1
+                self.update_progress()
+            else:
+                self.imageList = self.image_index.paths
+            self.filename_index = FilenameIndex(self.imageList, root=self.imageDir)
+            if self.total == 0:
+                print('No images found in the specified dir!')
+                return
+            print('%d images loaded from %s' % (self.total, self.imageDir))
+        else:
+            self.parent.after(50, self.poll_index, index_queue)
+        if first:
+            # default to the 1st image in the collection
+            self.cur = 1
+            if self.outDir:
+                self.open_next(0)
 
     def load_out_dir(self, dbg=False):
         if not dbg:
@@ -170,8 +325,10 @@ class LabelTool:
         print("label file loading from this dir: {0}".format(self.outDir))
         if not os.path.exists(self.outDir):
             os.mkdir(self.outDir)
+        self.open_label_store()
 
-        self.load_image()
+        if self.imageList:
+            self.open_next(max(self.cur - 1, 0))
 
     # # get the rectangle's four corners
     # def get_rect(self, x0, y0, x1, y1, x2, y2):
@@ -195,176 +352,576 @@ class LabelTool:
     #     corner_y = (y0 / 2, y1 / 2, y2 / 2, int(y3 / 2))
     #     return tuple(zip(corner_x, corner_y)), w, h
 
+    # returns the display sized image, or a view sized overview of images too large for the view,
+    # preferring a pre-scaled copy from the on-disk cache
+    # returns the overview of an image, made in the tile worker if the image is large
+    def decode_image(self, path):
+        if not is_large_image(path):
+            return thumb_cache.overview(self.cache_dir, path, self.display_scale, VIEW_SIZE)
+        try:
+            return self.tile_pool.submit(thumb_cache.load_overview, self.cache_dir, path, self.display_scale,
+                                         VIEW_SIZE).result()
+        except BrokenProcessPool:
+            self.tile_pool = ProcessPoolExecutor(max_workers=1)
+            raise
+
+    # large images are only decoded once they are opened, not to keep the tile worker busy ahead
+    def prefetchable(self, path):
+        try:
+            return not is_large_image(path)
+        except OSError:
+            return False
+
     def load_image(self):
+        # write out the edits of the previous image right away instead of after the save delay
+        self.writer.flush()
         # load image
         imagepath = self.imageList[self.cur - 1]
-        img = Image.open(imagepath)
-        width, height = img.size
-        img = img.resize((int(width / 2), int(height / 2)), Image.ANTIALIAS)
-        self.tkimg = ImageTk.PhotoImage(img)
-        self.mainPanel.config(width=max(self.tkimg.width(), 100), height=max(self.tkimg.height(), 100))
-        self.mainPanel.create_image(0, 0, image=self.tkimg, anchor=tk.NW)
-        self.progLabel.config(text="{0}/{1}".format(os.path.basename(self.imageList[self.cur - 1]),
-                                                    os.path.basename(self.imageList[self.total - 1])))
+        self.tiled = TiledImage(imagepath, self.prefetcher.get(imagepath), self.cache_dir, self.tile_cache, self.tile_pool)
+        # decode the neighbouring images in the background while the user labels this one
+        self.prefetcher.prefetch_around(self.imageList, self.cur - 1)
+        width, height = self.tiled.size
+        self.viewport.reset(width * self.display_scale, height * self.display_scale)
+        self.mainPanel.config(width=max(self.viewport.width, 100), height=max(self.viewport.height, 100))
+        self.render_image()
+        self.update_progress()
 
 
         # reset mouse state
         self.shapeId = None
         self.shape = None
         self.selected_shape_idx = -1
+        self.hover_shape_idx = -1
         self.dragging = False
 
         # load labels
         self.clear_shape()
-        self.image_name = os.path.split(imagepath)[-1].split('.')[0]
-        label_name = self.image_name + '.txt'
+        self.image_name = label_key(self.imageDir, imagepath)
         print("label directory:" + self.outDir)
-        self.label_filename = os.path.join(self.outDir, label_name)
+        self.label_filename = self.get_label_filename(imagepath)
         print("label save path:" + self.label_filename)
-        if os.path.exists(self.label_filename):
-            with open(self.label_filename) as f:
-                for (i, line) in enumerate(f):
-                    if i == 0:
-                        continue
-                    split = line.split(' ')
-                    parsable = " ".join(split[1:])
-                    shape_type = split[0]
-                    if shape_type == 'POLY':
-                        tmp = shape.Polygon(parse=parsable)
-                    elif shape_type == 'CIRC':
-                        tmp = shape.Circle(parse=parsable)
-                    else:
-                        raise RuntimeError("unknown shape: " + shape_type)
-
-                    self.shapeList.append(tmp)
-
-                    tmp_id = self.draw_shape(tmp, idx=i-1)
-                    self.shapeIdList.append(tmp_id)
-                    self.listbox.insert(tk.END, str(i - 1) + ': ' + tmp.to_string())
-
-    def save_image(self):
+        text = self.read_label_text(self.label_filename)
+        legacy_filename = self.get_legacy_label_filename(imagepath)
+        if text is None and legacy_filename:
+            # labels saved under the old name move to the new one with the next save
+            text = self.read_label_text(legacy_filename)
+            if text is not None:
+                print('reading labels saved as ' + legacy_filename)
+        shapes_text = text
+        if text is None and self.prelabeler:
+            # an image without labels starts from the model's proposal, if it is ready
+            shapes_text = self.prelabeler.get(self.image_name)
+            if shapes_text is not None:
+                print('showing the proposed labels of ' + self.image_name)
+        if shapes_text is not None and self.lazy_load:
+            self.load_shapes_lazily(shapes_text)
+        elif shapes_text is not None:
+            for (i, line) in enumerate(shapes_text.splitlines()):
+                if i == 0:
+                    continue
+                tmp = shape.parse_shape(line)
+                if self.label_to_display != 1:
+                    tmp = tmp.scaled(self.label_to_display)
+
+                self.shapeList.append(tmp)
+                self.shapeGrid.insert(i - 1, tmp)
+
+                tmp_id = self.draw_shape(tmp, idx=i-1)
+                self.shapeIdList.append(tmp_id)
+        if shapes_text is not None:
+            # polygons are simplified on load too, so untouched ones are saved simplified as well
+            self.saved_lines = shape.simplify_lines(shapes_text.splitlines()[1:], self.simplify)
+        self.listbox.reset()
+        self.history.clear()
+        self.saved_text = text
+        if self.merger:
+            self.merger.set_base(self.label_filename, text)
+        if self.journal:
+            self.recover_edits(text)
+        if self.prelabeler:
+            upcoming = self.imageList[self.cur:self.cur + LOOKAHEAD]
+            self.prelabeler.schedule([(label_key(self.imageDir, path), path) for path in upcoming
+                                      if not self.is_labeled(path)])
+
+    # parses the shapes into compact records right away and materializes, indexes and draws them in
+    # chunks from the event loop, the ones in view first, so the image can be worked on at once
+    def load_shapes_lazily(self, text):
+        shapes = shape.ShapeCollection.from_lines(text.splitlines()[1:])
+        if self.label_to_display != 1:
+            shapes = shapes.scaled(self.label_to_display)
+        self.shapeList = shape.LazyShapeList(shapes)
+        self.shapeIdList = [None] * len(shapes)
+        x0, y0, x1, y1 = self.viewport.visible_rect()
+        extents = shapes.extents()
+        visible = (extents[:, 0] <= x1) & (x0 <= extents[:, 2]) & (extents[:, 1] <= y1) & (y0 <= extents[:, 3])
+        self.loading = np.concatenate([np.flatnonzero(visible), np.flatnonzero(~visible)]).tolist()[::-1]
+        self.load_job = self.parent.after(1, self.load_chunk)
+
+    def load_chunk(self):
+        self.load_job = None
+        for _ in range(min(LOAD_CHUNK, len(self.loading))):
+            self.load_shape(self.loading.pop())
+        if self.loading:
+            self.load_job = self.parent.after(1, self.load_chunk)
+        else:
+            self.loading = None
+
+    def load_shape(self, idx):
+        self.shapeGrid.insert(idx, self.shapeList[idx])
+        self.redraw_shape(idx)
+
+    # loads the remaining shapes at once, before an edit renumbers them
+    def finish_loading(self):
+        if self.load_job is not None:
+            self.parent.after_cancel(self.load_job)
+            self.load_job = None
+        while self.loading:
+            self.load_shape(self.loading.pop())
+        self.loading = None
+
+    # replays the journaled edits of this image that did not reach its label file before the tool stopped
+    def recover_edits(self, text):
+        lines = self.journal.recover(self.label_filename, text)
+        if not lines:
+            return
+        try:
+            for line in lines:
+                op = parse_op(line, self.label_to_display)
+                self.apply_op(op)
+                self.patch_lines(op)
+        except (ValueError, IndexError, RuntimeError) as e:
+            print('journal of {0} is damaged: {1}'.format(self.label_filename, e))
+        print('recovered %d unsaved edits of %s' % (len(lines), self.label_filename))
+        self.save_image(self.label_text())
+        self.writer.flush(wait=True)
+        self.journal.discard(self.label_filename)
+
+    # draws the visible part of the image. memory and time depend on the view size only
+    def render_image(self):
+        vp = self.viewport
+        x0, y0, x1, y1 = vp.visible_rect()
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, vp.world_width), min(y1, vp.world_height)
+        cx0, cy0 = vp.to_canvas(x0, y0)
+        cx1, cy1 = vp.to_canvas(x1, y1)
+        out_size = (max(int(round(cx1 - cx0)), 1), max(int(round(cy1 - cy0)), 1))
+        s = 1 / self.display_scale
+        img = self.tiled.render((x0 * s, y0 * s, x1 * s, y1 * s), out_size)
+        self.tkimg = ImageTk.PhotoImage(img)
+        if self.imageId is None:
+            self.imageId = self.mainPanel.create_image(cx0, cy0, image=self.tkimg, anchor=tk.NW)
+            self.mainPanel.tag_lower(self.imageId)
+        else:
+            self.mainPanel.coords(self.imageId, cx0, cy0)
+            self.mainPanel.itemconfig(self.imageId, image=self.tkimg)
+        if self.tiled.future is not None and not self.tiled.future.done():
+            self.parent.after(100, self.poll_tiles, self.tiled)
+
+    # re-renders once the pyramid of an image that is still shown has been built
+    def poll_tiles(self, tiled):
+        if tiled is not self.tiled:
+            return
+        if tiled.poll_tiles():
+            if tiled.error is not None:
+                self.show_message('no zoom tiles for %s: %s' % (os.path.basename(tiled.path), tiled.error))
+                if isinstance(tiled.error, BrokenProcessPool):
+                    self.tile_pool = ProcessPoolExecutor(max_workers=1)
+            self.render_image()
+        else:
+            self.parent.after(100, self.poll_tiles, tiled)
+
+    # redraws image and shapes after the view moved, visiting only shapes in or leaving the view
+    def update_view(self):
+        self.render_image()
+        for idx in sorted(self.shown_shapes | self.shapeGrid.query_rect(*self.viewport.visible_rect())):
+            self.redraw_shape(idx)
+        if self.shape:
+            self.shapeId = self.draw_shape(self.shape, mouse_loc=self.mouse_loc, view=self.shapeId)
+
+    # redraws shape idx with its current highlight
+    def redraw_shape(self, idx):
+        if idx == self.selected_shape_idx:
+            color, selected = 'red', True
+        elif idx == self.hover_shape_idx:
+            color, selected = 'red', False
+        else:
+            color, selected = 'cyan', False
+        self.shapeIdList[idx] = self.draw_shape(self.shapeList[idx], view=self.shapeIdList[idx], idx=idx,
+                                                color=color, selected=selected)
+
+    def mouse_wheel(self, event):
+        if self.tiled is None:
+            return
+        zoom_in = event.num == 4 or getattr(event, 'delta', 0) > 0
+        self.viewport.zoom_at(ZOOM_STEP if zoom_in else 1 / ZOOM_STEP, event.x, event.y)
+        self.update_view()
+
+    def pan_begin(self, event):
+        self.pan_start = (event.x, event.y)
+
+    def pan_move(self, event):
+        if self.tiled is None or self.pan_start is None:
+            return
+        self.viewport.pan(event.x - self.pan_start[0], event.y - self.pan_start[1])
+        self.pan_start = (event.x, event.y)
+        self.update_view()
+
+    def fit_view(self, event=None):
+        if self.tiled is None:
+            return
+        self.viewport.fit()
+        self.update_view()
+
+    # returns the world (display) coordinates under the mouse
+    def event_loc(self, event):
+        x, y = self.viewport.to_world(event.x, event.y)
+        return [int(round(x)), int(round(y))]
+
+    # uses the label store of outDir if there is one, otherwise one text file per image
+    def open_label_store(self):
+        self.writer.close()
+        if self.label_index:
+            self.label_index.save()
+        if self.label_store:
+            self.label_store.close()
+        store_path = os.path.join(self.outDir, STORE_NAME)
+        # every write that catches up with the journal of an image drops that journal
+        self.journal = Journal(os.path.join(self.outDir, JOURNAL_DIR_NAME))
+        if os.path.exists(store_path):
+            print("using label store: " + store_path)
+            self.label_store = LabelStore(store_path)
+            write = self.label_store.put_text
+        else:
+            self.label_store = None
+            write = write_atomic
+        if self.owner:
+            # shared label directory: lease images and merge with edits of other annotators at save time
+            if self.leases:
+                self.leases.release_all()
+            else:
+                self.parent.after(LEASE_TTL * 1000 // 3, self.renew_lease)
+            self.leases = LeaseManager(os.path.join(self.outDir, LEASE_DIR_NAME), self.owner)
+            self.merger = LabelMerger(self.read_saved_text)
+        # the index sees the labels as written, after any merge
+        self.label_index = LabelIndex(self.outDir)
+        self.label_index_ready = False
+        write = self.label_index.wrap(write)
+        if self.merger:
+            write = self.merger.wrap(write)
+        self.writer = LabelWriter(write=self.journal.wrap(write))
+        # only label files changed since the index was saved are read, in the background
+        if self.label_store:
+            refresh, args = self.label_index.refresh_store, (self.label_store,)
+        else:
+            refresh, args = self.label_index.refresh, (None,)
+        if self.prelabel:
+            if self.prelabeler:
+                self.prelabeler.shutdown()
+            self.prelabeler = Prelabeler(self.prelabel, os.path.join(self.outDir, PROPOSALS_DIR_NAME))
+        thread = threading.Thread(target=refresh, args=args, daemon=True)
+        thread.start()
+        self.poll_label_index(self.label_index, thread)
+
+    # returns the label file of an image, or its name in the label store if one is used
+    def get_label_filename(self, imagepath):
+        image_name = label_key(self.imageDir, imagepath)
+        if self.label_store:
+            return image_name
+        return os.path.join(self.outDir, image_name + '.txt')
+
+    # returns the label file of an image under the name used before label_key, or None if that is the same
+    def get_legacy_label_filename(self, imagepath):
+        image_name = legacy_label_key(imagepath)
+        if image_name == label_key(self.imageDir, imagepath):
+            return None
+        if self.label_store:
+            return image_name
+        return os.path.join(self.outDir, image_name + '.txt')
+
+    # returns the saved labels of an image as text, or None if it has none
+    def read_label_text(self, label_filename):
+        # a save of this image may still be waiting in the writer
+        text = self.writer.get_pending(label_filename)
+        if text is not None:
+            return text
+        return self.read_saved_text(label_filename)
+
+    # shows the summary once the label index of the current label directory is up to date
+    def poll_label_index(self, index, thread):
+        if index is not self.label_index:
+            return
+        if thread.is_alive():
+            self.parent.after(100, self.poll_label_index, index, thread)
+            return
+        self.label_index_ready = True
+        self.update_summary()
+
+    def update_summary(self):
+        if self.label_index_ready:
+            self.summaryLabel.config(text=self.label_index.summary_text(self.total))
+
+    # returns the labels of an image as last written, or None if it has none
+    def read_saved_text(self, label_filename):
+        if self.label_store:
+            return self.label_store.get_text(label_filename)
+        if os.path.exists(label_filename):
+            with open(label_filename) as f:
+                return f.read()
+        return None
+
+    def label_exists(self, label_filename):
+        if self.writer.get_pending(label_filename) is not None:
+            return True
+        if self.label_store:
+            return label_filename in self.label_store
+        return os.path.exists(label_filename)
+
+    def update_progress(self):
+        self.progLabel.config(text="{0}/{1}".format(os.path.basename(self.imageList[self.cur - 1]),
+                                                    os.path.basename(self.imageList[self.total - 1])))
+
+    # returns the shapes in the label file format
+    def label_text(self):
+        return '\n'.join(['%d' % len(self.saved_lines)] + self.saved_lines) + '\n'
+
+    # returns the label file lines of shapes in display coordinates
+    def shape_lines(self, shapes):
+        shapes = shape.ShapeCollection.from_shapes(shapes)
+        if self.label_to_display != 1:
+            shapes = shapes.scaled(1 / self.label_to_display)
+        if self.simplify:
+            shapes = shapes.simplified(self.simplify)
+        return shapes.to_lines()
+
+    # applies an edit already made to the shapes to their label file lines
+    def patch_lines(self, op):
+        lines = self.saved_lines
+        kind = op[0]
+        if kind == 'add':
+            lines.insert(op[1], self.shape_lines([op[2]])[0])
+        elif kind == 'delete':
+            del lines[op[1]]
+        elif kind == 'move':
+            lines[op[1]] = self.shape_lines([self.shapeList[op[1]]])[0]
+        elif kind == 'clear':
+            del lines[:]
+        else:
+            lines.extend(self.shape_lines(op[1]))
+
+    # serializes the shapes, unless text is given, and hands them to the background writer.
+    # returns the text saved
+    def save_image(self, text=None):
+        if not self.label_filename:
+            return None
         print("saving image in:" + self.label_filename)
-        with open(self.label_filename, 'w') as f:
-            f.write('%d\n' % len(self.shapeList))
-            for shp in self.shapeList:
-                # f.write(' '.join(map(str, shp)) + '\n')
-                f.write(shp.to_parsable() + '\n')
+        if text is None:
+            text = self.label_text()
+        self.writer.submit(self.label_filename, text)
+        self.saved_text = text
+        if self.label_index:
+            self.label_index.update(entry_name(self.label_filename), text)
+            self.update_summary()
         print('Image No. %d saved' % self.cur)
+        return text
+
+    # records an edit for undo, appends it to the journal and saves the labels
+    def commit_edit(self, op, record=True):
+        if record:
+            self.history.record(op)
+        if not self.label_filename:
+            return
+        self.patch_lines(op)
+        text = self.label_text()
+        if self.journal:
+            self.journal.append(self.label_filename, format_op(op, 1 / self.label_to_display), self.saved_text, text)
+        self.save_image(text)
+
+    # applies an edit, touching only the canvas items and listbox rows of the shapes it changes
+    def apply_op(self, op):
+        kind = op[0]
+        if kind == 'add':
+            self.insert_shape(op[1], op[2])
+        elif kind == 'delete':
+            self.remove_shape(op[1])
+        elif kind == 'move':
+            self.move_shape(op[1], op[2], op[3])
+        elif kind == 'clear':
+            self.clear_shape()
+        else:
+            for shp in op[1]:
+                self.insert_shape(len(self.shapeList), shp)
+
+    def undo(self, event=None):
+        op = self.history.undo()
+        if op is not None:
+            self.apply_op(op)
+            self.commit_edit(op, record=False)
+
+    def redo(self, event=None):
+        op = self.history.redo()
+        if op is not None:
+            self.apply_op(op)
+            self.commit_edit(op, record=False)
+
+    # drops selection and hover highlight before the shape numbers change
+    def deselect(self):
+        for idx in (self.selected_shape_idx, self.hover_shape_idx):
+            if 0 <= idx < len(self.shapeList):
+                self.shapeIdList[idx] = self.draw_shape(self.shapeList[idx], view=self.shapeIdList[idx], idx=idx)
+        self.selected_shape_idx = -1
+        self.hover_shape_idx = -1
+        self.dragging = False
+        self.listbox.clear_selection()
+
+    # returns the listbox row of shape idx
+    def shape_row(self, idx):
+        return str(idx) + ': ' + self.shapeList[idx].to_string()
+
+    # inserts shp at position idx, renumbering the shapes behind it
+    def insert_shape(self, idx, shp):
+        self.finish_loading()
+        self.deselect()
+        self.shapeList.insert(idx, shp)
+        self.shapeIdList.insert(idx, None)
+        self.shapeGrid.insert_at(idx, shp)
+        self.shown_shapes = {i + 1 if i >= idx else i for i in self.shown_shapes}
+        self.renumber(idx + 1)
+        self.shapeIdList[idx] = self.draw_shape(shp, idx=idx)
+        self.listbox.changed(idx)
+
+    # removes and returns the shape at idx, renumbering the shapes behind it
+    def remove_shape(self, idx):
+        self.finish_loading()
+        self.deselect()
+        self.del_shape_id(self.shapeIdList.pop(idx))
+        shp = self.shapeList.pop(idx)
+        self.shapeGrid.pop_at(idx)
+        self.shown_shapes = {i - 1 if i > idx else i for i in self.shown_shapes if i != idx}
+        self.renumber(idx)
+        self.listbox.changed(idx)
+        return shp
 
-    def draw_shape(self, shape, idx=-1, mouse_loc=None, width=2, color='cyan', selected=False, location=None):
-        id = []
-        old_loc = shape.location
+    # updates the numbers of the shapes from start on. only shapes in view have number labels,
+    # the others get theirs when they are drawn again
+    def renumber(self, start):
+        for i in sorted(i for i in self.shown_shapes if i >= start):
+            self.renderer.renumber(self.shapeList[i], self.shapeIdList[i], i)
+
+    def move_shape(self, idx, dx, dy):
+        shp = self.shapeList[idx]
+        shp.set_center([shp.location[0] + dx, shp.location[1] + dy])
+        self.shapeGrid.update(idx, shp)
+        self.redraw_shape(idx)
+        self.listbox.changed(idx)
+
+    # draws shape, updating the canvas items of view in place if one is given, and returns the view.
+    # listed shapes outside the view lose their canvas items until they come back into view
+    def draw_shape(self, shape, idx=-1, mouse_loc=None, width=2, color='cyan', selected=False, location=None, view=None):
+        if idx != -1:
+            if not self.viewport.intersects(shape.get_extents()):
+                self.renderer.delete(view)
+                self.shown_shapes.discard(idx)
+                return view if view is not None else ShapeView()
+            self.shown_shapes.add(idx)
         if location:
+            old_loc = shape.location
             shape.set_center(location)
-        if idx != -1:
-            id.extend(self.create_extras(idx, shape.get_font_size(idx), selected, shape.location))
-        id.extend(shape.create_shape(self.mainPanel, mouse_loc, width, color))
-        if old_loc:
+            view = self.renderer.draw(shape, view, idx, mouse_loc, width, color, selected)
             shape.set_center(old_loc)
-        return id
-
-    def create_extras(self, idx, font_size, selected, location):
-        extras = []
-        extras.append(self.mainPanel.create_text(location[0], location[1], font=('Ariel', font_size + 3), text=str(idx), fill = 'black'))
-        extras.append(self.mainPanel.create_text(location[0], location[1], font=('Ariel', font_size), text=str(idx), fill = 'yellow'))
-        if selected:
-            extras.append(self.mainPanel.create_oval(location[0] - SELECT_RADIUS,
-                                                     location[1] - SELECT_RADIUS,
-                                                     location[0] + SELECT_RADIUS,
-                                                     location[1] + SELECT_RADIUS,
-                                                     fill='',
-                                                     outline='blue',
-                                                     width=2))
-        return extras
+            # the items show the shape at location, not where it actually is
+            view.state = None
+            return view
+        return self.renderer.draw(shape, view, idx, mouse_loc, width, color, selected)
 
-    def mouse_click(self, event):
+    # returns the shape under loc: the one whose center is nearest within radius, or else the topmost
+    # one containing loc, or -1. while a shape type is chosen, clicks inside a shape start a new one
+    def pick_shape(self, loc, radius):
+        idx, _ = self.shapeGrid.nearest(loc[0], loc[1], radius)
+        if idx == -1 and self.shape_type.get() == 'Select Shape Type':
+            hits = self.shapeGrid.hit_test(loc[0], loc[1])
+            if hits:
+                idx = hits[-1]
+        return idx
 
+    def mouse_click(self, event):
+        self.motion.flush()
+        loc = self.event_loc(event)
+        select_radius = SELECT_RADIUS / self.viewport.zoom
         if self.shape:
-            self.shape.handle_click([event.x, event.y])
+            self.shape.handle_click(loc)
             if self.shape.defined:
-                self.del_shape_id(self.shapeId)
-                self.listbox.insert(tk.END, str(len(self.shapeList)) + ': ' + self.shape.to_string())
-                self.shapeIdList.append(self.draw_shape(self.shape, idx=len(self.shapeList)))
+                self.shapeIdList.append(self.draw_shape(self.shape, idx=len(self.shapeList), view=self.shapeId))
+                self.shapeGrid.insert(len(self.shapeList), self.shape)
                 self.shapeList.append(self.shape)
+                self.listbox.changed(len(self.shapeList) - 1)
+                self.commit_edit(('add', len(self.shapeList) - 1, self.shape))
                 self.shapeId = None
                 self.shape = None
-                self.save_image()
         else:
-            closest_idx = -1
-            closest_dist = m.inf
-            for i, shp in enumerate(self.shapeList):
-                dist = shape.Shape.dist(shp.location[0], shp.location[1], event.x, event.y)
-                if dist < closest_dist:
-                    closest_idx = i
-                    closest_dist = dist
-            if closest_dist <= SELECT_RADIUS and closest_idx != self.selected_shape_idx:
+            closest_idx = self.pick_shape(loc, select_radius)
+            if closest_idx != -1 and closest_idx != self.selected_shape_idx:
                 self.dragging = True
                 if self.selected_shape_idx != -1:
-                    self.listbox.selection_clear(0, tk.END)
-                    self.del_shape_id(self.shapeIdList[self.selected_shape_idx])
-                    self.shapeIdList[self.selected_shape_idx] = self.draw_shape(self.shapeList[self.selected_shape_idx], idx=self.selected_shape_idx)
+                    self.shapeIdList[self.selected_shape_idx] = self.draw_shape(self.shapeList[self.selected_shape_idx], view=self.shapeIdList[self.selected_shape_idx], idx=self.selected_shape_idx)
                 self.selected_shape_idx = closest_idx
-                self.listbox.selection_set(self.selected_shape_idx)
-                self.del_shape_id(self.shapeIdList[self.selected_shape_idx])
-                self.shapeIdList[self.selected_shape_idx] = self.draw_shape(self.shapeList[self.selected_shape_idx], idx=self.selected_shape_idx, selected=True, color='red')
-            elif closest_dist <= SELECT_RADIUS and closest_idx == self.selected_shape_idx:
-                self.listbox.selection_clear(0, tk.END)
-                self.del_shape_id(self.shapeIdList[self.selected_shape_idx])
-                self.shapeIdList[self.selected_shape_idx] = self.draw_shape(self.shapeList[self.selected_shape_idx], idx=self.selected_shape_idx)
+                self.drag_origin = list(self.shapeList[closest_idx].location)
+                self.drag_offset = (self.drag_origin[0] - loc[0], self.drag_origin[1] - loc[1])
+                self.listbox.select(self.selected_shape_idx)
+                self.shapeIdList[self.selected_shape_idx] = self.draw_shape(self.shapeList[self.selected_shape_idx], view=self.shapeIdList[self.selected_shape_idx], idx=self.selected_shape_idx, selected=True, color='red')
+            elif closest_idx != -1 and closest_idx == self.selected_shape_idx:
+                self.listbox.clear_selection()
+                self.shapeIdList[self.selected_shape_idx] = self.draw_shape(self.shapeList[self.selected_shape_idx], view=self.shapeIdList[self.selected_shape_idx], idx=self.selected_shape_idx)
                 self.selected_shape_idx = -1
             else:
                 if self.shape_type.get() != 'Select Shape Type':
                     new_shape_opts = {'Polygon': shape.Polygon(),
-                                      'Circle': shape.Circle()}
+                                      'Circle': shape.Circle(),
+                                      'RotatedRect': shape.RotatedRect()}
                     self.shape = new_shape_opts[self.shape_type.get()]
-                    self.shape.handle_click([event.x, event.y])
+                    self.shape.handle_click(loc)
+
+    def drag_center(self, loc):
+        return [loc[0] + self.drag_offset[0], loc[1] + self.drag_offset[1]]
 
     def mouse_release(self, event):
+        self.motion.flush()
         if self.selected_shape_idx != -1 and self.dragging:
             self.dragging = False
-            self.shapeList[self.selected_shape_idx].set_center([event.x, event.y])
-            self.del_shape_id(self.shapeIdList[self.selected_shape_idx])
-            self.shapeIdList[self.selected_shape_idx] = self.draw_shape(self.shapeList[self.selected_shape_idx], idx=self.selected_shape_idx, selected=True)
-            self.listbox.delete(self.selected_shape_idx)
-            self.listbox.insert(self.selected_shape_idx, str(self.selected_shape_idx) + ': ' + self.shapeList[self.selected_shape_idx].to_string())
-            self.listbox.selection_set(self.selected_shape_idx)
-            self.save_image()
+            self.shapeList[self.selected_shape_idx].set_center(self.drag_center(self.event_loc(event)))
+            self.shapeGrid.update(self.selected_shape_idx, self.shapeList[self.selected_shape_idx])
+            self.shapeIdList[self.selected_shape_idx] = self.draw_shape(self.shapeList[self.selected_shape_idx], view=self.shapeIdList[self.selected_shape_idx], idx=self.selected_shape_idx, selected=True)
+            self.listbox.changed(self.selected_shape_idx)
+            location = self.shapeList[self.selected_shape_idx].location
+            dx, dy = location[0] - self.drag_origin[0], location[1] - self.drag_origin[1]
+            if dx or dy:
+                self.commit_edit(('move', self.selected_shape_idx, dx, dy))
 
     def mouse_move(self, event):
-        self.disp.config(text='x: %d, y: %d' % (event.x, event.y))
+        loc = self.event_loc(event)
+        self.mouse_loc = loc
+        self.disp.config(text='x: %d, y: %d' % (loc[0], loc[1]))
 
         if self.shape:
-            if self.shapeId:
-                self.del_shape_id(self.shapeId)
-            self.shapeId = self.draw_shape(self.shape, mouse_loc=[event.x, event.y])
+            self.shapeId = self.draw_shape(self.shape, mouse_loc=loc, view=self.shapeId)
         else:
             if self.selected_shape_idx != -1 and self.dragging:
-                self.del_shape_id(self.shapeIdList[self.selected_shape_idx])
-                self.shapeList[self.selected_shape_idx].set_center([event.x, event.y])
-                self.shapeIdList[self.selected_shape_idx] = self.draw_shape(self.shapeList[self.selected_shape_idx], idx=self.selected_shape_idx, mouse_loc=[event.x, event.y], color='red', selected=True)
-            closest_idx = -1
-            closest_dist = m.inf
-            closest_outside_idx = -1
-            closest_outside_dist = m.inf
-            for i, shp in enumerate(self.shapeList):
-                dist = shape.Shape.dist(shp.location[0], shp.location[1], event.x, event.y)
-                if dist < closest_dist:
-                    closest_idx = i
-                    closest_dist = dist
-                if SELECT_RADIUS < dist < closest_outside_dist:
-                    closest_outside_idx = i
-                    closest_outside_dist = dist
-            if closest_dist <= SELECT_RADIUS and closest_idx != self.selected_shape_idx:
-                self.del_shape_id(self.shapeIdList[closest_idx])
-                self.shapeIdList[closest_idx] = self.draw_shape(self.shapeList[closest_idx], idx=closest_idx, color='red', width=2)
-            if closest_outside_idx != -1:
-                self.del_shape_id(self.shapeIdList[closest_outside_idx])
-                self.shapeIdList[closest_outside_idx] = self.draw_shape(self.shapeList[closest_outside_idx], idx=closest_outside_idx, selected=self.selected_shape_idx==closest_outside_idx)
+                self.shapeList[self.selected_shape_idx].set_center(self.drag_center(loc))
+                self.shapeGrid.update(self.selected_shape_idx, self.shapeList[self.selected_shape_idx])
+                self.shapeIdList[self.selected_shape_idx] = self.draw_shape(self.shapeList[self.selected_shape_idx], view=self.shapeIdList[self.selected_shape_idx], idx=self.selected_shape_idx, mouse_loc=loc, color='red', selected=True)
+            closest_idx = self.pick_shape(loc, SELECT_RADIUS / self.viewport.zoom)
+            if closest_idx == self.selected_shape_idx:
+                closest_idx = -1
+            # only the shapes entering or leaving the highlight are redrawn
+            prev_idx = self.hover_shape_idx
+            if closest_idx != prev_idx:
+                if closest_idx != -1:
+                    self.shapeIdList[closest_idx] = self.draw_shape(self.shapeList[closest_idx], view=self.shapeIdList[closest_idx], idx=closest_idx, color='red', width=2)
+                if prev_idx not in (-1, self.selected_shape_idx):
+                    self.shapeIdList[prev_idx] = self.draw_shape(self.shapeList[prev_idx], view=self.shapeIdList[prev_idx], idx=prev_idx)
+                self.hover_shape_idx = closest_idx
 
     def del_shape_id(self, shape_id):
-        if shape_id:
-            for shp in shape_id:
-                self.mainPanel.delete(shp)
+        self.renderer.delete(shape_id)
 
     def cancel_shape(self):
         if self.shapeId:
@@ -372,48 +929,129 @@ class LabelTool:
             self.shapeId = None
             self.shape = None
 
-    def del_shape(self):
+    def del_shape(self, event=None):
         sel = self.listbox.curselection()
         if len(sel) != 1:
             return
         idx = int(sel[0])
-        if idx == self.selected_shape_idx:
-            self.selected_shape_idx = -1
-        self.del_shape_id(self.shapeIdList[idx])
-        self.shapeIdList.pop(idx)
-        self.shapeList.pop(idx)
-        self.listbox.delete(0, tk.END)
-        for i, shp in enumerate(self.shapeList):
-            shp.index = i
-            self.del_shape_id(self.shapeIdList[i])
-            self.shapeIdList[i] = self.draw_shape(shp, idx=i)
-            self.listbox.insert(tk.END, str(i) + ': ' + shp.to_string())
-        self.save_image()
+        self.commit_edit(('delete', idx, self.remove_shape(idx)))
+
+    def clear_all(self):
+        if self.shapeList:
+            shapes = list(self.shapeList)
+            self.clear_shape()
+            self.commit_edit(('clear', shapes))
 
     def clear_shape(self):
+        if self.load_job is not None:
+            self.parent.after_cancel(self.load_job)
+            self.load_job = None
+        self.loading = None
+        self.saved_lines = []
         for idx in range(len(self.shapeIdList)):
             self.del_shape_id(self.shapeIdList[idx])
-        self.listbox.delete(0, len(self.shapeList))
         self.shapeIdList = []
         self.shapeList = []
+        self.listbox.reset()
+        self.shapeGrid.clear()
+        self.shown_shapes.clear()
+        self.selected_shape_idx = -1
+        self.hover_shape_idx = -1
+
+    # opens the image at position idx (0 based) unless another annotator holds its lease, returns success
+    def open_image(self, idx):
+        path = self.imageList[idx]
+        name = label_key(self.imageDir, path)
+        if self.leases and not self.leases.acquire(name):
+            print('%s is being labeled by %s' % (name, self.leases.holder(name)))
+            return False
+        try:
+            self.prefetcher.get(path)
+        except (OSError, ValueError, Image.DecompressionBombError, BrokenProcessPool) as e:
+            if self.leases and name != self.image_name:
+                self.leases.release(name)
+            self.show_message('cannot open %s: %s' % (os.path.basename(path), e))
+            return False
+        self.show_message('')
+        if self.leases and self.image_name and self.image_name != name:
+            self.leases.release(self.image_name)
+        self.cur = idx + 1
+        self.load_image()
+        return True
+
+    def show_message(self, text):
+        self.messageLabel.config(text=text)
+        if text:
+            print(text)
+
+    # opens the first image at or after position start that is free, returns success
+    def open_next(self, start):
+        for i in range(start, self.total):
+            if self.open_image(i):
+                return True
+        return False
+
+    # keeps the lease of the open image from expiring
+    def renew_lease(self):
+        if self.leases and self.image_name in self.leases.held and not self.leases.renew(self.image_name):
+            self.show_message('%s was taken over by %s' % (self.image_name, self.leases.holder(self.image_name)))
+        self.parent.after(LEASE_TTL * 1000 // 3, self.renew_lease)
 
     def prev_image(self, event=None):
         self.save_image()
-        if self.cur > 1:
-            self.cur -= 1
-            self.load_image()
+        for i in range(self.cur - 2, -1, -1):
+            if self.open_image(i):
+                return
 
     def next_image(self, event=None):
         self.save_image()
-        if self.cur < self.total:
-            self.cur += 1
-            self.load_image()
+        self.open_next(self.cur)
 
     def goto_image(self):
         filename = self.idxEntry.get()
-        print(self.imageList[0])
-        if any(filename in s for s in self.imageList):
+        # the index is rebuilt whenever the directory listing grew, e.g. while it is still being indexed
+        if self.filename_index is None or self.filename_index.size != len(self.imageList):
+            self.filename_index = FilenameIndex(self.imageList, root=self.imageDir)
+        idx = self.filename_index.lookup(filename)
+        if idx != -1:
             self.save_image()
-            self.cur = [i for i, s in enumerate(self.imageList) if filename in s][0] + 1
-            self.load_image()
-            self.parent.focus()
+            if self.open_image(idx):
+                self.parent.focus()
+
+    # the label index answers without touching the label files, until it is ready the files are checked
+    def is_labeled(self, imagepath):
+        legacy_filename = self.get_legacy_label_filename(imagepath)
+        if self.label_index_ready:
+            return (self.label_index.is_labeled(label_key(self.imageDir, imagepath)) or
+                    legacy_filename is not None and self.label_index.is_labeled(legacy_label_key(imagepath)))
+        return (self.label_exists(self.get_label_filename(imagepath)) or
+                legacy_filename is not None and self.label_exists(legacy_filename))
+
+    def next_unlabeled_image(self, event=None):
+        for i in range(self.cur, self.total):
+            if not self.is_labeled(self.imageList[i]):
+                self.save_image()
+                if self.open_image(i):
+                    return
+        print('No unlabeled images after the current one')
+
+    def update_status(self):
+        self.statusLabel.config(text=self.stats.status_text())
+        self.parent.after(STATUS_INTERVAL, self.update_status)
+
+    # writes all pending labels before the window goes away
+    def close(self):
+        if self.stats:
+            self.stats.close()
+        self.writer.close()
+        if self.label_index:
+            self.label_index.save()
+        if self.leases:
+            self.leases.release_all()
+        if self.label_store:
+            self.label_store.close()
+        if self.prelabeler:
+            self.prelabeler.shutdown()
+        self.prefetcher.shutdown()
+        self.tile_pool.shutdown(wait=False)
+        self.parent.destroy()
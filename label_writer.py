@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+
+# seconds an edit waits for further edits to the same file before it is written
+SAVE_DELAY = 0.5
+# times a write is tried before it is given up, and seconds between the tries
+WRITE_ATTEMPTS = 3
+RETRY_DELAY = 1.0
+
+
+# writes text to filename through a temporary file, so the file is either the old or the new version
+def write_atomic(filename, text):
+    tmp = '{0}.{1}.tmp'.format(filename, os.getpid())
+    try:
+        with open(tmp, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class LabelWriter(object):
+
+    # writes label files on a background thread. repeated saves of one file within delay seconds
+    # are coalesced into a single write of the latest contents. write(filename, text) does the
+    # actual writing, e.g. LabelStore.put_text to save into a label store instead of files.
+    # a failed write is retried; after WRITE_ATTEMPTS failures its text is kept in failed
+    def __init__(self, delay=SAVE_DELAY, write=write_atomic):
+        self.delay = delay
+        self.write = write
+        self.pending = {}
+        self.writing = None
+        self.attempts = {}
+        # filename -> (text, error) of the writes given up on
+        self.failed = {}
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, filename, text):
+        with self.cond:
+            self.pending[filename] = (text, time.monotonic() + self.delay)
+            self.attempts.pop(filename, None)
+            self.failed.pop(filename, None)
+            self.cond.notify_all()
+
+    # returns the contents waiting to be written to filename, or None if the file on disk is current
+    def get_pending(self, filename):
+        with self.cond:
+            if filename in self.pending:
+                return self.pending[filename][0]
+            if self.writing and self.writing[0] == filename:
+                return self.writing[1]
+            if filename in self.failed:
+                return self.failed[filename][0]
+            return None
+
+    # writes all pending files without waiting for their delay, optionally blocking until done
+    def flush(self, wait=False):
+        with self.cond:
+            now = time.monotonic()
+            for filename, (text, due) in self.pending.items():
+                self.pending[filename] = (text, min(due, now))
+            self.cond.notify_all()
+            if wait:
+                while self.pending or self.writing:
+                    self.cond.wait()
+
+    def close(self):
+        self.flush(wait=True)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+        for filename, (text, error) in self.failed.items():
+            print('labels of {0} were not saved: {1}'.format(filename, error))
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if self.closed and not self.pending:
+                    return
+                filename, (text, due) = min(self.pending.items(), key=lambda item: item[1][1])
+                now = time.monotonic()
+                if due > now:
+                    self.cond.wait(due - now)
+                    continue
+                del self.pending[filename]
+                self.writing = (filename, text)
+            error = None
+            try:
+                self.write(filename, text)
+            except Exception as e:
+                error = e
+                print('could not save {0}: {1}'.format(filename, e))
+            finally:
+                with self.cond:
+                    self.writing = None
+                    if error is not None:
+                        self.retry(filename, text, error)
+                    else:
+                        self.attempts.pop(filename, None)
+                    self.cond.notify_all()
+
+    # queues a failed write again unless newer contents are pending, called with cond held
+    def retry(self, filename, text, error):
+        if filename in self.pending:
+            return
+        attempts = self.attempts.get(filename, 0) + 1
+        if attempts < WRITE_ATTEMPTS:
+            self.attempts[filename] = attempts
+            self.pending[filename] = (text, time.monotonic() + RETRY_DELAY)
+        else:
+            del self.attempts[filename]
+            self.failed[filename] = (text, error)
@@ -0,0 +1,202 @@
+import os
+import socket
+import threading
+import time
+from collections import Counter
+
+from history import digest
+
+# directory inside the label directory holding the lease files
+LEASE_DIR_NAME = '.leases'
+# seconds a lease stays valid without being renewed
+LEASE_TTL = 600
+
+
+# returns the identity written into lease files. it includes the process id, so two instances of
+# one annotator never share a lease and a lease left by a crash expires like anyone else's
+def default_owner(name):
+    return '{0}@{1}:{2}'.format(name, socket.gethostname(), os.getpid())
+
+
+# returns the contents of a file, or None if it cannot be read
+def read_text(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class LeaseManager(object):
+
+    # exclusive per-image leases shared by several tool instances through lock files in directory.
+    # a lock file is created with O_CREAT | O_EXCL, which is atomic on local file systems and NFSv3+,
+    # and holds its owner and expiry time. expired leases are taken over, so a crashed instance
+    # blocks its images for at most ttl seconds
+    def __init__(self, directory, owner, ttl=LEASE_TTL):
+        self.directory = directory
+        self.owner = owner
+        self.ttl = ttl
+        self.held = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.lock')
+
+    # returns (owner, expiry) of the lease on name, or None if there is none. a lock file that was
+    # just created and not written yet has no owner and expires ttl seconds after its mtime
+    def read(self, name):
+        text = read_text(self.path(name))
+        if text is None:
+            return None
+        return self.parse(self.path(name), text)
+
+    def parse(self, path, text):
+        try:
+            owner, expires = text.split('\n')[:2]
+            return owner, float(expires)
+        except ValueError:
+            pass
+        try:
+            return '', os.stat(path).st_mtime + self.ttl
+        except OSError:
+            return None
+
+    # returns the owner of a valid lease on name held by someone else, or None
+    def holder(self, name):
+        lease = self.read(name)
+        if lease is None or lease[0] == self.owner or lease[1] < time.time():
+            return None
+        return lease[0] or 'another annotator'
+
+    # takes the lease on name, returns False if another annotator holds it
+    def acquire(self, name):
+        if name in self.held:
+            return self.renew(name)
+        path = self.path(name)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                text = read_text(path)
+                if text is None:
+                    continue
+                lease = self.parse(path, text)
+                if lease is not None and lease[1] >= time.time() and lease[0] != self.owner:
+                    return False
+                if not self.take_over(path, text):
+                    return False
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write('%s\n%f\n' % (self.owner, time.time() + self.ttl))
+            self.held.add(name)
+            return True
+        return False
+
+    # removes the expired lock file at path whose contents were text. renaming it away is atomic, so
+    # of several instances taking it over only one gets the file; if what it got is not the lease
+    # it saw expire, another instance took over first and the file is put back.
+    # returns False if the lease was taken by someone else
+    def take_over(self, path, text):
+        stale = '{0}.{1}.stale'.format(path, os.getpid())
+        try:
+            os.rename(path, stale)
+        except OSError:
+            return True
+        if read_text(stale) != text:
+            try:
+                os.link(stale, path)
+            except OSError:
+                pass
+            os.remove(stale)
+            return False
+        os.remove(stale)
+        return True
+
+    # extends a held lease by another ttl seconds. returns False, and forgets the lease, if another
+    # instance took it over in the meantime
+    def renew(self, name):
+        lease = self.read(name)
+        if lease is None:
+            self.held.discard(name)
+            return self.acquire(name)
+        if lease[0] != self.owner:
+            self.held.discard(name)
+            return False
+        tmp = '{0}.{1}.tmp'.format(self.path(name), os.getpid())
+        with open(tmp, 'w') as f:
+            f.write('%s\n%f\n' % (self.owner, time.time() + self.ttl))
+        os.replace(tmp, self.path(name))
+        return True
+
+    def release(self, name):
+        if name not in self.held:
+            return
+        self.held.discard(name)
+        lease = self.read(name)
+        if lease is not None and lease[0] == self.owner:
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+
+    def release_all(self):
+        for name in list(self.held):
+            self.release(name)
+
+
+# returns the shape lines of a label text, without the BBox_num header
+def shape_lines(text):
+    return [line for line in (text or '').splitlines()[1:] if line.strip()]
+
+
+# three way merge of label texts: the shapes ours added to base are added to theirs and the
+# shapes ours removed from base are removed from theirs. a moved shape counts as removed and added
+def merge_labels(base, ours, theirs):
+    base_lines = Counter(shape_lines(base))
+    our_lines = shape_lines(ours)
+    added = Counter(our_lines) - base_lines
+    removed = base_lines - Counter(our_lines)
+    merged = []
+    for line in shape_lines(theirs):
+        if removed[line] > 0:
+            removed[line] -= 1
+        else:
+            merged.append(line)
+    for line in our_lines:
+        if added[line] > 0:
+            added[line] -= 1
+            merged.append(line)
+    return '\n'.join(['%d' % len(merged)] + merged) + '\n'
+
+
+class LabelMerger(object):
+
+    # compares the labels on disk with the version an edit started from before every write and
+    # merges instead of overwriting when another instance changed them in the meantime.
+    # read(filename) returns the saved text or None
+    def __init__(self, read):
+        self.read = read
+        self.bases = {}
+        self.lock = threading.Lock()
+
+    # remembers text as the version the edits of filename start from
+    def set_base(self, filename, text):
+        with self.lock:
+            self.bases[filename] = text
+
+    # returns a write function for LabelWriter that merges before writing
+    def wrap(self, write):
+        def write_merged(filename, text):
+            with self.lock:
+                base = self.bases.get(filename)
+            theirs = self.read(filename)
+            merged = text
+            if theirs is not None and digest(theirs) != digest(base) and digest(theirs) != digest(text):
+                print('labels of {0} were changed by another annotator, merging'.format(filename))
+                merged = merge_labels(base, text, theirs)
+            write(filename, merged)
+            # later edits are merged relative to this version of ours, so the other changes are kept
+            with self.lock:
+                self.bases[filename] = text
+        return write_merged
@@ -0,0 +1,101 @@
+import tkinter as tk
+
+# rows of a list shown at once
+LIST_ROWS = 12
+
+
+class VirtualListbox(object):
+
+    # a Listbox holding only the rows scrolled into view. row(i) returns the text of row i and
+    # count() the number of rows; both are asked on demand, so rows outside the view cost nothing
+    # when they are added, removed or renumbered
+    def __init__(self, master, row, count, rows=LIST_ROWS, **options):
+        self.row = row
+        self.count = count
+        self.rows = rows
+        self.top = 0
+        self.selected = -1
+        self.shown = []
+        self.frame = tk.Frame(master)
+        self.listbox = tk.Listbox(self.frame, height=rows, exportselection=False, **options)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=1)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.bind('<<ListboxSelect>>', self.on_select)
+        self.listbox.bind('<MouseWheel>', self.on_wheel)
+        self.listbox.bind('<Button-4>', self.on_wheel)
+        self.listbox.bind('<Button-5>', self.on_wheel)
+
+    def grid(self, **options):
+        self.frame.grid(**options)
+
+    # rebuilds the visible rows, replacing only the ones whose text changed
+    def refresh(self):
+        n = self.count()
+        self.top = max(min(self.top, n - self.rows), 0)
+        texts = [self.row(i) for i in range(self.top, min(self.top + self.rows, n))]
+        for i, text in enumerate(texts):
+            if i >= len(self.shown):
+                self.listbox.insert(tk.END, text)
+            elif self.shown[i] != text:
+                self.listbox.delete(i)
+                self.listbox.insert(i, text)
+        if len(self.shown) > len(texts):
+            self.listbox.delete(len(texts), tk.END)
+        self.shown = texts
+        self.listbox.selection_clear(0, tk.END)
+        if self.top <= self.selected < self.top + len(texts):
+            self.listbox.selection_set(self.selected - self.top)
+        self.update_scrollbar(n)
+
+    def update_scrollbar(self, n):
+        if n > self.rows:
+            self.scrollbar.set(self.top / n, (self.top + len(self.shown)) / n)
+        else:
+            self.scrollbar.set(0, 1)
+
+    # tells the list that the rows from first on changed. rows below the view are not redrawn,
+    # but the scrollbar still follows the new row count
+    def changed(self, first=0):
+        if first < self.top + self.rows:
+            self.refresh()
+        else:
+            self.update_scrollbar(self.count())
+
+    # scrolls to the top and forgets the selection, e.g. for a new image
+    def reset(self):
+        self.top = 0
+        self.selected = -1
+        self.refresh()
+
+    def select(self, idx):
+        self.selected = idx
+        if not self.top <= idx < self.top + self.rows:
+            self.top = max(idx - self.rows // 2, 0)
+        self.refresh()
+
+    def clear_selection(self):
+        if self.selected != -1:
+            self.selected = -1
+            self.refresh()
+
+    def curselection(self):
+        return (self.selected,) if self.selected != -1 else ()
+
+    def on_select(self, event=None):
+        sel = self.listbox.curselection()
+        if sel:
+            self.selected = self.top + int(sel[0])
+
+    # scrollbar command, ('moveto', fraction) or ('scroll', n, 'units' or 'pages')
+    def scroll(self, *args):
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * self.count())
+        elif args[0] == 'scroll':
+            self.top += int(args[1]) * (self.rows if args[2] == 'pages' else 1)
+        self.refresh()
+
+    def on_wheel(self, event):
+        up = event.num == 4 or getattr(event, 'delta', 0) > 0
+        self.scroll('scroll', -3 if up else 3, 'units')
+        return 'break'
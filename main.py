@@ -1,9 +1,31 @@
 from __future__ import division
+import argparse
 import tkinter as tk
 
 from label_tool import LabelTool
+from instrument import Instrumentation
+from prelabel import load_model
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='label images with polygons, circles and rotated rectangles')
+    parser.add_argument('--stats', default=None,
+                        help='time the interaction hot paths, show them in a status bar and write them to this .json or .csv file on exit')
+    parser.add_argument('--profile', default=None, help='profile the whole session with cProfile into this file')
+    parser.add_argument('--annotator', default=None,
+                        help='share the label directory with other annotators, leasing each image to one of them')
+    parser.add_argument('--prelabel', default=None, metavar='MODULE:FUNCTION',
+                        help='propose the labels of upcoming images with this model, see prelabel.load_model')
+    parser.add_argument('--simplify', type=float, default=0, metavar='TOLERANCE',
+                        help='save polygons with the vertices closer than this to their outline removed, in label file units')
+    parser.add_argument('--lazy', action='store_true',
+                        help='show images at once and load their shapes in chunks afterwards, the visible ones first')
+    args = parser.parse_args()
+    if args.prelabel:
+        try:
+            load_model(args.prelabel)
+        except (ImportError, AttributeError, ValueError) as e:
+            parser.error('cannot load the pre-labeling model {0}: {1}'.format(args.prelabel, e))
+    stats = Instrumentation(args.stats, args.profile) if args.stats or args.profile else None
     root = tk.Tk()
-    tool = LabelTool(root)
+    tool = LabelTool(root, stats=stats, annotator=args.annotator, prelabel=args.prelabel, simplify=args.simplify, lazy_load=args.lazy)
     root.mainloop()
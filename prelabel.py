@@ -0,0 +1,181 @@
+import argparse
+import importlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import shape
+from image_index import ImageIndex, label_key
+from label_writer import write_atomic
+
+# directory inside the label directory holding the proposed labels
+PROPOSALS_DIR_NAME = '.proposals'
+# images handed to the model in one call
+BATCH_SIZE = 8
+# upcoming images proposals are computed for while an image is labeled
+LOOKAHEAD = 32
+
+# the model of a worker process, loaded once by init_worker
+MODEL = None
+
+
+# imports a model given as 'module:function'. the function takes a list of image paths and returns,
+# for each of them, a list of shapes in image pixel coordinates, as shape.Shape objects or as
+# POLY/CIRC/RECT label lines
+def load_model(spec):
+    module_name, _, func_name = spec.partition(':')
+    if not func_name:
+        raise ValueError('model must be given as module:function, not ' + spec)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def init_worker(spec):
+    global MODEL
+    MODEL = load_model(spec)
+
+
+# converts the shapes the model proposed for one image into the label file format
+def proposal_text(shapes):
+    lines = []
+    for shp in shapes:
+        if not isinstance(shp, shape.Shape):
+            shp = shape.parse_shape(shp)
+        lines.append(shp.scaled(shape.LABEL_SCALE).to_parsable())
+    return '\n'.join(['%d' % len(lines)] + lines) + '\n'
+
+
+# runs the model of this worker on a batch of images, returns (path, text) pairs, text being None
+# for images the model failed on
+def run_batch(paths):
+    try:
+        results = MODEL(paths)
+        return [(path, proposal_text(shapes)) for path, shapes in zip(paths, results)]
+    except Exception as e:
+        print('pre-labeling failed on {0}: {1}'.format(paths[0], e))
+        return [(path, None) for path in paths]
+
+
+class Prelabeler(object):
+
+    # computes label proposals for upcoming images with a user model in worker processes, off the
+    # UI thread. proposals are written in the label format to directory and only read when an
+    # image without labels is opened, so a slow model never holds up navigation. a model that
+    # cannot be imported fails here; one whose workers break later only disables pre-labeling
+    def __init__(self, spec, directory, batch_size=BATCH_SIZE, jobs=1):
+        load_model(spec)
+        self.directory = directory
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = set()
+        # the image names of every batch submitted and not finished yet
+        self.futures = {}
+        self.disabled = False
+        os.makedirs(directory, exist_ok=True)
+        self.pool = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(spec,))
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.txt')
+
+    # returns the proposed labels of an image, or None if there are none (yet)
+    def get(self, name):
+        try:
+            with open(self.path(name)) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    # queues the images of (label name, path) pairs that have neither a proposal nor one being
+    # computed, in batches
+    def schedule(self, images):
+        with self.lock:
+            if self.disabled:
+                return
+            todo = [(name, path) for name, path in images if name not in self.pending
+                    and not os.path.exists(self.path(name))]
+            self.pending.update(name for name, _ in todo)
+        for i in range(0, len(todo), self.batch_size):
+            batch = todo[i:i + self.batch_size]
+            try:
+                future = self.pool.submit(run_batch, [path for _, path in batch])
+            except (BrokenProcessPool, RuntimeError) as e:
+                self.disable(e)
+                return
+            with self.lock:
+                self.futures[future] = [name for name, _ in batch]
+            future.add_done_callback(self.finish)
+
+    # stops pre-labeling for the rest of the session, e.g. after the workers died
+    def disable(self, error):
+        with self.lock:
+            if self.disabled:
+                return
+            self.disabled = True
+            self.pending.clear()
+        print('pre-labeling disabled: {0}'.format(error))
+
+    # writes the proposals of a finished batch, called on a thread of the pool
+    def finish(self, future):
+        with self.lock:
+            names = self.futures.pop(future, [])
+        try:
+            if future.cancelled():
+                return
+            try:
+                results = future.result()
+            except BrokenProcessPool as e:
+                self.disable(e)
+                return
+            except Exception as e:
+                print('pre-labeling worker failed: {0}'.format(e))
+                return
+            for name, (path, text) in zip(names, results):
+                if text is not None:
+                    write_atomic(self.path(name), text)
+        except OSError as e:
+            print('could not write proposals: {0}'.format(e))
+        finally:
+            with self.lock:
+                self.pending.difference_update(names)
+
+    # drops the batches not started yet and lets the running ones finish in the background
+    def shutdown(self):
+        with self.lock:
+            futures = list(self.futures)
+        for future in futures:
+            future.cancel()
+        self.disabled = True
+        self.pool.shutdown(wait=False)
+
+
+# writes proposals for every image of image_dir without labels in out_dir, batched across jobs processes
+def prelabel_dir(image_dir, out_dir, spec, batch_size=BATCH_SIZE, jobs=None):
+    paths = [path for path in ImageIndex(image_dir).scan()
+             if not os.path.exists(os.path.join(out_dir, label_key(image_dir, path) + '.txt'))]
+    directory = os.path.join(out_dir, PROPOSALS_DIR_NAME)
+    os.makedirs(directory, exist_ok=True)
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    written = 0
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count(), initializer=init_worker, initargs=(spec,)) as pool:
+        for results in pool.map(run_batch, batches):
+            for path, text in results:
+                if text is not None:
+                    write_atomic(os.path.join(directory, label_key(image_dir, path) + '.txt'), text)
+                    written += 1
+    print('%d proposals for %d unlabeled images written to %s' % (written, len(paths), directory))
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='propose labels for the unlabeled images of a directory with a model')
+    parser.add_argument('image_dir')
+    parser.add_argument('out_dir', help='label directory, proposals go to <out_dir>/' + PROPOSALS_DIR_NAME)
+    parser.add_argument('model', help='module:function taking a list of image paths, see prelabel.load_model')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, defaults to all cores')
+    args = parser.parse_args(argv)
+    prelabel_dir(args.image_dir, args.out_dir, args.model, args.batch_size, args.jobs)
+
+
+if __name__ == '__main__':
+    main()
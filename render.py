@@ -0,0 +1,173 @@
+import numpy as np
+
+from shape import simplify_polygon
+
+# default canvas options of every item kind a shape can be made of
+ITEM_STYLES = {
+    'polygon': lambda color, width: {'outline': color, 'fill': '', 'width': width},
+    'line': lambda color, width: {'fill': color, 'width': width},
+    'oval': lambda color, width: {'outline': color, 'fill': '', 'width': width},
+}
+
+
+# polygons are drawn with their outline simplified to within this many canvas pixels
+LOD_TOLERANCE = 0.5
+# polygons with fewer vertices are drawn as they are
+LOD_MIN_VERTICES = 64
+# at most this many vertices are drawn per polygon, bounding the canvas cost of any shape
+MAX_DRAW_VERTICES = 256
+
+
+# returns the flat coords of a polygon outline reduced to what is visible at zoom
+def level_of_detail(coords, zoom):
+    if len(coords) < 2 * LOD_MIN_VERTICES:
+        return coords
+    points = np.array(coords).reshape(-1, 2)
+    points = simplify_polygon(points, LOD_TOLERANCE / zoom)
+    if len(points) > MAX_DRAW_VERTICES:
+        points = points[::-(-len(points) // MAX_DRAW_VERTICES)]
+    return points.ravel().tolist()
+
+
+class ShapeView(object):
+
+    # the canvas items currently representing one shape
+    def __init__(self):
+        # [kind, item id, coords, options] per geometry item
+        self.items = []
+        self.text_ids = []
+        self.text_state = None
+        self.text_pos = None
+        self.select_id = None
+        self.select_coords = None
+        self.state = None
+
+    def ids(self):
+        ids = [item[1] for item in self.items] + self.text_ids
+        if self.select_id is not None:
+            ids.append(self.select_id)
+        return ids
+
+
+class ShapeRenderer(object):
+
+    # keeps one ShapeView per drawn shape and moves or restyles its canvas items in place,
+    # so redrawing a shape costs a handful of coords/itemconfig calls and nothing at all if
+    # neither its geometry nor its highlight state changed. shapes are given in world coordinates
+    # and mapped to canvas pixels by viewport, if there is one
+    def __init__(self, panel, select_radius=12, viewport=None):
+        self.panel = panel
+        self.select_radius = select_radius
+        self.viewport = viewport
+
+    # draws shp into view (a new view if None) and returns the view
+    def draw(self, shp, view=None, idx=-1, mouse_loc=None, width=2, color='cyan', selected=False):
+        if view is None:
+            view = ShapeView()
+        vp = self.viewport
+        state = (shp.version, idx, tuple(mouse_loc) if mouse_loc else None, width, color, selected,
+                 vp.key() if vp else None)
+        if view.state == state:
+            return view
+        items = shp.get_items(mouse_loc)
+        zoom = vp.zoom if vp else 1
+        items = [(kind, level_of_detail(coords, zoom) if kind == 'polygon' else coords, opts)
+                 for kind, coords, opts in items]
+        if vp and not vp.is_identity():
+            items = [(kind, vp.transform(coords), opts) for kind, coords, opts in items]
+        self.update_items(view, items, color, width)
+        if idx != -1:
+            self.update_extras(view, idx, *self.label_args(shp, idx), selected)
+        else:
+            self.delete_extras(view)
+        view.state = state
+        return view
+
+    # returns font size and canvas position of the number label of shp
+    def label_args(self, shp, idx):
+        font_size = shp.get_font_size(idx)
+        location = shp.location
+        vp = self.viewport
+        if vp and not vp.is_identity():
+            font_size = max(int(font_size * vp.zoom), 1)
+            location = vp.to_canvas(location[0], location[1])
+        return font_size, location
+
+    # changes the number of a drawn shape to idx without recomputing its geometry
+    def renumber(self, shp, view, idx):
+        if view is None or view.state is None or not view.text_ids:
+            return self.draw(shp, view, idx)
+        font_size, location = self.label_args(shp, idx)
+        self.update_extras(view, idx, font_size, location, view.select_id is not None)
+        view.state = view.state[:1] + (idx,) + view.state[2:]
+        return view
+
+    def update_items(self, view, items, color, width):
+        old = view.items
+        view.items = []
+        for i, (kind, coords, opts) in enumerate(items):
+            options = ITEM_STYLES[kind](color, width)
+            options.update(opts)
+            if i < len(old) and old[i][0] == kind:
+                item = old[i]
+                if item[2] != coords:
+                    self.panel.coords(item[1], *coords)
+                    item[2] = coords
+                if item[3] != options:
+                    self.panel.itemconfig(item[1], **options)
+                    item[3] = options
+            else:
+                if i < len(old):
+                    self.panel.delete(old[i][1])
+                item = [kind, getattr(self.panel, 'create_' + kind)(*coords, **options), coords, options]
+            view.items.append(item)
+        for item in old[len(items):]:
+            self.panel.delete(item[1])
+
+    def update_extras(self, view, idx, font_size, location, selected):
+        x, y = location[0], location[1]
+        text_state = (idx, font_size)
+        if not view.text_ids:
+            view.text_ids = [self.panel.create_text(x, y, font=('Ariel', font_size + 3), text=str(idx), fill='black'),
+                             self.panel.create_text(x, y, font=('Ariel', font_size), text=str(idx), fill='yellow')]
+        else:
+            if view.text_pos != (x, y):
+                for text_id in view.text_ids:
+                    self.panel.coords(text_id, x, y)
+            if view.text_state != text_state:
+                self.panel.itemconfig(view.text_ids[0], font=('Ariel', font_size + 3), text=str(idx))
+                self.panel.itemconfig(view.text_ids[1], font=('Ariel', font_size), text=str(idx))
+        view.text_state = text_state
+        view.text_pos = (x, y)
+
+        r = self.select_radius
+        if selected:
+            coords = [x - r, y - r, x + r, y + r]
+            if view.select_id is None:
+                view.select_id = self.panel.create_oval(*coords, fill='', outline='blue', width=2)
+            elif view.select_coords != coords:
+                self.panel.coords(view.select_id, *coords)
+            view.select_coords = coords
+        elif view.select_id is not None:
+            self.panel.delete(view.select_id)
+            view.select_id = None
+            view.select_coords = None
+
+    def delete_extras(self, view):
+        for text_id in view.text_ids:
+            self.panel.delete(text_id)
+        view.text_ids = []
+        view.text_state = None
+        view.text_pos = None
+        if view.select_id is not None:
+            self.panel.delete(view.select_id)
+            view.select_id = None
+            view.select_coords = None
+
+    def delete(self, view):
+        if view:
+            for item in view.items:
+                self.panel.delete(item[1])
+            view.items = []
+            self.delete_extras(view)
+            view.state = None
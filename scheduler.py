@@ -0,0 +1,65 @@
+import time
+from collections import deque
+
+# upper bound on motion redraws per second
+MAX_FPS = 60
+# number of recent frames kept for the frame time statistics
+STATS_WINDOW = 600
+
+
+class MotionScheduler(object):
+
+    # coalesces <Motion> events and hands only the latest one to handler, at most max_fps times a second.
+    # nothing is scheduled while the mouse rests, so idle frames cost nothing
+    def __init__(self, widget, handler, max_fps=MAX_FPS):
+        self.widget = widget
+        self.handler = handler
+        self.interval = 1.0 / max_fps
+        self.pending = None
+        self.after_id = None
+        self.last_frame = 0.0
+        self.events = 0
+        self.frames = 0
+        self.frame_times = deque(maxlen=STATS_WINDOW)
+
+    def push(self, event):
+        self.events += 1
+        self.pending = event
+        if self.after_id is None:
+            wait = self.interval - (time.perf_counter() - self.last_frame)
+            self.after_id = self.widget.after(max(int(wait * 1000), 0), self.run)
+
+    def run(self):
+        self.after_id = None
+        event = self.pending
+        if event is None:
+            return
+        self.pending = None
+        start = time.perf_counter()
+        self.handler(event)
+        end = time.perf_counter()
+        self.last_frame = end
+        self.frames += 1
+        self.frame_times.append(end - start)
+
+    # handles a pending event right away, e.g. before a click that depends on the latest position
+    def flush(self):
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+        self.run()
+
+    # returns event/frame counts and frame times in milliseconds over the recent window
+    def stats(self):
+        times = sorted(self.frame_times)
+        stats = {'events': self.events,
+                 'frames': self.frames,
+                 'coalesced': self.events - self.frames,
+                 'mean_ms': 0.0,
+                 'p95_ms': 0.0,
+                 'max_ms': 0.0}
+        if times:
+            stats['mean_ms'] = 1000 * sum(times) / len(times)
+            stats['p95_ms'] = 1000 * times[min(int(0.95 * len(times)), len(times) - 1)]
+            stats['max_ms'] = 1000 * times[-1]
+        return stats
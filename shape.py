@@ -1,16 +1,40 @@
 from tkinter import Canvas
 import math as m
+import numpy as np
+
+# label files store coordinates in the frame of the image downscaled by this factor
+LABEL_SCALE = 0.5
 
 class Shape(object):
+    __slots__ = ('defined', 'location', 'version', 'font_sizes')
 
     # defines a blank shape or parses one from a given string
     def __init__(self, *to_parse):
         self.defined = False
         self.location = None
+        # bumped on every change to the geometry so renderers know when to update
+        self.version = 0
+        # font size per number of digits, only depends on the shape's outline and not its position
+        self.font_sizes = {}
 
     # draws the shape on the panel and returns it whether the shape is partial or complete
-    def create_shape(self, panel, mouse_loc):
-        raise NotImplementedError('subclasses must override get_shape!')
+    def create_shape(self, panel, mouse_loc, width=1, color='blue'):
+        if not isinstance(panel, Canvas):
+            raise RuntimeError('cannot draw to a non-Canvas object: ' + panel)
+        ids = []
+        for kind, coords, opts in self.get_items(mouse_loc):
+            if kind == 'line':
+                options = {'fill': color, 'width': width}
+            else:
+                options = {'outline': color, 'fill': '', 'width': width}
+            options.update(opts)
+            ids.append(getattr(panel, 'create_' + kind)(*coords, **options))
+        return ids
+
+    # returns the canvas items (kind, flat coords, option overrides) that make up the shape,
+    # kind being one of 'polygon', 'line' or 'oval'
+    def get_items(self, mouse_loc):
+        raise NotImplementedError('subclasses must override get_items!')
 
     # adds to or modifies a shape based on click
     def handle_click(self, loc):
@@ -32,12 +56,31 @@ class Shape(object):
     def to_parsable(self):
         raise NotImplementedError('subclasses must override to_parsable!')
 
+    # returns a copy of this shape with all coordinates multiplied by factor
+    def scaled(self, factor):
+        raise NotImplementedError('subclasses must override scaled!')
+
+    # returns the bounding extents (x0, y0, x1, y1) of the shape
+    def get_extents(self):
+        raise NotImplementedError('subclasses must override get_extents!')
+
+    # returns whether the point lies inside the shape
+    def contains(self, x, y):
+        raise NotImplementedError('subclasses must override contains!')
+
     # returns the approximated font size required for the given number in this shape
     def get_font_size(self, idx):
+        digits = len(str(idx))
+        size = self.font_sizes.get(digits)
+        if size is None:
+            size = self.font_sizes[digits] = self.estimate_font_size(digits)
+        return size
+
+    def estimate_font_size(self, digits):
         approx_diam = self.get_approx_diam()
         # 1 font size for every 2 pixels of diameter
         # goes down by a factor of 2/3 for every new digit
-        est = int(1 / 2 * approx_diam * ((2 / 3) ** (len(str(idx)) - 1)))
+        est = int(1 / 2 * approx_diam * ((2 / 3) ** (digits - 1)))
         if est > 16:
             return 16
         elif est < 4:
@@ -56,43 +99,36 @@ FINISH_RADIUS = 5
 
 
 class Polygon(Shape):
+    __slots__ = ('points',)
 
+    # vertices are kept in a contiguous (n, 2) int32 array
     def __init__(self, parse=None):
         super().__init__()
-        self.points = []
+        self.points = np.empty((0, 2), dtype=np.int32)
         if parse:
             self.defined = True
-            point = []
-            for i, val in enumerate(str(parse).split(' ')):
-                point.append(int(val))
-                if i % 2 == 1:
-                    self.points.append(point)
-                    point = []
+            self.points = np.array(str(parse).split(), dtype=np.int32).reshape(-1, 2)
             self.location = self.get_center()
 
-    def create_shape(self, panel, mouse_loc, width=1, color='blue'):
-        if not isinstance(panel, Canvas):
-            raise RuntimeError('cannot draw to a non-Canvas object: ' + panel)
+    def get_items(self, mouse_loc):
         if self.defined:
-            return [panel.create_polygon(self.points, width=width, outline=color, fill='')]
-        else:
-            shape = []
-            last = None
-            for p in self.points:
-                if not (last is None):
-                    shape.append(panel.create_line(last[0], last[1], p[0], p[1], width=width, fill=color))
-                last = p
-            if mouse_loc and self.points:
-                shape.append(panel.create_line(p[0], p[1], mouse_loc[0], mouse_loc[1], width=width, fill=color))
-                if Shape.dist(self.points[0][0], self.points[0][1], mouse_loc[0], mouse_loc[1]) <= FINISH_RADIUS:
-                    shape.append(panel.create_oval(self.points[0][0] - FINISH_RADIUS,
-                                                   self.points[0][1] - FINISH_RADIUS,
-                                                   self.points[0][0] + FINISH_RADIUS,
-                                                   self.points[0][1] + FINISH_RADIUS,
-                                                   fill='',
-                                                   outline='red',
-                                                   width=2))
-            return shape
+            return [('polygon', self.points.ravel().tolist(), {})]
+        items = []
+        # the clicked vertices and the rubber band edge to the mouse form one polyline
+        coords = self.points.ravel().tolist()
+        if mouse_loc and len(self.points):
+            coords += [mouse_loc[0], mouse_loc[1]]
+        if len(coords) >= 4:
+            items.append(('line', coords, {}))
+        if mouse_loc and len(self.points):
+            x0, y0 = self.points[0].tolist()
+            if Shape.dist(x0, y0, mouse_loc[0], mouse_loc[1]) <= FINISH_RADIUS:
+                items.append(('oval', [x0 - FINISH_RADIUS,
+                                       y0 - FINISH_RADIUS,
+                                       x0 + FINISH_RADIUS,
+                                       y0 + FINISH_RADIUS],
+                              {'outline': 'red', 'width': 2}))
+        return items
 
     def handle_click(self, loc):
         if not self.defined:
@@ -100,51 +136,60 @@ class Polygon(Shape):
                 self.location = self.get_center()
                 self.defined = True
             else:
-                self.points.append(loc)
+                self.points = np.vstack([self.points, np.array([loc], dtype=np.int32)])
+            self.font_sizes = {}
+            self.version += 1
 
     def get_center(self):
-        new_loc = [0, 0]
-        for p in self.points:
-            new_loc[0] += p[0]
-            new_loc[1] += p[1]
-        return [int(a / len(self.points)) for a in new_loc]
+        return (self.points.sum(axis=0, dtype=np.int64) / len(self.points)).astype(int).tolist()
 
     def get_approx_diam(self):
-        total_dist = 0
-        for p0 in self.points:
-            for p1 in self.points:
-                if p0 == p1:
-                    continue
-                total_dist += Shape.dist(p0[0], p0[1], p1[0], p1[1])
+        # derived from the mean distance of the vertices to their centroid, which is O(n).
+        # for evenly spread vertices this matches the former estimate from all vertex pairs
+        pts = self.points.astype(np.float64)
+        diff = pts - pts.mean(axis=0)
         num_points = len(self.points)
-        average_dist = 2 * total_dist / (num_points * (num_points - 1))
-        approx_diam = average_dist * m.pi / 2
+        approx_diam = 4 * np.sqrt((diff * diff).sum(axis=1)).mean()
         # this approximation is less accurate for low vertex shapes
         # so we scale it down by (1 - e^(-num_points))
         return approx_diam * (1 - (m.e ** (-num_points/6)))
 
     def set_center(self, loc):
-        for p in self.points:
-            p[0] += loc[0] - self.location[0]
-            p[1] += loc[1] - self.location[1]
+        self.points += np.array([loc[0] - self.location[0], loc[1] - self.location[1]], dtype=np.int32)
         self.location = loc
+        self.version += 1
 
     def to_string(self):
-        s = 'POLY - points={'
-        for p in self.points:
-            s += '(' + str(p[0]) + ',' + str(p[1]) + '),'
-        s = s[:-1]
-        s += '}'
-        return s
+        return 'POLY - points={' + ','.join('(%d,%d)' % (x, y) for x, y in self.points.tolist()) + '}'
 
     def to_parsable(self):
-        s = 'POLY'
-        for p in self.points:
-            s += ' ' + str(p[0]) + ' ' + str(p[1])
-        return s
+        return ' '.join(['POLY'] + [str(c) for c in self.points.ravel().tolist()])
+
+    def get_extents(self):
+        x0, y0 = self.points.min(axis=0).tolist()
+        x1, y1 = self.points.max(axis=0).tolist()
+        return x0, y0, x1, y1
+
+    # even-odd ray casting over all edges at once
+    def contains(self, x, y):
+        p1 = self.points.astype(np.float64)
+        p0 = np.roll(p1, 1, axis=0)
+        crosses = (p0[:, 1] > y) != (p1[:, 1] > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = (p1[:, 0] - p0[:, 0]) * (y - p0[:, 1]) / (p1[:, 1] - p0[:, 1]) + p0[:, 0]
+        return bool(np.count_nonzero(crosses & (x < x_cross)) % 2)
+
+    def scaled(self, factor):
+        shp = Polygon()
+        shp.defined = self.defined
+        shp.points = np.rint(self.points * factor).astype(np.int32)
+        if self.location:
+            shp.location = shp.get_center()
+        return shp
 
 
 class Circle(Shape):
+    __slots__ = ('start', 'radius')
 
     def __init__(self, parse=None):
         super().__init__()
@@ -155,27 +200,16 @@ class Circle(Shape):
             self.location = [int(splt[0]), int(splt[1])]
             self.radius = int(splt[2])
 
-    def create_shape(self, panel, mouse_loc, width=1, color='blue'):
-        if not isinstance(panel, Canvas):
-            raise RuntimeError('cannot draw to a non-Canvas object: ' + panel)
+    def get_items(self, mouse_loc):
         if self.defined:
-            return [panel.create_oval(self.location[0] - self.radius,
-                                               self.location[1] - self.radius,
-                                               self.location[0] + self.radius,
-                                               self.location[1] + self.radius,
-                                               fill='',
-                                               outline=color,
-                                               width=width),]
-        else:
-            if mouse_loc and self.start:
-                circ = Circle.get_circ(self.start[0], self.start[1], mouse_loc[0], mouse_loc[1])
-                return [panel.create_oval(circ[0] - circ[2],
-                                               circ[1] - circ[2],
-                                               circ[0] + circ[2],
-                                               circ[1] + circ[2],
-                                               fill='',
-                                               outline=color,
-                                               width=width),]
+            return [('oval', [self.location[0] - self.radius,
+                              self.location[1] - self.radius,
+                              self.location[0] + self.radius,
+                              self.location[1] + self.radius], {})]
+        if mouse_loc and self.start:
+            circ = Circle.get_circ(self.start[0], self.start[1], mouse_loc[0], mouse_loc[1])
+            return [('oval', [circ[0] - circ[2], circ[1] - circ[2], circ[0] + circ[2], circ[1] + circ[2]], {})]
+        return []
 
     @staticmethod
     def get_circ(x0, y0, x1, y1):
@@ -194,15 +228,572 @@ class Circle(Shape):
                 self.defined = True
             else:
                 self.start = loc
+            self.font_sizes = {}
+            self.version += 1
 
     def get_approx_diam(self):
         return self.radius * 2
 
     def set_center(self, loc):
         self.location = loc
+        self.version += 1
 
     def to_string(self):
         return 'CIRC - center=(' + str(self.location[0]) + ',' + str(self.location[1]) + '), radius=' + str(self.radius)
 
     def to_parsable(self):
-        return 'CIRC ' + str(self.location[0]) + ' ' + str(self.location[1]) + ' ' + str(self.radius)
\ No newline at end of file
+        return 'CIRC ' + str(self.location[0]) + ' ' + str(self.location[1]) + ' ' + str(self.radius)
+
+    def get_extents(self):
+        return (self.location[0] - self.radius, self.location[1] - self.radius,
+                self.location[0] + self.radius, self.location[1] + self.radius)
+
+    def contains(self, x, y):
+        return Shape.dist(self.location[0], self.location[1], x, y) <= self.radius
+
+    def scaled(self, factor):
+        shp = Circle()
+        shp.defined = self.defined
+        shp.location = [int(round(a * factor)) for a in self.location]
+        shp.radius = int(round(self.radius * factor))
+        return shp
+
+
+class RotatedRect(Shape):
+    __slots__ = ('clicks', 'width', 'height', 'theta')
+
+    # a rectangle rotated by theta degrees around its center, stored as 'RECT xc yc w h theta'.
+    # drawn with three clicks: two vertices of the first side, then a point fixing the height
+    def __init__(self, parse=None):
+        super().__init__()
+        self.clicks = []
+        if parse:
+            self.defined = True
+            splt = [float(v) for v in str(parse).split()]
+            self.location = [int(round(splt[0])), int(round(splt[1]))]
+            self.width = int(round(splt[2]))
+            self.height = int(round(splt[3]))
+            self.theta = splt[4] % 180
+
+    # returns (xc, yc, w, h, theta) of the rectangle with side p0-p1 extending towards p2
+    @staticmethod
+    def get_rect(p0, p1, p2):
+        dx, dy = p1[0] - p0[0], p1[1] - p0[1]
+        w = m.sqrt(dx * dx + dy * dy)
+        if w == 0:
+            return p0[0], p0[1], 0, 0, 0.0
+        # signed distance of p2 from the line through p0 and p1
+        h = ((p2[0] - p0[0]) * -dy + (p2[1] - p0[1]) * dx) / w
+        xc = (p0[0] + p1[0]) / 2 - dy / w * h / 2
+        yc = (p0[1] + p1[1]) / 2 + dx / w * h / 2
+        return xc, yc, w, abs(h), m.degrees(m.atan2(dy, dx)) % 180
+
+    def get_corners(self):
+        return rect_corners(self.location[0], self.location[1], self.width, self.height, self.theta)
+
+    def get_items(self, mouse_loc):
+        if self.defined:
+            return [('polygon', np.rint(self.get_corners()).astype(int).ravel().tolist(), {})]
+        if len(self.clicks) == 1 and mouse_loc:
+            return [('line', [self.clicks[0][0], self.clicks[0][1], mouse_loc[0], mouse_loc[1]], {})]
+        if len(self.clicks) == 2:
+            if not mouse_loc:
+                return [('line', self.clicks[0] + self.clicks[1], {})]
+            corners = rect_corners(*RotatedRect.get_rect(self.clicks[0], self.clicks[1], mouse_loc))
+            return [('polygon', np.rint(corners).astype(int).ravel().tolist(), {})]
+        return []
+
+    def handle_click(self, loc):
+        if not self.defined:
+            self.clicks.append([loc[0], loc[1]])
+            if len(self.clicks) == 3:
+                xc, yc, w, h, theta = RotatedRect.get_rect(*self.clicks)
+                self.location = [int(round(xc)), int(round(yc))]
+                self.width = int(round(w))
+                self.height = int(round(h))
+                self.theta = theta
+                self.clicks = []
+                self.defined = True
+            self.font_sizes = {}
+            self.version += 1
+
+    def get_approx_diam(self):
+        return min(self.width, self.height)
+
+    def set_center(self, loc):
+        self.location = loc
+        self.version += 1
+
+    def to_string(self):
+        return 'RECT - center=(%d,%d), size=(%d,%d), angle=%.2f' % (self.location[0], self.location[1],
+                                                                   self.width, self.height, self.theta)
+
+    def to_parsable(self):
+        return 'RECT %d %d %d %d %.2f' % (self.location[0], self.location[1], self.width, self.height, self.theta)
+
+    def get_extents(self):
+        corners = self.get_corners()
+        x0, y0 = np.floor(corners.min(axis=0)).astype(int).tolist()
+        x1, y1 = np.ceil(corners.max(axis=0)).astype(int).tolist()
+        return x0, y0, x1, y1
+
+    def contains(self, x, y):
+        t = m.radians(self.theta)
+        dx, dy = x - self.location[0], y - self.location[1]
+        u = dx * m.cos(t) + dy * m.sin(t)
+        v = -dx * m.sin(t) + dy * m.cos(t)
+        return abs(u) <= self.width / 2 and abs(v) <= self.height / 2
+
+    def scaled(self, factor):
+        shp = RotatedRect()
+        shp.defined = self.defined
+        shp.location = [int(round(a * factor)) for a in self.location]
+        shp.width = int(round(self.width * factor))
+        shp.height = int(round(self.height * factor))
+        shp.theta = self.theta
+        return shp
+
+
+# parses one line of a label file, e.g. 'POLY x0 y0 x1 y1 ...', 'CIRC x y r' or 'RECT xc yc w h theta'
+def parse_shape(line):
+    split = line.split(' ')
+    parsable = " ".join(split[1:])
+    shape_type = split[0]
+    if shape_type == 'POLY':
+        return Polygon(parse=parsable)
+    elif shape_type == 'CIRC':
+        return Circle(parse=parsable)
+    elif shape_type == 'RECT':
+        return RotatedRect(parse=parsable)
+    else:
+        raise RuntimeError("unknown shape: " + shape_type)
+
+
+# kind codes used by ShapeCollection
+KIND_POLY = 0
+KIND_CIRC = 1
+KIND_RECT = 2
+SHAPE_KINDS = {'POLY': KIND_POLY, 'CIRC': KIND_CIRC, 'RECT': KIND_RECT}
+
+
+class ShapeCollection(object):
+    __slots__ = ('kinds', 'offsets', 'points', 'params')
+
+    # all shapes of one image in shared arrays: kinds (n,) uint8, offsets (n + 1,) into the
+    # (m, 2) int32 points array and params (n, 3) float64. circles and rotated rectangles are stored
+    # as their center point, with params holding the radius, or width, height and theta
+    def __init__(self, kinds, offsets, points, params):
+        self.kinds = kinds
+        self.offsets = offsets
+        self.points = points
+        self.params = params
+
+    @staticmethod
+    def from_shapes(shapes):
+        kinds = []
+        parts = []
+        params = np.zeros((len(shapes), 3))
+        for i, shp in enumerate(shapes):
+            if isinstance(shp, Polygon):
+                kinds.append(KIND_POLY)
+                parts.append(shp.points)
+                continue
+            parts.append(np.array([shp.location], dtype=np.int32))
+            if isinstance(shp, Circle):
+                kinds.append(KIND_CIRC)
+                params[i, 0] = shp.radius
+            else:
+                kinds.append(KIND_RECT)
+                params[i] = shp.width, shp.height, shp.theta
+        counts = np.array([len(p) for p in parts], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        points = np.concatenate(parts).astype(np.int32) if parts else np.empty((0, 2), dtype=np.int32)
+        return ShapeCollection(np.array(kinds, dtype=np.uint8), offsets, points, params)
+
+    # parses the shape lines of a label file (without the BBox_num header)
+    @staticmethod
+    def from_lines(lines):
+        kinds = []
+        counts = []
+        params = []
+        values = []
+        for line in lines:
+            split = line.split()
+            if not split:
+                continue
+            if split[0] not in SHAPE_KINDS:
+                raise RuntimeError("unknown shape: " + split[0])
+            kind = SHAPE_KINDS[split[0]]
+            kinds.append(kind)
+            if kind == KIND_POLY:
+                values.extend(split[1:])
+                counts.append((len(split) - 1) // 2)
+                params.append((0, 0, 0))
+            else:
+                values.extend(split[1:3])
+                counts.append(1)
+                params.append((split[3:] + ['0', '0'])[:3])
+        offsets = np.concatenate([[0], np.cumsum(np.array(counts, dtype=np.int64))])
+        points = np.rint(np.array(values, dtype=np.float64)).astype(np.int32).reshape(-1, 2)
+        params = np.array(params, dtype=np.float64).reshape(-1, 3)
+        return ShapeCollection(np.array(kinds, dtype=np.uint8), offsets, points, params)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # returns the vertices of shape i (the center for circles and rectangles) as a view into the shared array
+    def vertices(self, i):
+        return self.points[self.offsets[i]:self.offsets[i + 1]]
+
+    # materializes shape i as a Polygon, Circle or RotatedRect
+    def shape(self, i):
+        kind = self.kinds[i]
+        if kind == KIND_POLY:
+            shp = Polygon()
+            shp.points = self.vertices(i).copy()
+            shp.location = shp.get_center()
+        elif kind == KIND_CIRC:
+            shp = Circle()
+            shp.location = self.vertices(i)[0].tolist()
+            shp.radius = int(round(self.params[i, 0]))
+        else:
+            shp = RotatedRect()
+            shp.location = self.vertices(i)[0].tolist()
+            shp.width, shp.height = np.rint(self.params[i, :2]).astype(int).tolist()
+            shp.theta = float(self.params[i, 2])
+        shp.defined = True
+        return shp
+
+    def to_shapes(self):
+        return [self.shape(i) for i in range(len(self))]
+
+    # returns the (n, 2) centers: vertex centroid of polygons, center of circles and rectangles
+    def centers(self):
+        if not len(self):
+            return np.empty((0, 2), dtype=np.int64)
+        sums = np.add.reduceat(self.points.astype(np.int64), self.offsets[:-1], axis=0)
+        counts = np.diff(self.offsets)[:, None]
+        return (sums / counts).astype(np.int64)
+
+    # returns the (n, 4) bounding extents x0, y0, x1, y1 of all shapes
+    def extents(self):
+        if not len(self):
+            return np.empty((0, 4))
+        starts = self.offsets[:-1]
+        lo = np.minimum.reduceat(self.points, starts, axis=0).astype(np.float64)
+        hi = np.maximum.reduceat(self.points, starts, axis=0).astype(np.float64)
+        # circles and rectangles are stored as their center, widen it by the radius or the rotated half sides
+        t = np.radians(self.params[:, 2])
+        half_x = np.abs(self.params[:, 0] * np.cos(t)) / 2 + np.abs(self.params[:, 1] * np.sin(t)) / 2
+        half_y = np.abs(self.params[:, 0] * np.sin(t)) / 2 + np.abs(self.params[:, 1] * np.cos(t)) / 2
+        half = np.zeros((len(self), 2))
+        rects = self.kinds == KIND_RECT
+        half[rects] = np.stack([half_x, half_y], axis=1)[rects]
+        circles = self.kinds == KIND_CIRC
+        half[circles] = self.params[circles, :1]
+        return np.concatenate([lo - half, hi + half], axis=1)
+
+    def translate(self, i, dx, dy):
+        self.vertices(i)[:] += np.array([dx, dy], dtype=np.int32)
+
+    # returns a copy with the polygon outlines simplified to within tolerance, see simplify_mask
+    def simplified(self, tolerance):
+        if not len(self):
+            return self
+        keep = simplify_mask(self.points, self.offsets, tolerance)
+        counts = np.add.reduceat(keep.astype(np.int64), self.offsets[:-1])
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return ShapeCollection(self.kinds.copy(), offsets, self.points[keep], self.params.copy())
+
+    def scaled(self, factor):
+        params = self.params.copy()
+        # radius, width and height scale, the angle does not
+        params[:, :2] = np.rint(params[:, :2] * factor)
+        return ShapeCollection(self.kinds.copy(), self.offsets.copy(),
+                               np.rint(self.points * factor).astype(np.int32), params)
+
+    # returns the shape lines in the label file format
+    def to_lines(self):
+        coords = [str(c) for c in self.points.ravel().tolist()]
+        offsets = (2 * self.offsets).tolist()
+        params = self.params.tolist()
+        lines = []
+        for i, kind in enumerate(self.kinds.tolist()):
+            values = ' '.join(coords[offsets[i]:offsets[i + 1]])
+            if kind == KIND_POLY:
+                lines.append('POLY ' + values)
+            elif kind == KIND_CIRC:
+                lines.append('CIRC %s %d' % (values, round(params[i][0])))
+            else:
+                lines.append('RECT %s %d %d %.2f' % (values, round(params[i][0]), round(params[i][1]), params[i][2]))
+        return lines
+
+
+class LazyShapeList(object):
+
+    # the shapes of a ShapeCollection as a list that materializes each Shape on first access.
+    # supports the list operations the tool uses; inserted shapes are kept as they are
+    def __init__(self, collection):
+        self.collection = collection
+        # a Shape, or the index of its record in the collection until it is first accessed
+        self.items = list(range(len(collection)))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        item = self.items[i]
+        if not isinstance(item, Shape):
+            item = self.items[i] = self.collection.shape(item)
+        return item
+
+    def __iter__(self):
+        for i in range(len(self.items)):
+            yield self[i]
+
+    def append(self, shp):
+        self.items.append(shp)
+
+    def insert(self, i, shp):
+        self.items.insert(i, shp)
+
+    def pop(self, i=-1):
+        shp = self[i]
+        del self.items[i]
+        return shp
+
+
+# polygons with more vertices are fitted one at a time on their convex hull by fit_hull, the
+# batched fit projects every vertex onto every hull direction
+FIT_BATCH_VERTICES = 64
+# bound on the elements of the (polygons, directions, vertices) temporaries of a batched fit
+FIT_BUDGET = 1 << 20
+
+
+# returns the edge directions (p, k) in radians of the convex hulls of a padded (p, n, 2) batch.
+# gift wrapping runs for all polygons at once, every step moves each polygon to the point with the
+# smallest counter-clockwise turn; the directions of polygons that already closed their hull repeat
+def hull_directions(pts):
+    count, n = pts.shape[:2]
+    rows = np.arange(count)
+    # the lowest (then leftmost) point is always on the hull
+    ymin = pts[:, :, 1].min(axis=1)
+    start = np.argmin(np.where(pts[:, :, 1] == ymin[:, None], pts[:, :, 0], np.inf), axis=1)
+    start_pt = pts[rows, start]
+    cur = start_pt
+    prev = np.zeros(count)
+    done = np.zeros(count, dtype=bool)
+    directions = []
+    for _ in range(n + 1):
+        d = pts - cur[:, None, :]
+        ang = np.arctan2(d[:, :, 1], d[:, :, 0])
+        # the small offset keeps collinear points that round to a tiny negative turn in front
+        turn = (ang - prev[:, None] + 1e-9) % (2 * m.pi)
+        turn = np.where((d[:, :, 0] != 0) | (d[:, :, 1] != 0), turn, np.inf)
+        nxt = np.argmin(turn, axis=1)
+        valid = np.isfinite(turn[rows, nxt])
+        prev = np.where(valid, ang[rows, nxt], prev)
+        directions.append(prev)
+        cur = np.where(valid[:, None], pts[rows, nxt], cur)
+        done |= ~valid | (cur == start_pt).all(axis=1)
+        if done.all():
+            break
+    return np.stack(directions, axis=1)
+
+
+# fits the minimum area rectangle around each of the given (n_i, 2) point arrays.
+# returns a (p, 5) array of xc, yc, w, h, theta with theta the angle of the w side in degrees
+# in [0, 180). the polygons are padded into batches by repeating their first vertex and all
+# hull directions of a batch are evaluated at once, without per-polygon loops. batches hold
+# polygons of similar vertex count, as many as fit FIT_BUDGET, and large polygons go to fit_hull
+def fit_min_area_rects(polygons):
+    polygons = [np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in polygons]
+    result = np.zeros((len(polygons), 5))
+    if not polygons:
+        return result
+    counts = np.array([len(p) for p in polygons])
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    flat = np.concatenate(polygons)
+    order = np.argsort(counts, kind='stable')
+    batched = np.searchsorted(counts[order], FIT_BATCH_VERTICES, side='right')
+    first = 0
+    while first < batched:
+        # a batch of p polygons of up to n vertices has p * (n + 1) * n elements per temporary
+        sizes = counts[order[first:batched]]
+        cost = np.arange(1, len(sizes) + 1) * (sizes + 1) * sizes
+        batch = order[first:first + max(np.searchsorted(cost, FIT_BUDGET, side='right'), 1)]
+        first += len(batch)
+        n = counts[batch[-1]]
+        index = offsets[batch, None] + np.minimum(np.arange(n)[None, :], counts[batch, None] - 1)
+        pts = flat[index]
+        angles = hull_directions(pts) % m.pi
+        cos, sin = np.cos(angles)[:, :, None], np.sin(angles)[:, :, None]
+        # coordinates of every point along and across every candidate direction
+        u = pts[:, None, :, 0] * cos + pts[:, None, :, 1] * sin
+        v = -pts[:, None, :, 0] * sin + pts[:, None, :, 1] * cos
+        umin, umax = u.min(axis=2), u.max(axis=2)
+        vmin, vmax = v.min(axis=2), v.max(axis=2)
+        rows = np.arange(len(batch))
+        best = np.argmin((umax - umin) * (vmax - vmin), axis=1)
+        uc = (umax[rows, best] + umin[rows, best]) / 2
+        vc = (vmax[rows, best] + vmin[rows, best]) / 2
+        c, s = cos[rows, best, 0], sin[rows, best, 0]
+        result[batch, 0] = uc * c - vc * s
+        result[batch, 1] = uc * s + vc * c
+        result[batch, 2] = umax[rows, best] - umin[rows, best]
+        result[batch, 3] = vmax[rows, best] - vmin[rows, best]
+        result[batch, 4] = np.degrees(angles[rows, best]) % 180
+    for i in order[batched:]:
+        result[i] = fit_hull(convex_hull(polygons[i]))
+    return result
+
+
+# returns the convex hull of (n, 2) points as (k, 2) vertices in counter-clockwise order without
+# collinear ones, by monotone chain
+def convex_hull(points):
+    pts = np.unique(points, axis=0).tolist()
+    if len(pts) < 3:
+        return np.array(pts).reshape(-1, 2)
+    hull = []
+    for chain in (pts, pts[::-1]):
+        start = len(hull)
+        for p in chain:
+            while len(hull) >= start + 2 and ((hull[-1][0] - hull[-2][0]) * (p[1] - hull[-2][1]) -
+                                              (hull[-1][1] - hull[-2][1]) * (p[0] - hull[-2][0])) <= 0:
+                hull.pop()
+            hull.append(p)
+        hull.pop()
+    return np.array(hull)
+
+
+# fits the minimum area rectangle around a convex hull from convex_hull in O(k log k). the
+# extreme vertices along every edge direction are found by binary search in the edge angles,
+# which only grow around a counter-clockwise hull
+def fit_hull(hull):
+    if len(hull) < 3:
+        return fit_min_area_rects([hull])[0]
+    edges = np.roll(hull, -1, axis=0) - hull
+    angles = np.arctan2(edges[:, 1], edges[:, 0])
+    unwrapped = angles[0] + (angles - angles[0]) % (2 * m.pi)
+    theta = angles % m.pi
+    c, s = np.cos(theta), np.sin(theta)
+
+    # returns the hull vertices farthest along the directions theta + turn - pi / 2
+    def extreme(turn):
+        target = angles[0] + (theta + turn - angles[0]) % (2 * m.pi)
+        return hull[np.searchsorted(unwrapped, target) % len(hull)]
+
+    right, top, left, bottom = extreme(m.pi / 2), extreme(m.pi), extreme(3 * m.pi / 2), extreme(0)
+    umax, umin = right[:, 0] * c + right[:, 1] * s, left[:, 0] * c + left[:, 1] * s
+    vmax, vmin = top[:, 1] * c - top[:, 0] * s, bottom[:, 1] * c - bottom[:, 0] * s
+    best = np.argmin((umax - umin) * (vmax - vmin))
+    uc = (umax[best] + umin[best]) / 2
+    vc = (vmax[best] + vmin[best]) / 2
+    return (uc * c[best] - vc * s[best], uc * s[best] + vc * c[best], umax[best] - umin[best],
+            vmax[best] - vmin[best], np.degrees(theta[best]) % 180)
+
+
+# returns the minimum area rectangle around points as (xc, yc, w, h, theta), see fit_min_area_rects
+def min_area_rect(points):
+    return tuple(float(v) for v in fit_min_area_rects([points])[0])
+
+
+# returns the (4, 2) corners of the rectangle (xc, yc, w, h, theta)
+def rect_corners(xc, yc, w, h, theta):
+    t = np.radians(theta)
+    along = np.array([np.cos(t), np.sin(t)]) * w / 2
+    across = np.array([-np.sin(t), np.cos(t)]) * h / 2
+    center = np.array([xc, yc])
+    return np.array([center - along - across, center + along - across,
+                     center + along + across, center - along + across])
+
+
+# returns the position of the first maximum of each run of values, runs given by their start
+# positions bounds and the run number seg of every value
+def run_argmax(values, bounds, seg):
+    best = np.maximum.reduceat(values, bounds)
+    pos = np.flatnonzero(values == best[seg])
+    runs = seg[pos]
+    first = np.ones(len(pos), dtype=bool)
+    first[1:] = runs[1:] != runs[:-1]
+    return pos[first], best
+
+
+# returns a mask of the vertices kept when Douglas-Peucker simplifies the closed rings of a
+# (m, 2) points array delimited by offsets, dropping vertices closer than tolerance to the outline.
+# the segments of all rings are split level by level, each level in one pass over all of them.
+# every ring keeps at least three vertices
+def simplify_mask(points, offsets, tolerance):
+    offsets = np.asarray(offsets, dtype=np.int64)
+    keep = np.ones(len(points), dtype=bool)
+    rings = np.flatnonzero(np.diff(offsets) > 3)
+    if tolerance <= 0 or not len(rings):
+        return keep
+    # every ring followed by a copy of its first vertex, so that the closing edge is a segment too
+    counts = np.diff(offsets)[rings] + 1
+    ring = np.repeat(np.arange(len(rings)), counts)
+    ends = np.cumsum(counts) - 1
+    starts = ends - counts + 1
+    index = np.arange(len(ring)) - starts[ring] + offsets[rings][ring]
+    index[ends] = offsets[rings]
+    ext = points[index].astype(np.float64)
+    kept = np.zeros(len(ext), dtype=bool)
+    kept[starts] = True
+    # split every ring at the vertex farthest from its first one
+    d = ext - ext[starts][ring]
+    far, _ = run_argmax(np.hypot(d[:, 0], d[:, 1]), starts, ring)
+    kept[far] = True
+    seg_starts = np.concatenate([starts, far])
+    seg_ends = np.concatenate([far, ends])
+    # the first level splits unconditionally so that rings keep an area
+    threshold = -1.0
+    while len(seg_starts):
+        lengths = seg_ends - seg_starts - 1
+        inner = lengths > 0
+        seg_starts, seg_ends, lengths = seg_starts[inner], seg_ends[inner], lengths[inner]
+        if not len(seg_starts):
+            break
+        seg = np.repeat(np.arange(len(seg_starts)), lengths)
+        bounds = np.cumsum(lengths) - lengths
+        idx = np.arange(len(seg)) - bounds[seg] + seg_starts[seg] + 1
+        a = ext[seg_starts[seg]]
+        d = ext[seg_ends[seg]] - a
+        p = ext[idx] - a
+        norm = np.hypot(d[:, 0], d[:, 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dist = np.where(norm > 0, np.abs(d[:, 0] * p[:, 1] - d[:, 1] * p[:, 0]) / norm, np.hypot(p[:, 0], p[:, 1]))
+        first, best = run_argmax(dist, bounds, seg)
+        split = best > threshold
+        mid = idx[first[split]]
+        kept[mid] = True
+        seg_starts = np.concatenate([seg_starts[split], mid])
+        seg_ends = np.concatenate([mid, seg_ends[split]])
+        threshold = tolerance
+    # map the flags of the extended rings back, leaving out the closing copies
+    kept[ends] = False
+    closing = np.zeros(len(ext), dtype=bool)
+    closing[ends] = True
+    keep[index[~closing]] = kept[~closing]
+    return keep
+
+
+# returns the (n, 2) vertices of a closed polygon simplified with tolerance, see simplify_mask
+def simplify_polygon(points, tolerance):
+    return points[simplify_mask(points, [0, len(points)], tolerance)]
+
+
+# returns label file lines with the polygon outlines simplified with tolerance, see simplify_mask.
+# lines that lose no vertices are kept as they are
+def simplify_lines(lines, tolerance):
+    lines = [line for line in lines if line.strip()]
+    if tolerance <= 0 or not lines:
+        return lines
+    shapes = ShapeCollection.from_lines(lines)
+    simplified = shapes.simplified(tolerance)
+    changed = np.flatnonzero(np.diff(simplified.offsets) != np.diff(shapes.offsets))
+    if not len(changed):
+        return lines
+    new_lines = simplified.to_lines()
+    for i in changed.tolist():
+        lines[i] = new_lines[i]
+    return lines
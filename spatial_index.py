@@ -0,0 +1,136 @@
+import math as m
+
+# side length of a grid cell in canvas pixels
+CELL_SIZE = 64
+
+
+class SpatialGrid(object):
+
+    # uniform grid over shape centers and bounding extents.
+    # keys are the shapes' positions in the tool's shapeList
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.shapes = {}
+        self.centers = {}
+        self.extents = {}
+        self.center_cells = {}
+        self.extent_cells = {}
+
+    def cell(self, x, y):
+        return int(m.floor(x / self.cell_size)), int(m.floor(y / self.cell_size))
+
+    def cells_in(self, x0, y0, x1, y1):
+        cx0, cy0 = self.cell(x0, y0)
+        cx1, cy1 = self.cell(x1, y1)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                yield cx, cy
+
+    def insert(self, key, shp):
+        self.shapes[key] = shp
+        center = (shp.location[0], shp.location[1])
+        self.centers[key] = center
+        self.center_cells.setdefault(self.cell(*center), set()).add(key)
+        extents = shp.get_extents()
+        self.extents[key] = extents
+        for c in self.cells_in(*extents):
+            self.extent_cells.setdefault(c, set()).add(key)
+
+    def remove(self, key):
+        if key not in self.shapes:
+            return
+        del self.shapes[key]
+        c = self.cell(*self.centers.pop(key))
+        self.center_cells[c].discard(key)
+        if not self.center_cells[c]:
+            del self.center_cells[c]
+        for c in self.cells_in(*self.extents.pop(key)):
+            self.extent_cells[c].discard(key)
+            if not self.extent_cells[c]:
+                del self.extent_cells[c]
+
+    # re-indexes a shape after it was moved or edited
+    def update(self, key, shp):
+        self.remove(key)
+        self.insert(key, shp)
+
+    # inserts shp at key, moving the keys at or after it up by one like list.insert
+    def insert_at(self, key, shp):
+        self.shift(key, 1)
+        self.insert(key, shp)
+
+    # removes key, moving the keys after it down by one like list.pop
+    def pop_at(self, key):
+        self.remove(key)
+        self.shift(key + 1, -1)
+
+    # renumbers the keys from start on by delta without recomputing any extents
+    def shift(self, start, delta):
+        for key in sorted((k for k in self.shapes if k >= start), reverse=delta > 0):
+            new = key + delta
+            self.shapes[new] = self.shapes.pop(key)
+            center = self.centers.pop(key)
+            self.centers[new] = center
+            cell = self.center_cells[self.cell(*center)]
+            cell.discard(key)
+            cell.add(new)
+            extents = self.extents.pop(key)
+            self.extents[new] = extents
+            for c in self.cells_in(*extents):
+                cell = self.extent_cells[c]
+                cell.discard(key)
+                cell.add(new)
+
+    def clear(self):
+        self.shapes.clear()
+        self.centers.clear()
+        self.extents.clear()
+        self.center_cells.clear()
+        self.extent_cells.clear()
+
+    # replaces the whole index, keyed by position in shapes
+    def rebuild(self, shapes):
+        self.clear()
+        for i, shp in enumerate(shapes):
+            self.insert(i, shp)
+
+    # returns (key, dist) of the shape whose center is nearest to (x, y) within max_dist, or (-1, inf)
+    def nearest(self, x, y, max_dist):
+        closest_key = -1
+        closest_dist = m.inf
+        for c in self.cells_in(x - max_dist, y - max_dist, x + max_dist, y + max_dist):
+            for key in self.center_cells.get(c, ()):
+                cx, cy = self.centers[key]
+                dist = m.sqrt((cx - x) * (cx - x) + (cy - y) * (cy - y))
+                if dist < closest_dist or (dist == closest_dist and key < closest_key):
+                    closest_key = key
+                    closest_dist = dist
+        if closest_dist > max_dist:
+            return -1, m.inf
+        return closest_key, closest_dist
+
+    # returns the keys of all shapes whose bounding extents intersect the rectangle. a rectangle
+    # spanning more cells than are occupied, e.g. the whole image zoomed out, visits the occupied ones
+    def query_rect(self, x0, y0, x1, y1):
+        found = set()
+        cx0, cy0 = self.cell(x0, y0)
+        cx1, cy1 = self.cell(x1, y1)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.extent_cells):
+            cells = [c for c in self.extent_cells if cx0 <= c[0] <= cx1 and cy0 <= c[1] <= cy1]
+        else:
+            cells = self.cells_in(x0, y0, x1, y1)
+        for c in cells:
+            for key in self.extent_cells.get(c, ()):
+                ex0, ey0, ex1, ey1 = self.extents[key]
+                if ex0 <= x1 and x0 <= ex1 and ey0 <= y1 and y0 <= ey1:
+                    found.add(key)
+        return found
+
+    # returns the keys of all shapes that contain (x, y), sorted
+    def hit_test(self, x, y):
+        hits = []
+        for key in self.extent_cells.get(self.cell(x, y), ()):
+            ex0, ey0, ex1, ey1 = self.extents[key]
+            if ex0 <= x <= ex1 and ey0 <= y <= ey1 and self.shapes[key].contains(x, y):
+                hits.append(key)
+        return sorted(hits)
@@ -0,0 +1,69 @@
+import os
+
+import shape
+from history import History, Journal, format_op, inverse, parse_op
+
+BASE = '0\n'
+ONE = '1\nCIRC 10 20 5\n'
+TWO = '2\nCIRC 10 20 5\nCIRC 30 40 5\n'
+
+
+def journal_with_two_edits(tmp_path):
+    journal = Journal(str(tmp_path / 'journal'))
+    journal.append('img.txt', 'add 0 CIRC 10 20 5', BASE, ONE)
+    journal.append('img.txt', 'add 1 CIRC 30 40 5', ONE, TWO)
+    return journal
+
+
+def test_recover_returns_the_edits_missing_from_the_saved_labels(tmp_path):
+    journal = journal_with_two_edits(tmp_path)
+    assert journal.recover('img.txt', BASE) == ['add 0 CIRC 10 20 5', 'add 1 CIRC 30 40 5']
+    assert journal.recover('img.txt', ONE) == ['add 1 CIRC 30 40 5']
+    assert journal.recover('img.txt', TWO) == []
+
+
+def test_recover_discards_the_journal_of_labels_changed_elsewhere(tmp_path):
+    journal = journal_with_two_edits(tmp_path)
+    assert journal.recover('img.txt', '1\nRECT 1 2 3 4 0.00\n') == []
+    assert not os.path.exists(journal.path('img.txt'))
+
+
+def test_recover_drops_a_truncated_last_edit(tmp_path):
+    journal = journal_with_two_edits(tmp_path)
+    path = journal.path('img.txt')
+    with open(path, 'rb') as f:
+        data = f.read()
+    # the tool stopped halfway through writing the second edit
+    with open(path, 'wb') as f:
+        f.write(data[:-12])
+    assert journal.recover('img.txt', BASE) == ['add 0 CIRC 10 20 5']
+    # the next session appends after the last complete edit
+    journal = Journal(str(tmp_path / 'journal'))
+    journal.append('img.txt', 'add 1 CIRC 50 60 5', ONE, '2\nCIRC 10 20 5\nCIRC 50 60 5\n')
+    assert journal.recover('img.txt', BASE) == ['add 0 CIRC 10 20 5', 'add 1 CIRC 50 60 5']
+
+
+def test_checkpoint_removes_the_journal_once_the_last_edit_is_saved(tmp_path):
+    journal = journal_with_two_edits(tmp_path)
+    journal.checkpoint('img.txt', ONE)
+    assert os.path.exists(journal.path('img.txt'))
+    journal.checkpoint('img.txt', TWO)
+    assert not os.path.exists(journal.path('img.txt'))
+
+
+def test_format_op_round_trips_through_parse_op():
+    circle = shape.parse_shape('CIRC 10 20 5')
+    op = parse_op(format_op(('add', 3, circle)))
+    assert op[:2] == ('add', 3) and op[2].to_parsable() == circle.to_parsable()
+    assert parse_op(format_op(('move', 2, 4, -6))) == ('move', 2, 4, -6)
+    assert parse_op(format_op(('move', 2, 4, -6), 0.5), 2) == ('move', 2, 4, -6)
+
+
+def test_undo_returns_the_inverse_and_redo_the_edit():
+    history = History()
+    op = ('move', 0, 1, 2)
+    history.record(op)
+    assert history.undo() == inverse(op) == ('move', 0, -1, -2)
+    assert history.undo() is None
+    assert history.redo() == op
+    assert history.redo() is None
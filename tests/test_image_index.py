@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from image_index import FilenameIndex, label_key, legacy_label_key
+
+PATHS = ['/data/cat_001.jpg', '/data/cat_002.png', '/data/dog_001.jpg', '/data/sub/bird.v2.jpg', '/data/cat_001.png']
+
+
+@pytest.fixture
+def index():
+    return FilenameIndex(PATHS)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('#1', 0),
+    ('#5', 4),
+    ('#0', -1),
+    ('#6', -1),
+    ('cat_002.png', 1),
+    ('cat_001.png', 4),
+    ('cat_001', 0),
+    ('bird.v2', 3),
+    ('dog', 2),
+    ('cat_00', 0),
+    ('_002', 1),
+    ('g_0', 2),
+    ('at', 0),
+    ('v2.j', 3),
+    ('fish', -1),
+    ('', -1),
+])
+def test_lookup(index, query, expected):
+    assert index.lookup(query) == expected
+
+
+def test_lookup_matches_a_linear_scan():
+    paths = ['/d/img_%05d_%s.jpg' % (i, 'ab'[i % 2]) for i in range(500)]
+    index = FilenameIndex(paths)
+    names = [os.path.basename(p) for p in paths]
+    for query in ['img_00042', '_b.jpg', '0499', '77_a', 'zz', 'mg_0001']:
+        expected = next((i for i, name in enumerate(names) if name.startswith(query)), -1)
+        if expected == -1:
+            expected = next((i for i, name in enumerate(names) if query in name), -1)
+        assert index.lookup(query) == expected
+
+
+def test_label_keys_of_sub_directories_do_not_collide():
+    root = os.path.join('data', 'images')
+    keys = [label_key(root, os.path.join(root, *parts)) for parts in
+            [('0001.jpg',), ('a', '0001.jpg'), ('b', '0001.jpg'), ('a%2F0001.jpg',), ('img.v2.jpg',)]]
+    assert keys == ['0001', 'a%2F0001', 'b%2F0001', 'a%252F0001', 'img.v2']
+
+
+def test_legacy_label_keys_are_the_name_up_to_the_first_dot():
+    keys = [legacy_label_key(os.path.join('data', *parts)) for parts in [('0001.jpg',), ('a', '0001.jpg'), ('img.v2.jpg',)]]
+    assert keys == ['0001', '0001', 'img']
+
+
+def test_prefix_returns_the_first_match_in_list_order():
+    # img_10.jpg sorts first, img_12.jpg comes first in the list
+    index = FilenameIndex(['/data/img_9.jpg', '/data/img_12.jpg', '/data/img_10.jpg'])
+    assert index.lookup('img_1') == 1
+    assert index.lookup('img_') == 0
+    assert index.lookup('img_10.') == 2
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('sub/bird.v2.jpg', 3),
+    ('sub/bird.v2', 3),
+    ('sub/bi', 3),
+    ('ub/bir', 3),
+    ('cat/x', -1),
+    ('bird', 3),
+])
+def test_lookup_of_relative_paths(query, expected):
+    assert FilenameIndex(PATHS, root='/data').lookup(query) == expected
@@ -0,0 +1,62 @@
+import os
+import threading
+
+import label_index
+from label_index import LabelIndex, count_shapes
+
+TEXT = '3\nPOLY 1 2 3 4 5 6\nCIRC 1 2 3\nCIRC 4 5 6\n'
+
+
+def write_labels(directory, name, text):
+    with open(os.path.join(directory, name + '.txt'), 'w') as f:
+        f.write(text)
+
+
+def test_count_shapes():
+    assert count_shapes(TEXT) == {'POLY': 1, 'CIRC': 2}
+    assert count_shapes('0\n') == {}
+
+
+def test_refresh_reads_only_changed_files(tmp_path):
+    directory = str(tmp_path)
+    write_labels(directory, 'a', TEXT)
+    write_labels(directory, 'b', '1\nRECT 1 2 3 4 0.00\n')
+    index = LabelIndex(directory)
+    assert index.refresh(1) == 2
+    assert index.summary() == (2, {'RECT': 1, 'POLY': 1, 'CIRC': 2})
+    # a reopened index reads nothing until a file changes or disappears
+    index = LabelIndex(directory)
+    assert index.refresh(1) == 0
+    os.remove(os.path.join(directory, 'b.txt'))
+    assert index.refresh(1) == 0
+    assert not index.is_labeled('b')
+    assert index.summary_text(5).splitlines()[:2] == ['labeled: 1/5', 'shapes: 3']
+
+
+def test_refresh_keeps_an_update_made_while_it_reads(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    write_labels(directory, 'a', TEXT)
+    index = LabelIndex(directory)
+    summarize_file = label_index.summarize_file
+
+    # the tool saves new labels of 'a' while the refresh is parsing the old file
+    def summarize_and_save(task):
+        result = summarize_file(task)
+        index.update('a', '1\nCIRC 1 2 3\n')
+        return result
+
+    monkeypatch.setattr(label_index, 'summarize_file', summarize_and_save)
+    index.refresh(1)
+    assert index.entries['a']['shapes'] == {'CIRC': 1}
+
+
+def test_refresh_on_a_thread_reads_many_files_in_a_pool(tmp_path):
+    directory = str(tmp_path)
+    for i in range(label_index.PARALLEL_MIN):
+        write_labels(directory, 'img_%d' % i, TEXT)
+    index = LabelIndex(directory)
+    thread = threading.Thread(target=index.refresh, args=(2,))
+    thread.start()
+    thread.join()
+    assert index.summary() == (label_index.PARALLEL_MIN, {'RECT': 0, 'POLY': label_index.PARALLEL_MIN,
+                                                          'CIRC': 2 * label_index.PARALLEL_MIN})
@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from label_reader import LabelReader, build_index, split_shapes
+from label_store import STORE_NAME, LabelStore
+
+
+def write_labels(directory, name, text):
+    with open(os.path.join(directory, name + '.txt'), 'w') as f:
+        f.write(text)
+
+
+@pytest.fixture
+def label_dir(tmp_path):
+    for i in range(7):
+        write_labels(str(tmp_path), 'img_%03d' % i, '%d\n' % (i % 3) + 'POLY 0 0 %d 0 %d %d\n' % (i, i, i) * (i % 3))
+    write_labels(str(tmp_path), 'mixed', '2\nCIRC 10 20 5\nRECT 100 200 30 40 12.50\n')
+    return str(tmp_path)
+
+
+def test_empty_directory(tmp_path):
+    reader = LabelReader.open(str(tmp_path), jobs=1)
+    assert len(reader) == 0
+    assert list(reader) == []
+    assert reader.get('img') is None
+    assert list(reader.shard(0, 4)) == []
+
+
+def test_labels_of_an_image(label_dir):
+    reader = LabelReader.open(label_dir, jobs=1)
+    assert len(reader) == 8
+    labels = reader.get('img_005')
+    assert labels.kinds.tolist() == [0, 0]
+    assert labels.offsets.tolist() == [0, 3, 6]
+    assert split_shapes(labels)[1].tolist() == [[0, 0], [5, 0], [5, 5]]
+    assert reader.get('img_003').kinds.tolist() == []
+    mixed = reader.get('mixed')
+    assert mixed.kinds.tolist() == [1, 2]
+    assert mixed.points.tolist() == [[10, 20], [100, 200]]
+    np.testing.assert_allclose(mixed.params, [[5, 0, 0], [30, 40, 12.5]])
+
+
+@pytest.mark.parametrize('workers', [1, 3, 8, 11])
+def test_shards_cover_every_image_once(label_dir, workers):
+    reader = LabelReader.open(label_dir, jobs=1)
+    names = [labels.name for worker in range(workers) for labels in reader.shard(worker, workers)]
+    assert names == reader.names
+    ranges = [reader.shard_range(worker, workers) for worker in range(workers)]
+    assert max(len(r) for r in ranges) - min(len(r) for r in ranges) <= 1
+
+
+def test_open_rebuilds_after_the_labels_changed(label_dir):
+    reader = LabelReader.open(label_dir, jobs=1)
+    built = reader.built
+    assert LabelReader.open(label_dir, jobs=1).built == built
+    write_labels(label_dir, 'new', '1\nCIRC 1 2 3\n')
+    reader = LabelReader.open(label_dir, jobs=1)
+    assert reader.built != built
+    assert reader.get('new').points.tolist() == [[1, 2]]
+
+
+def test_index_of_a_label_store(tmp_path):
+    store = LabelStore(str(tmp_path / STORE_NAME))
+    store.put_text('a', '1\nPOLY 1 2 3 4 5 6\n')
+    store.put_text('b', '1\nCIRC 7 8 9\n')
+    store.close()
+    assert build_index(str(tmp_path)) == 2
+    reader = LabelReader.open(str(tmp_path))
+    assert reader.names == ['a', 'b']
+    assert reader.get('a').points.tolist() == [[1, 2], [3, 4], [5, 6]]
@@ -0,0 +1,41 @@
+import pytest
+
+import shape
+from label_store import LabelStore, format_records, parse_records
+
+TEXT = '3\nPOLY 10 20 1000000 40 50 -60\nCIRC 1234567 7 89\nRECT 100 200 30 40 12.5\n'
+
+
+def test_format_records_round_trips_text():
+    assert format_records(parse_records(TEXT)) == TEXT
+
+
+def test_format_records_keeps_large_and_fractional_values():
+    text = '2\nPOLY 1000000 2000000 3 4 5 6\nRECT 1000000 20 30 40 12.345678901\n'
+    records = parse_records(text)
+    assert format_records(records) == text
+    assert parse_records(format_records(records)) == records
+
+
+def test_parse_records_skips_header_and_blank_lines():
+    records = parse_records('1\n\nCIRC 1 2 3\n\n')
+    assert [(kind, list(coords)) for kind, coords in records] == [(1, [1, 2, 3])]
+
+
+def test_parse_records_rejects_unknown_shapes():
+    with pytest.raises(RuntimeError):
+        parse_records('1\nLINE 1 2 3 4\n')
+
+
+@pytest.mark.parametrize('line', ['POLY 10 20 30 40 50 60', 'CIRC 10 20 5', 'RECT 100 200 30 40 12.50'])
+def test_parse_shape_round_trips_to_parsable(line):
+    assert shape.parse_shape(line).to_parsable() == line
+
+
+def test_store_round_trips_text(tmp_path):
+    store = LabelStore(str(tmp_path / 'labels.db'))
+    store.put_text('a%2Fimg_001', TEXT)
+    assert store.get_text('a%2Fimg_001') == TEXT
+    assert 'a%2Fimg_001' in store
+    assert store.shape_counts() == {'a%2Fimg_001': {'POLY': 1, 'CIRC': 1, 'RECT': 1}}
+    store.close()
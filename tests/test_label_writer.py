@@ -0,0 +1,55 @@
+import os
+
+import label_writer
+from label_writer import LabelWriter, write_atomic
+
+
+def test_saves_of_one_file_are_coalesced(tmp_path):
+    writes = []
+    writer = LabelWriter(delay=60, write=lambda filename, text: writes.append((filename, text)))
+    for i in range(5):
+        writer.submit('a.txt', '%d\n' % i)
+    assert writer.get_pending('a.txt') == '4\n'
+    writer.close()
+    assert writes == [('a.txt', '4\n')]
+    assert writer.get_pending('a.txt') is None
+
+
+def test_failed_writes_are_retried(monkeypatch):
+    monkeypatch.setattr(label_writer, 'RETRY_DELAY', 0)
+    writes = []
+
+    def flaky(filename, text):
+        writes.append(text)
+        if len(writes) < 2:
+            raise OSError('disk full')
+
+    writer = LabelWriter(delay=0, write=flaky)
+    writer.submit('a.txt', 'x')
+    writer.close()
+    assert writes == ['x', 'x']
+    assert writer.failed == {}
+
+
+def test_a_write_that_keeps_failing_is_given_up_and_kept(monkeypatch):
+    monkeypatch.setattr(label_writer, 'RETRY_DELAY', 0)
+    writes = []
+
+    def broken(filename, text):
+        writes.append(text)
+        raise ValueError('bad labels')
+
+    writer = LabelWriter(delay=0, write=broken)
+    writer.submit('a.txt', 'x')
+    writer.close()
+    assert len(writes) == label_writer.WRITE_ATTEMPTS
+    assert list(writer.failed) == ['a.txt']
+    assert writer.get_pending('a.txt') == 'x'
+
+
+def test_write_atomic_leaves_no_temporary_file(tmp_path):
+    filename = str(tmp_path / 'a.txt')
+    write_atomic(filename, '1\nCIRC 1 2 3\n')
+    with open(filename) as f:
+        assert f.read() == '1\nCIRC 1 2 3\n'
+    assert os.listdir(str(tmp_path)) == ['a.txt']
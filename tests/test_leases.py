@@ -0,0 +1,78 @@
+import os
+import time
+
+from leases import LeaseManager, merge_labels
+
+BASE = '2\nPOLY 1 1 2 2 3 3\nCIRC 5 5 1\n'
+
+
+def lines(text):
+    return text.splitlines()[1:]
+
+
+def test_merge_keeps_both_sides_additions():
+    ours = BASE + 'CIRC 7 7 1\n'
+    theirs = BASE + 'RECT 1 2 3 4 0.00\n'
+    merged = merge_labels(BASE, ours, theirs)
+    assert merged.splitlines()[0] == '4'
+    assert sorted(lines(merged)) == sorted(lines(BASE) + ['CIRC 7 7 1', 'RECT 1 2 3 4 0.00'])
+
+
+def test_merge_applies_our_removals_to_theirs():
+    ours = '1\nPOLY 1 1 2 2 3 3\n'
+    theirs = BASE + 'CIRC 9 9 1\n'
+    assert lines(merge_labels(BASE, ours, theirs)) == ['POLY 1 1 2 2 3 3', 'CIRC 9 9 1']
+
+
+def test_merge_of_a_move_removes_the_old_and_adds_the_new_shape():
+    ours = '2\nPOLY 1 1 2 2 3 3\nCIRC 6 6 1\n'
+    assert lines(merge_labels(BASE, ours, BASE)) == ['POLY 1 1 2 2 3 3', 'CIRC 6 6 1']
+
+
+def test_merge_counts_duplicate_shapes():
+    base = '2\nCIRC 5 5 1\nCIRC 5 5 1\n'
+    ours = '1\nCIRC 5 5 1\n'
+    assert lines(merge_labels(base, ours, base)) == ['CIRC 5 5 1']
+
+
+def test_merge_without_base_adds_everything_of_ours():
+    assert lines(merge_labels(None, '1\nCIRC 1 1 1\n', '1\nCIRC 2 2 1\n')) == ['CIRC 2 2 1', 'CIRC 1 1 1']
+
+
+def test_a_lease_is_exclusive_until_it_expires(tmp_path):
+    a = LeaseManager(str(tmp_path), 'a', ttl=0.2)
+    b = LeaseManager(str(tmp_path), 'b', ttl=0.2)
+    assert a.acquire('img')
+    assert not b.acquire('img')
+    assert b.holder('img') == 'a'
+    time.sleep(0.3)
+    assert b.acquire('img')
+    assert not a.renew('img')
+    assert 'img' not in a.held
+
+
+def test_release_frees_the_lease(tmp_path):
+    a = LeaseManager(str(tmp_path), 'a')
+    b = LeaseManager(str(tmp_path), 'b')
+    assert a.acquire('img')
+    a.release('img')
+    assert b.acquire('img')
+    assert a.holder('img') == 'b'
+
+
+def test_an_unwritten_lock_file_counts_as_held(tmp_path):
+    open(os.path.join(str(tmp_path), 'img.lock'), 'w').close()
+    assert not LeaseManager(str(tmp_path), 'a').acquire('img')
+
+
+def test_a_takeover_that_lost_the_race_puts_the_lease_back(tmp_path):
+    a = LeaseManager(str(tmp_path), 'a')
+    b = LeaseManager(str(tmp_path), 'b')
+    stale = 'c\n0.0\n'
+    with open(a.path('img'), 'w') as f:
+        f.write(stale)
+    assert a.acquire('img')
+    # b saw the same expired lease and renames the fresh one away
+    assert not b.take_over(b.path('img'), stale)
+    assert b.holder('img') == 'a'
+    assert sorted(os.listdir(str(tmp_path))) == ['img.lock']
@@ -0,0 +1,138 @@
+import math as m
+
+import numpy as np
+import pytest
+
+import shape
+
+
+def rect_area(rect):
+    return rect[2] * rect[3]
+
+
+def brute_force_rect_area(points):
+    # the minimum area rectangle has a side on an edge of the hull, trying every pair of points covers them
+    best = m.inf
+    for i in range(len(points)):
+        for j in range(len(points)):
+            d = points[j] - points[i]
+            if i == j or not d.any():
+                continue
+            t = m.atan2(d[1], d[0])
+            u = points[:, 0] * m.cos(t) + points[:, 1] * m.sin(t)
+            v = -points[:, 0] * m.sin(t) + points[:, 1] * m.cos(t)
+            best = min(best, (u.max() - u.min()) * (v.max() - v.min()))
+    return best
+
+
+def test_min_area_rect_of_a_rotated_rectangle():
+    corners = shape.rect_corners(50, 60, 40, 10, 30)
+    xc, yc, w, h, theta = shape.min_area_rect(corners)
+    assert (xc, yc) == pytest.approx((50, 60))
+    assert sorted([w, h]) == pytest.approx([10, 40])
+    assert theta % 90 == pytest.approx(30)
+
+
+def test_min_area_rects_match_brute_force():
+    rng = np.random.default_rng(0)
+    polygons = [rng.random((rng.integers(3, 20), 2)) * 100 for _ in range(50)]
+    rects = shape.fit_min_area_rects(polygons)
+    for points, rect in zip(polygons, rects):
+        assert rect_area(rect) == pytest.approx(brute_force_rect_area(points))
+        # every point lies inside the rectangle
+        t = np.radians(rect[4])
+        rel = points - rect[:2]
+        u = rel[:, 0] * np.cos(t) + rel[:, 1] * np.sin(t)
+        v = -rel[:, 0] * np.sin(t) + rel[:, 1] * np.cos(t)
+        assert np.all(np.abs(u) <= rect[2] / 2 + 1e-6) and np.all(np.abs(v) <= rect[3] / 2 + 1e-6)
+
+
+def test_large_polygons_are_fitted_on_their_hull():
+    t = np.linspace(0, 2 * m.pi, 5000, endpoint=False)
+    circle = np.c_[np.cos(t), np.sin(t)] * 100 + 500
+    small = shape.rect_corners(0, 0, 4, 2, 0)
+    rects = shape.fit_min_area_rects([circle, small])
+    assert rects[0][:4] == pytest.approx([500, 500, 200, 200], abs=0.01)
+    assert rect_area(rects[1]) == pytest.approx(8)
+
+
+def test_degenerate_polygons():
+    rects = shape.fit_min_area_rects([[[3, 4]], [[0, 0], [10, 0]], [[1, 1], [2, 2], [3, 3]]])
+    assert rects[0][:4].tolist() == [3, 4, 0, 0]
+    assert rect_area(rects[1]) == 0 and max(rects[1][2:4]) == pytest.approx(10)
+    assert max(rects[2][2:4]) == pytest.approx(m.sqrt(8))
+
+
+def test_convex_hull_is_counter_clockwise_without_collinear_points():
+    points = np.array([[0, 0], [2, 0], [1, 0], [2, 2], [0, 2], [1, 1]], dtype=float)
+    hull = shape.convex_hull(points)
+    assert hull.tolist() == [[0, 0], [2, 0], [2, 2], [0, 2]]
+
+
+def test_empty_input():
+    assert shape.fit_min_area_rects([]).shape == (0, 5)
+
+
+def douglas_peucker(points, tolerance):
+    # recursive reference of simplify_mask for one ring: split at the vertex farthest from the first,
+    # both halves once unconditionally, then wherever a vertex is farther than tolerance
+    ext = np.vstack([points, points[:1]]).astype(np.float64)
+    kept = {0}
+
+    def split(a, b, threshold):
+        if b - a < 2:
+            return
+        d = ext[b] - ext[a]
+        p = ext[a + 1:b] - ext[a]
+        norm = np.hypot(d[0], d[1])
+        dist = np.abs(d[0] * p[:, 1] - d[1] * p[:, 0]) / norm if norm > 0 else np.hypot(p[:, 0], p[:, 1])
+        i = int(np.argmax(dist))
+        if dist[i] > threshold:
+            kept.add(a + 1 + i)
+            split(a, a + 1 + i, tolerance)
+            split(a + 1 + i, b, tolerance)
+
+    far = int(np.argmax(np.hypot(*(ext[:-1] - ext[0]).T)))
+    kept.add(far)
+    split(0, far, -1)
+    split(far, len(points), -1)
+    return points[sorted(kept)]
+
+
+def test_simplify_drops_collinear_vertices():
+    square = np.array([[0, 0], [5, 0], [10, 0], [10, 5], [10, 10], [5, 10], [0, 10], [0, 5]])
+    assert shape.simplify_polygon(square, 0.5).tolist() == [[0, 0], [10, 0], [10, 10], [0, 10]]
+
+
+def test_simplify_keeps_everything_without_tolerance():
+    points = np.array([[0, 0], [5, 0], [10, 0], [10, 10]])
+    assert shape.simplify_polygon(points, 0).tolist() == points.tolist()
+
+
+def test_simplify_keeps_three_vertices_of_a_flat_ring():
+    flat = np.array([[0, 0], [1, 0], [2, 0], [3, 0], [4, 0]])
+    assert len(shape.simplify_polygon(flat, 10)) == 3
+
+
+@pytest.mark.parametrize('tolerance', [0.5, 2, 8])
+def test_simplify_matches_recursive_douglas_peucker(tolerance):
+    rng = np.random.default_rng(1)
+    rings = []
+    for _ in range(20):
+        n = int(rng.integers(3, 200))
+        t = np.sort(rng.random(n)) * 2 * m.pi
+        r = 50 + rng.normal(0, 3, n)
+        rings.append(np.rint(np.c_[np.cos(t) * r, np.sin(t) * r]).astype(np.int32))
+    points = np.concatenate(rings)
+    offsets = np.concatenate([[0], np.cumsum([len(r) for r in rings])])
+    keep = shape.simplify_mask(points, offsets, tolerance)
+    for ring, first, last in zip(rings, offsets[:-1], offsets[1:]):
+        expected = douglas_peucker(ring, tolerance) if len(ring) > 3 else ring
+        assert points[first:last][keep[first:last]].tolist() == expected.tolist()
+
+
+def test_simplify_lines_simplifies_loaded_polygons_only():
+    lines = ['POLY 0 0 5 0 10 0 10 10 0 10', 'CIRC 7.5 7 1', '', 'POLY 0 0 4 0 4 4', 'RECT 1 2 3 4 0.00']
+    assert shape.simplify_lines(lines, 0.5) == ['POLY 0 0 10 0 10 10 0 10', 'CIRC 7.5 7 1',
+                                                'POLY 0 0 4 0 4 4', 'RECT 1 2 3 4 0.00']
+    assert shape.simplify_lines(lines, 0) == [line for line in lines if line]
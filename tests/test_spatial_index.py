@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+import shape
+from spatial_index import SpatialGrid
+
+
+def circle(x, y, r):
+    return shape.parse_shape('CIRC %d %d %d' % (x, y, r))
+
+
+@pytest.fixture
+def grid():
+    grid = SpatialGrid(cell_size=16)
+    grid.rebuild([circle(10, 10, 4), circle(100, 10, 4), circle(10, 100, 40)])
+    return grid
+
+
+def test_insert_at_and_pop_at_renumber_like_a_list(grid):
+    grid.insert_at(1, circle(50, 50, 4))
+    assert sorted(grid.shapes) == [0, 1, 2, 3]
+    assert grid.nearest(100, 10, 5)[0] == 2
+    assert grid.query_rect(45, 45, 55, 55) == {1}
+    grid.pop_at(0)
+    assert sorted(grid.shapes) == [0, 1, 2]
+    assert grid.nearest(50, 50, 5)[0] == 0
+    assert grid.hit_test(10, 120) == [2]
+    assert grid.query_rect(0, 0, 20, 20) == set()
+
+
+def test_query_rect_matches_a_linear_scan():
+    rng = random.Random(0)
+    shapes = [circle(rng.randint(-500, 500), rng.randint(-500, 500), rng.randint(1, 60)) for _ in range(200)]
+    grid = SpatialGrid(cell_size=32)
+    grid.rebuild(shapes)
+    # small rectangles visit their cells, large ones the occupied cells
+    for x0, y0, size in [(0, 0, 10), (-100, 50, 200), (-2000, -2000, 4000), (600, 600, 5000)]:
+        x1, y1 = x0 + size, y0 + size
+        expected = {i for i, (ex0, ey0, ex1, ey1) in enumerate(shp.get_extents() for shp in shapes)
+                    if ex0 <= x1 and x0 <= ex1 and ey0 <= y1 and y0 <= ey1}
+        assert grid.query_rect(x0, y0, x1, y1) == expected
+
+
+def test_hit_test_finds_shapes_whose_center_is_far(grid):
+    # (10, 130) is 30 away from the center of the large circle but inside it
+    assert grid.nearest(10, 130, 5) == (-1, float('inf'))
+    assert grid.hit_test(10, 130) == [2]
+    assert grid.hit_test(10, 141) == []
+    grid.insert(3, shape.parse_shape('POLY 0 90 60 90 60 110 0 110'))
+    assert grid.hit_test(10, 100) == [2, 3]
+    assert grid.hit_test(55, 95) == [3]
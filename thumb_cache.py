@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import os
+from multiprocessing import Pool, cpu_count
+
+from PIL import Image
+
+from image_cache import decode_image
+from image_index import ImageIndex, MANIFEST_NAME
+
+# name of the cache directory created inside an image directory
+CACHE_DIR_NAME = '.labeltool_cache'
+# side length of the tiles of a zoom pyramid, in pixels
+TILE_SIZE = 512
+# file written into a tile directory once its pyramid is complete, holding the number of levels
+TILES_DONE = 'levels'
+# largest image, in pixels, that is decoded without a DecompressionBombError. PIL's own limit of
+# about 179 megapixels is below the slide and satellite images the tile pyramid is meant for
+MAX_IMAGE_PIXELS = 1 << 30
+
+
+# returns the default cache directory for the given image directory
+def default_cache_dir(image_dir):
+    return os.path.join(image_dir, CACHE_DIR_NAME)
+
+
+# returns the cache file holding the copy of path downscaled by scale.
+# the key covers path, modification time and size so edited originals are never served stale
+def cache_path(cache_dir, path, scale):
+    st = os.stat(path)
+    key = '{0}|{1}|{2}|{3}'.format(os.path.abspath(path), st.st_mtime_ns, st.st_size, scale)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, digest[:2], digest + cache_ext(path))
+
+
+# jpeg originals are cached as jpeg, everything else losslessly as png
+def cache_ext(path):
+    return '.jpg' if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg') else '.png'
+
+
+# returns the cached copy of path at the given scale or None if there is no valid one
+def load_cached(cache_dir, path, scale):
+    try:
+        img = Image.open(cache_path(cache_dir, path, scale))
+        img.load()
+        return img
+    except (OSError, ValueError):
+        return None
+
+
+# returns the cached copy of path with the least resolution of at least scale, or None. looks at the
+# levels of a pyramid built for base_scale, see pyramid_scales, so a viewer that shows large images
+# at less than base_scale still finds the copies cached for it
+def load_nearest(cache_dir, path, base_scale, scale):
+    scales = []
+    level_scale = base_scale
+    while level_scale >= scale:
+        scales.append(level_scale)
+        level_scale /= 2
+    for level_scale in reversed(scales):
+        img = load_cached(cache_dir, path, level_scale)
+        if img is not None:
+            return img
+    return None
+
+
+# returns the copy of path shown in a view of max_size at no more than base_scale, resized from the
+# nearest cached copy if there is one. the size of the original is kept in its info as 'original_size'
+def overview(cache_dir, path, base_scale, max_size):
+    with Image.open(path) as img:
+        width, height = img.size
+    scale = min(base_scale, max_size[0] / width, max_size[1] / height)
+    size = (max(int(width * scale), 1), max(int(height * scale), 1))
+    img = load_nearest(cache_dir, path, base_scale, scale) if cache_dir else None
+    if img is None:
+        img = decode_image(path, scale)
+    elif img.size != size:
+        img = img.resize(size, Image.LANCZOS)
+    img.info['original_size'] = (width, height)
+    return img
+
+
+# overview for a worker process, which decodes images too large for the GUI up to max_pixels
+def load_overview(cache_dir, path, base_scale, max_size, max_pixels=MAX_IMAGE_PIXELS):
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    return overview(cache_dir, path, base_scale, max_size)
+
+
+# returns the scales of a pyramid with the given number of levels, each half the previous one
+def pyramid_scales(scale, levels=1):
+    return [scale / (2 ** level) for level in range(levels)]
+
+
+# writes img to filename via a temporary file so readers never see a partial image
+def save_atomic(img, filename):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    root, ext = os.path.splitext(filename)
+    tmp = '{0}.{1}.tmp{2}'.format(root, os.getpid(), ext)
+    if ext == '.jpg':
+        img.convert('RGB').save(tmp, quality=95)
+    else:
+        img.save(tmp)
+    os.replace(tmp, filename)
+
+
+# returns the directory holding the zoom pyramid tiles of path
+def tile_dir(cache_dir, path):
+    return os.path.splitext(cache_path(cache_dir, path, 'tiles'))[0]
+
+
+# returns the tile file at column tx and row ty of a pyramid level, level l being scaled by 1 / 2 ** l
+def tile_path(directory, level, tx, ty, ext):
+    return os.path.join(directory, '{0}_{1}_{2}{3}'.format(level, tx, ty, ext))
+
+
+# returns the number of levels of the complete pyramid in directory, or 0 if there is none yet
+def tile_levels(directory):
+    try:
+        with open(os.path.join(directory, TILES_DONE)) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+
+# returns a pyramid tile or None if it is not cached
+def load_tile(directory, level, tx, ty, ext):
+    try:
+        img = Image.open(tile_path(directory, level, tx, ty, ext))
+        img.load()
+        return img
+    except (OSError, ValueError):
+        return None
+
+
+# cuts path into a pyramid of tile_size tiles, from full resolution down to the first level at or
+# below min_scale or fitting into a single tile, so that a viewport only ever reads the tiles it shows.
+# meant to run in a worker process, which takes the memory of the full resolution level instead of
+# the GUI. jpeg levels are each decoded at reduced size through draft, other formats are halved from
+# the level above. returns the number of tiles written
+def build_tiles(cache_dir, path, tile_size=TILE_SIZE, min_scale=0.0, max_pixels=MAX_IMAGE_PIXELS):
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    directory = tile_dir(cache_dir, path)
+    if tile_levels(directory):
+        return 0
+    ext = cache_ext(path)
+    with Image.open(path) as img:
+        jpeg = img.format == 'JPEG'
+    img = None
+    level = 0
+    written = 0
+    while True:
+        if img is None or jpeg:
+            img = decode_image(path, 0.5 ** level)
+        else:
+            img = img.resize((max(img.width // 2, 1), max(img.height // 2, 1)), Image.BOX)
+        width, height = img.size
+        for ty in range((height + tile_size - 1) // tile_size):
+            for tx in range((width + tile_size - 1) // tile_size):
+                box = (tx * tile_size, ty * tile_size, min((tx + 1) * tile_size, width), min((ty + 1) * tile_size, height))
+                save_atomic(img.crop(box), tile_path(directory, level, tx, ty, ext))
+                written += 1
+        level += 1
+        if max(width, height) <= tile_size or 0.5 ** level <= min_scale:
+            break
+    with open(os.path.join(directory, TILES_DONE), 'w') as f:
+        f.write('%d' % level)
+    return written
+
+
+# builds all missing pyramid levels of one image, returns the number of files written
+def build_entry(args):
+    cache_dir, path, scale, levels, tiles = args
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    written = 0
+    img = None
+    try:
+        if tiles:
+            written += build_tiles(cache_dir, path)
+        for level_scale in pyramid_scales(scale, levels):
+            filename = cache_path(cache_dir, path, level_scale)
+            if os.path.exists(filename):
+                img = None
+                continue
+            if img is None:
+                img = decode_image(path, level_scale)
+            else:
+                width, height = img.size
+                img = img.resize((max(width // 2, 1), max(height // 2, 1)), Image.LANCZOS)
+            save_atomic(img, filename)
+            written += 1
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print('skipping {0}: {1}'.format(path, e))
+    return written
+
+
+# fills the cache of image_dir using a process pool across all cores
+def build_cache(image_dir, cache_dir=None, scale=0.5, levels=1, jobs=None, tiles=False):
+    cache_dir = cache_dir or default_cache_dir(image_dir)
+    paths = ImageIndex(image_dir, manifest_path=os.path.join(cache_dir, MANIFEST_NAME)).scan()
+    tasks = [(cache_dir, path, scale, levels, tiles) for path in paths]
+    written = 0
+    with Pool(jobs or cpu_count()) as pool:
+        for i, n in enumerate(pool.imap_unordered(build_entry, tasks, chunksize=16)):
+            written += n
+            if (i + 1) % 1000 == 0:
+                print('%d/%d images cached' % (i + 1, len(tasks)))
+    print('%d images in %s, %d cache files written to %s' % (len(paths), image_dir, written, cache_dir))
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='pre-scale the images of a directory for the label tool')
+    parser.add_argument('image_dir')
+    parser.add_argument('--cache-dir', default=None, help='defaults to <image_dir>/' + CACHE_DIR_NAME)
+    parser.add_argument('--scale', type=float, default=0.5, help='display scale of the first pyramid level')
+    parser.add_argument('--levels', type=int, default=1, help='number of pyramid levels, each half the previous')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, defaults to all cores')
+    parser.add_argument('--tiles', action='store_true', help='also cut every image into a zoom pyramid of tiles')
+    args = parser.parse_args(argv)
+    build_cache(args.image_dir, args.cache_dir, args.scale, args.levels, args.jobs, args.tiles)
+
+
+if __name__ == '__main__':
+    main()
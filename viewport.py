@@ -0,0 +1,192 @@
+import math as m
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+import thumb_cache
+
+# largest canvas in pixels, bigger images are shown zoomed out to fit
+VIEW_SIZE = 1280, 960
+# zoom limits, zoom being canvas pixels per display pixel
+MIN_ZOOM = 1 / 64
+MAX_ZOOM = 16
+# zoom factor of one mouse wheel step
+ZOOM_STEP = 1.25
+# memory budget for decoded pyramid tiles, in bytes
+TILE_CACHE_BYTES = 128 * 1024 * 1024
+
+
+class Viewport(object):
+
+    # maps world coordinates, i.e. the tool's display coordinates, to canvas pixels:
+    # canvas = (world - origin) * zoom
+    def __init__(self, width=VIEW_SIZE[0], height=VIEW_SIZE[1]):
+        self.width = width
+        self.height = height
+        self.world_width = width
+        self.world_height = height
+        self.zoom = 1.0
+        self.x0 = 0.0
+        self.y0 = 0.0
+
+    # shows a new world of the given size, zoomed out until it fits into max_width x max_height,
+    # and shrinks the view to the zoomed world
+    def reset(self, world_width, world_height, max_width=VIEW_SIZE[0], max_height=VIEW_SIZE[1]):
+        self.world_width = world_width
+        self.world_height = world_height
+        self.zoom = self.fit_zoom(max_width, max_height)
+        self.width = max(int(round(world_width * self.zoom)), 1)
+        self.height = max(int(round(world_height * self.zoom)), 1)
+        self.x0 = 0.0
+        self.y0 = 0.0
+
+    def fit_zoom(self, width=None, height=None):
+        width = width or self.width
+        height = height or self.height
+        return min(1.0, width / max(self.world_width, 1), height / max(self.world_height, 1))
+
+    # the key of the current transform, shapes drawn under another key must be redrawn
+    def key(self):
+        return self.zoom, self.x0, self.y0
+
+    def is_identity(self):
+        return self.zoom == 1 and self.x0 == 0 and self.y0 == 0
+
+    def to_canvas(self, x, y):
+        return (x - self.x0) * self.zoom, (y - self.y0) * self.zoom
+
+    def to_world(self, x, y):
+        return x / self.zoom + self.x0, y / self.zoom + self.y0
+
+    # transforms a flat [x0, y0, x1, y1, ...] coordinate list to canvas pixels
+    def transform(self, coords):
+        if self.is_identity():
+            return coords
+        z = self.zoom
+        return [(c - self.x0) * z if i % 2 == 0 else (c - self.y0) * z for i, c in enumerate(coords)]
+
+    # returns the visible rectangle (x0, y0, x1, y1) in world coordinates
+    def visible_rect(self):
+        return self.x0, self.y0, self.x0 + self.width / self.zoom, self.y0 + self.height / self.zoom
+
+    def intersects(self, extents):
+        x0, y0, x1, y1 = self.visible_rect()
+        return extents[0] <= x1 and x0 <= extents[2] and extents[1] <= y1 and y0 <= extents[3]
+
+    # zooms by factor keeping the world point under canvas pixel (x, y) in place
+    def zoom_at(self, factor, x, y):
+        wx, wy = self.to_world(x, y)
+        self.zoom = min(max(self.zoom * factor, min(MIN_ZOOM, self.fit_zoom())), MAX_ZOOM)
+        self.x0 = wx - x / self.zoom
+        self.y0 = wy - y / self.zoom
+        self.clamp()
+
+    def fit(self):
+        self.zoom = self.fit_zoom()
+        self.x0 = 0.0
+        self.y0 = 0.0
+        self.clamp()
+
+    # moves the view by dx, dy canvas pixels
+    def pan(self, dx, dy):
+        self.x0 -= dx / self.zoom
+        self.y0 -= dy / self.zoom
+        self.clamp()
+
+    # keeps the view over the world, a world smaller than the view stays at the top left
+    def clamp(self):
+        span_x = self.width / self.zoom
+        span_y = self.height / self.zoom
+        self.x0 = 0.0 if span_x >= self.world_width else min(max(self.x0, 0.0), self.world_width - span_x)
+        self.y0 = 0.0 if span_y >= self.world_height else min(max(self.y0, 0.0), self.world_height - span_y)
+
+
+class TiledImage(object):
+
+    # the pixels of one image for a viewport. a screen sized overview is kept in memory and used
+    # while it has enough resolution, zooming in further reads only the visible tiles of a pyramid
+    # that thumb_cache cuts on first use. pool builds the pyramid, a process pool so the full
+    # resolution decode never lands in the GUI process, tiles is an ImageCache shared between images.
+    # overview comes from thumb_cache.overview, which records the size of the original
+    def __init__(self, path, overview, cache_dir, tiles, pool, tile_size=thumb_cache.TILE_SIZE):
+        self.path = path
+        self.overview = overview
+        self.size = overview.info['original_size']
+        self.overview_scale = overview.size[0] / self.size[0]
+        self.tiles = tiles
+        self.pool = pool
+        self.tile_size = tile_size
+        self.cache_dir = cache_dir
+        self.directory = thumb_cache.tile_dir(cache_dir, path) if cache_dir else None
+        self.ext = thumb_cache.cache_ext(path)
+        self.levels = thumb_cache.tile_levels(self.directory) if self.directory else 0
+        self.future = None
+        # why the pyramid could not be built, the overview is shown at every zoom then
+        self.error = None
+
+    # starts building the pyramid in the background, returns True if a build was started
+    def request_tiles(self):
+        if self.levels or self.future is not None or self.directory is None or self.error is not None:
+            return False
+        try:
+            self.future = self.pool.submit(thumb_cache.build_tiles, self.cache_dir, self.path, self.tile_size,
+                                           self.overview_scale)
+        except (BrokenProcessPool, RuntimeError) as e:
+            self.error = e
+            return False
+        return True
+
+    # checks a background build, returns True once it has finished
+    def poll_tiles(self):
+        if self.future is None or not self.future.done():
+            return False
+        try:
+            self.future.result()
+            self.levels = thumb_cache.tile_levels(self.directory)
+        except (OSError, Image.DecompressionBombError, BrokenProcessPool) as e:
+            self.error = e
+            print('could not build tiles of {0}: {1}'.format(self.path, e))
+        return True
+
+    def get_tile(self, level, tx, ty):
+        key = (self.path, level, tx, ty)
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = thumb_cache.load_tile(self.directory, level, tx, ty, self.ext)
+            if tile is not None:
+                self.tiles.put(key, tile)
+        return tile
+
+    # returns the region box (x0, y0, x1, y1) of the original image resampled to out_size.
+    # falls back to the overview, and asks for the pyramid, if the tiles are not there yet
+    def render(self, box, out_size):
+        scale = out_size[0] / max(box[2] - box[0], 1e-9)
+        if scale > self.overview_scale * 1.01:
+            img = self.render_tiles(box, out_size, scale)
+            if img is not None:
+                return img
+            self.request_tiles()
+        s = self.overview_scale
+        if out_size == self.overview.size and box == (0, 0) + self.size:
+            return self.overview
+        return self.overview.resize(out_size, Image.BILINEAR, box=tuple(c * s for c in box))
+
+    def render_tiles(self, box, out_size, scale):
+        if not self.levels:
+            return None
+        # the coarsest level that still has at least the output resolution
+        level = min(max(int(m.floor(m.log2(1 / scale))), 0), self.levels - 1)
+        ls = 0.5 ** level
+        ts = self.tile_size
+        lx0, ly0, lx1, ly1 = [c * ls for c in box]
+        tx0, ty0 = int(lx0 // ts), int(ly0 // ts)
+        tx1, ty1 = int(m.ceil(lx1 / ts)), int(m.ceil(ly1 / ts))
+        mosaic = Image.new(self.overview.mode, ((tx1 - tx0) * ts, (ty1 - ty0) * ts))
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                tile = self.get_tile(level, tx, ty)
+                if tile is None:
+                    return None
+                mosaic.paste(tile, ((tx - tx0) * ts, (ty - ty0) * ts))
+        ox, oy = tx0 * ts, ty0 * ts
+        return mosaic.resize(out_size, Image.BILINEAR, box=(lx0 - ox, ly0 - oy, lx1 - ox, ly1 - oy))